@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Usuario, Sucursal, Libro, Ejemplar, Prestamo
+from .models import Usuario, Sucursal, Libro, Ejemplar, Prestamo, MovimientoMulta
 
 
 @admin.register(Usuario)
@@ -15,6 +15,7 @@ class UsuarioAdmin(UserAdmin):
             'fields': ('rol', 'telefono', 'multas_pendientes', 'suspendido')
         }),
     )
+    readonly_fields = ('multas_pendientes',) #solo cambia con movimientos de multa
 
 
 @admin.register(Sucursal)
@@ -49,3 +50,20 @@ class PrestamoAdmin(admin.ModelAdmin):
     list_filter = ('estado', 'fecha_prestamo')
     search_fields = ('usuario__username', 'ejemplar__libro__titulo')
     readonly_fields = ('fecha_prestamo', 'fecha_devolucion_esperada')
+
+
+@admin.register(MovimientoMulta)
+class MovimientoMultaAdmin(admin.ModelAdmin):
+    """Admin de solo lectura para el libro mayor de multas"""
+    list_display = ('usuario', 'tipo', 'monto', 'saldo_resultante', 'referencia', 'creado_en')
+    list_filter = ('tipo', 'creado_en')
+    search_fields = ('usuario__username', 'referencia')
+
+    def has_add_permission(self, request):
+        return False #los movimientos se registran desde la API para mantener el saldo
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,361 @@
+# ANALÍTICA SOBRE EL HISTORIAL DE PRÉSTAMOS
+#
+# El comando snapshot_prestamos vuelca los préstamos a columnas NumPy (.npy) que se leen con memmap,
+# así las consultas agrupadas recorren arreglos compactos en lugar de instancias del ORM.
+#
+# Estructura del directorio ANALITICA_DIR:
+#   meta.json         -> versión vigente, último id volcado, filas, fecha de generación y segmentos
+#   s<N>-v<V>/<col>.npy -> segmento N escrito en la versión V: hasta ANALITICA_SEGMENTO_FILAS filas ordenadas
+#                        por id de préstamo, una columna por archivo
+#
+# Una actualización no copia el historial: los préstamos nuevos completan el último segmento o abren otros,
+# y solo se reescriben los segmentos que todavía tienen préstamos abiertos (activos o vencidos), que son los
+# recientes. Los segmentos escritos se publican al final cambiando meta.json de forma atómica, por lo que una
+# consulta en curso nunca ve un snapshot a medio escribir.
+
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Libro, Ejemplar, Prestamo, Sucursal
+
+COLUMNAS = { #nombre de la columna -> tipo NumPy
+    'id': np.int64,
+    'usuario': np.int32,
+    'ejemplar': np.int32,
+    'libro': np.int32,
+    'sucursal': np.int32,
+    'genero': np.int8, #posición en GENEROS
+    'estado': np.int8, #posición en ESTADOS
+    'fecha_prestamo': np.int64, #segundos desde 1970 (UTC)
+    'fecha_devolucion_esperada': np.int64,
+    'fecha_devolucion_real': np.int64, #SIN_FECHA si no se devolvió
+    'multa': np.float64,
+}
+CAMPOS = [ #mismos datos que COLUMNAS, en el mismo orden, leídos con values_list
+    'id', 'usuario_id', 'ejemplar_id', 'ejemplar__libro_id', 'ejemplar__sucursal_id',
+    'ejemplar__libro__genero', 'estado', 'fecha_prestamo', 'fecha_devolucion_esperada',
+    'fecha_devolucion_real', 'multa'
+]
+DESCONOCIDO = 'desconocido' #valor guardado fuera de las opciones del modelo (datos anteriores a un cambio de choices)
+GENEROS = [codigo for codigo, _ in Libro.GENEROS] + [DESCONOCIDO]
+ESTADOS = [codigo for codigo, _ in Prestamo.ESTADOS] + [DESCONOCIDO]
+DEVUELTO = ESTADOS.index('devuelto')
+SIN_FECHA = -1
+DIA = 86400
+MAXIMO_DIAS = 366 #rango máximo de la curva de utilización
+
+
+def _directorio(directorio=None):
+    return Path(directorio or settings.ANALITICA_DIR)
+
+
+def _leer_meta(base):
+    try:
+        with open(base / 'meta.json', encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
+
+
+def _segmentos(meta):
+    """Segmentos de meta.json; el formato anterior (una carpeta v<N> con todo) es un único segmento"""
+    if 'segmentos' in meta:
+        return [dict(segmento) for segmento in meta['segmentos']]
+    if meta['version']:
+        return [{'numero': 1, 'nombre': f"v{meta['version']}", 'filas': meta['filas'], 'abiertos': None}] #None: revisar
+    return []
+
+
+def _segundos(fecha):
+    return int(fecha.timestamp()) if fecha else SIN_FECHA
+
+
+def _codigos(opciones):
+    """Convierte un valor en su posición en opciones; uno desconocido no detiene el volcado"""
+    posiciones = {valor: posicion for posicion, valor in enumerate(opciones)}
+    return lambda valor: posiciones.get(valor, posiciones[DESCONOCIDO])
+
+
+def _a_columnas(filas):
+    """Convierte filas de values_list (en el orden de CAMPOS) en un arreglo por columna"""
+    datos = list(zip(*filas))
+    convertidores = [
+        None, None, None, None, None,
+        _codigos(GENEROS), _codigos(ESTADOS), _segundos, _segundos, _segundos, float
+    ]
+    columnas = {}
+    for nombre, valores, convertir in zip(COLUMNAS, datos, convertidores):
+        if convertir:
+            valores = [convertir(valor) for valor in valores]
+        columnas[nombre] = np.array(valores, dtype=COLUMNAS[nombre])
+    return columnas
+
+
+class Snapshot:
+    """Columnas de una versión del snapshot abiertas en modo memmap (solo lectura)"""
+
+    def __init__(self, base, meta):
+        self.meta = meta
+        self.base = base
+        self.segmentos = _segmentos(meta)
+        self._columnas = {}
+
+    def __len__(self):
+        return self.meta['filas']
+
+    def __getitem__(self, nombre):
+        if nombre not in self._columnas:
+            partes = [np.load(self.base / segmento['nombre'] / f'{nombre}.npy', mmap_mode='r') for segmento in self.segmentos]
+            if len(partes) == 1:
+                self._columnas[nombre] = partes[0]
+            else: #con varios segmentos la columna se une en memoria, una vez por consulta
+                self._columnas[nombre] = np.concatenate(partes) if partes else np.empty(0, dtype=COLUMNAS[nombre])
+        return self._columnas[nombre]
+
+    def descripcion(self):
+        return {
+            'generado_en': self.meta['generado_en'],
+            'filas': self.meta['filas'],
+            'ultimo_id': self.meta['ultimo_id'],
+            'segmentos': len(self.segmentos),
+        }
+
+
+def cargar_snapshot(directorio=None):
+    """Devuelve el snapshot vigente o None si todavía no se generó"""
+    base = _directorio(directorio)
+    meta = _leer_meta(base)
+    return Snapshot(base, meta) if meta else None
+
+
+def actualizar_snapshot(directorio=None, lote=10000, filas_por_segmento=None):
+    """
+    Agrega los préstamos creados desde el último snapshot y vuelve a leer los que seguían abiertos
+    (activos o vencidos), que son los únicos que pueden haber cambiado de estado, fecha o multa.
+    Solo se escriben los segmentos que cambian: el costo depende de lo reciente, no del historial.
+    """
+    capacidad = filas_por_segmento or settings.ANALITICA_SEGMENTO_FILAS
+    base = _directorio(directorio)
+    base.mkdir(parents=True, exist_ok=True)
+    meta = _leer_meta(base) or {'version': 0, 'ultimo_id': 0, 'filas': 0}
+    version = meta['version'] + 1
+    segmentos = _segmentos(meta)
+    partes = {} #posición en segmentos -> columnas que forman su versión nueva
+
+    # 1. Releer los préstamos que seguían abiertos, solo en los segmentos que tienen alguno
+    actualizados = 0
+    for posicion, segmento in enumerate(segmentos):
+        if segmento['abiertos'] != 0:
+            columnas = _leer_segmento(base, segmento)
+            actualizados += _releer_abiertos(columnas)
+            partes[posicion] = [columnas]
+
+    # 2. Agregar los préstamos nuevos por lotes: completan el último segmento y abren otros
+    # Tope fijo para que los préstamos creados durante el volcado queden para la próxima vez
+    tope = Prestamo.objects.aggregate(tope=Max('id'))['tope'] or 0
+    nuevos = Prestamo.objects.filter(id__gt=meta['ultimo_id'], id__lte=tope).order_by('id')
+    agregados = 0
+    filas = []
+    for fila in nuevos.values_list(*CAMPOS).iterator(chunk_size=lote):
+        filas.append(fila)
+        if len(filas) == lote:
+            agregados += _agregar(base, segmentos, partes, filas, capacidad)
+            filas = []
+    if filas:
+        agregados += _agregar(base, segmentos, partes, filas, capacidad)
+
+    # 3. Escribir las versiones nuevas de los segmentos que cambiaron
+    for posicion, columnas in partes.items():
+        columnas = {nombre: np.concatenate([parte[nombre] for parte in columnas]) for nombre in COLUMNAS}
+        nombre = f"s{segmentos[posicion]['numero']}-v{version}"
+        destino = base / nombre
+        if destino.exists(): #restos de una actualización interrumpida
+            shutil.rmtree(destino)
+        destino.mkdir()
+        for columna, valores in columnas.items():
+            np.save(destino / f'{columna}.npy', valores)
+        segmentos[posicion] = {
+            'numero': segmentos[posicion]['numero'],
+            'nombre': nombre,
+            'filas': len(columnas['id']),
+            'abiertos': int(np.count_nonzero(columnas['estado'] != DEVUELTO)),
+        }
+
+    # 4. Publicar la versión nueva y borrar los segmentos reemplazados
+    meta = {
+        'version': version,
+        'ultimo_id': tope or meta['ultimo_id'],
+        'filas': sum(segmento['filas'] for segmento in segmentos),
+        'generado_en': timezone.now().isoformat(),
+        'segmentos': segmentos,
+    }
+    temporal = base / 'meta.json.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(meta, archivo)
+    os.replace(temporal, base / 'meta.json')
+    vigentes = {segmento['nombre'] for segmento in segmentos}
+    for carpeta in base.iterdir():
+        if carpeta.is_dir() and carpeta.name not in vigentes:
+            shutil.rmtree(carpeta, ignore_errors=True) #quien la tenga abierta en memmap puede seguir leyéndola
+
+    return {
+        'nuevos': agregados, 'actualizados': actualizados, 'total': meta['filas'],
+        'segmentos_escritos': len(partes), 'segmentos': len(segmentos),
+    }
+
+
+def _leer_segmento(base, segmento):
+    """Copia en memoria de las columnas de un segmento (a lo más ANALITICA_SEGMENTO_FILAS filas)"""
+    return {nombre: np.load(base / segmento['nombre'] / f'{nombre}.npy') for nombre in COLUMNAS}
+
+
+def _releer_abiertos(columnas):
+    """Corrige en el lugar las filas de préstamos no devueltos; devuelve cuántas se leyeron"""
+    ids = columnas['id']
+    abiertos = ids[columnas['estado'] != DEVUELTO]
+    actualizados = 0
+    for inicio in range(0, len(abiertos), 1000):
+        filas = list(Prestamo.objects.filter(id__in=abiertos[inicio:inicio + 1000].tolist()).values_list(*CAMPOS))
+        if not filas:
+            continue #un préstamo eliminado conserva su última versión en el historial
+        datos = _a_columnas(filas)
+        posiciones = np.searchsorted(ids, datos['id'])
+        for nombre, columna in columnas.items():
+            columna[posiciones] = datos[nombre]
+        actualizados += len(filas)
+    return actualizados
+
+
+def _agregar(base, segmentos, partes, filas, capacidad):
+    """Agrega filas al final del último segmento mientras tenga lugar y abre segmentos nuevos para el resto"""
+    datos = _a_columnas(filas)
+    inicio = 0
+    while inicio < len(filas):
+        if not segmentos or segmentos[-1]['filas'] >= capacidad:
+            numero = segmentos[-1]['numero'] + 1 if segmentos else 1
+            segmentos.append({'numero': numero, 'nombre': None, 'filas': 0, 'abiertos': 0})
+            partes[len(segmentos) - 1] = []
+        posicion = len(segmentos) - 1
+        if posicion not in partes: #el último segmento publicado se reescribe con las filas nuevas al final
+            partes[posicion] = [_leer_segmento(base, segmentos[posicion])]
+        cantidad = min(capacidad - segmentos[posicion]['filas'], len(filas) - inicio)
+        partes[posicion].append({nombre: columna[inicio:inicio + cantidad] for nombre, columna in datos.items()})
+        segmentos[posicion]['filas'] += cantidad
+        inicio += cantidad
+    return len(filas)
+
+
+# ============================================================================
+# CONSULTAS
+# ============================================================================
+
+def _rango(snapshot, desde=None, hasta=None):
+    """Máscara de préstamos realizados entre desde y hasta (fechas incluidas)"""
+    fecha = snapshot['fecha_prestamo']
+    mascara = np.ones(len(snapshot), dtype=bool)
+    if desde:
+        mascara &= fecha >= _segundos(_inicio_del_dia(desde))
+    if hasta:
+        mascara &= fecha < _segundos(_inicio_del_dia(hasta + timedelta(days=1)))
+    return mascara
+
+
+def _inicio_del_dia(fecha):
+    return datetime(fecha.year, fecha.month, fecha.day, tzinfo=timezone.utc)
+
+
+def duraciones_por_genero(snapshot, percentiles=(50, 75, 90, 99), desde=None, hasta=None):
+    """Percentiles de la duración (en días) de los préstamos devueltos, por género"""
+    mascara = _rango(snapshot, desde, hasta) & (snapshot['fecha_devolucion_real'] != SIN_FECHA)
+    duracion = (snapshot['fecha_devolucion_real'][mascara] - snapshot['fecha_prestamo'][mascara]) / DIA
+    genero = snapshot['genero'][mascara]
+
+    orden = np.argsort(genero, kind='stable')
+    genero, duracion = genero[orden], duracion[orden]
+    codigos, inicios = np.unique(genero, return_index=True)
+
+    resultados = []
+    for codigo, grupo in zip(codigos, np.split(duracion, inicios[1:])):
+        valores = np.percentile(grupo, percentiles)
+        resultados.append({
+            'genero': GENEROS[codigo],
+            'prestamos': int(grupo.size),
+            'promedio': round(float(grupo.mean()), 2),
+            'percentiles': {f'p{p:g}': round(float(v), 2) for p, v in zip(percentiles, valores)},
+        })
+    return resultados
+
+
+def distribucion_multas(snapshot, cubetas=10, desde=None, hasta=None):
+    """Histograma de multas cobradas y total por género"""
+    mascara = _rango(snapshot, desde, hasta) & (snapshot['multa'] > 0)
+    multas = snapshot['multa'][mascara]
+    if not multas.size:
+        return {'cantidad': 0, 'total': 0.0, 'promedio': None, 'histograma': [], 'por_genero': []}
+
+    conteos, bordes = np.histogram(multas, bins=cubetas)
+    genero = snapshot['genero'][mascara]
+    totales = np.bincount(genero, weights=multas, minlength=len(GENEROS))
+    cantidades = np.bincount(genero, minlength=len(GENEROS))
+    return {
+        'cantidad': int(multas.size),
+        'total': round(float(multas.sum()), 2),
+        'promedio': round(float(multas.mean()), 2),
+        'histograma': [
+            {'desde': round(float(bordes[i]), 2), 'hasta': round(float(bordes[i + 1]), 2), 'cantidad': int(conteos[i])}
+            for i in range(len(conteos))
+        ],
+        'por_genero': [
+            {'genero': GENEROS[i], 'cantidad': int(cantidades[i]), 'total': round(float(totales[i]), 2)}
+            for i in np.flatnonzero(cantidades)
+        ],
+    }
+
+
+def utilizacion_sucursales(snapshot, desde, hasta):
+    """Por sucursal y día: ejemplares prestados y proporción sobre el total de ejemplares"""
+    dia_inicial = _segundos(_inicio_del_dia(desde)) // DIA
+    dias = (hasta - desde).days + 1
+    if dias < 1 or dias > MAXIMO_DIAS:
+        raise ValueError(f'el rango debe tener entre 1 y {MAXIMO_DIAS} días')
+
+    # Cada préstamo ocupa su ejemplar desde el día del préstamo hasta el de la devolución (o hoy)
+    ahora = _segundos(timezone.now())
+    devolucion = snapshot['fecha_devolucion_real']
+    inicio = snapshot['fecha_prestamo'] // DIA - dia_inicial
+    fin = np.where(devolucion == SIN_FECHA, ahora, devolucion) // DIA - dia_inicial + 1
+    inicio, fin = np.clip(inicio, 0, dias), np.clip(fin, 0, dias)
+    mascara = inicio < fin
+
+    sucursales, indice = np.unique(snapshot['sucursal'][mascara], return_inverse=True)
+    diferencias = np.zeros((len(sucursales), dias + 1), dtype=np.int64)
+    np.add.at(diferencias, (indice, inicio[mascara]), 1) #+1 el día que empieza el préstamo
+    np.add.at(diferencias, (indice, fin[mascara]), -1) #-1 el día siguiente a la devolución
+    prestados = np.cumsum(diferencias, axis=1)[:, :dias]
+
+    ejemplares = dict(Ejemplar.objects.values_list('sucursal').annotate(total=Count('id')))
+    nombres = dict(Sucursal.objects.filter(id__in=sucursales.tolist()).values_list('id', 'nombre'))
+    resultados = []
+    for fila, sucursal_id in enumerate(sucursales.tolist()):
+        total = ejemplares.get(sucursal_id, 0)
+        utilizacion = prestados[fila] / total if total else np.zeros(dias)
+        resultados.append({
+            'sucursal_id': sucursal_id,
+            'sucursal': nombres.get(sucursal_id),
+            'ejemplares': total,
+            'utilizacion_promedio': round(float(utilizacion.mean()), 4),
+            'utilizacion_maxima': round(float(utilizacion.max()), 4),
+            'dias': [
+                {'fecha': desde + timedelta(days=d), 'prestados': int(prestados[fila, d]), 'utilizacion': round(float(utilizacion[d]), 4)}
+                for d in range(dias)
+            ],
+        })
+    return resultados
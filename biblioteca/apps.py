@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class BibliotecaConfig(AppConfig):
+    """Configuración de la aplicación biblioteca"""
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'biblioteca'
+    verbose_name = 'Biblioteca'
+
+    def ready(self):
+        from . import signals  # noqa: F401  registra los receptores de señales
+        from . import checks  # noqa: F401  registra las verificaciones de manage.py check
+        from . import consultas_lentas  # noqa: F401  execute_wrapper en cada conexión nueva
@@ -0,0 +1,138 @@
+# AUTENTICACIÓN JWT SIN CONSULTAR EL USUARIO EN CADA PETICIÓN
+#
+# Los tokens llevan rol, suspendido y la versión del usuario. Mientras la versión del token coincida
+# con la guardada en la caché compartida (CACHE_BACKEND), request.user responde id, rol y suspendido desde el
+# token sin consultar la base. Cualquier otro atributo carga el usuario completo desde una caché en memoria con
+# vencimiento (AUTENTICACION_CACHE_TTL) guardada junto a su versión.
+# Guardar o eliminar un Usuario incrementa su versión (signals.py): los tokens anteriores vuelven a leer el
+# usuario, así un cambio de rol, una suspensión o una baja se aplican en la siguiente petición. La versión tiene
+# que verse igual en todos los procesos, por eso checks.py exige una caché compartida en producción.
+
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Usuario
+
+CLAIMS = ('rol', 'suspendido') #campos del usuario copiados al token
+_USUARIOS = {} #id -> (vence, versión, usuario)
+_BLOQUEO = threading.Lock()
+
+
+def _clave_version(usuario_id):
+    return f'usuarios:version:{usuario_id}'
+
+
+def version_usuario(usuario_id):
+    """Versión actual de los datos del usuario (cambia cada vez que se guarda)"""
+    clave = _clave_version(usuario_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), None) #valor inicial único, un token de otra instalación no coincide
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_usuario(usuario_id):
+    """Marca como desactualizados los tokens y la caché del usuario"""
+    try:
+        cache.incr(_clave_version(usuario_id))
+    except ValueError:
+        pass #sin versión guardada no hay nada que invalidar
+    with _BLOQUEO:
+        _USUARIOS.pop(usuario_id, None)
+
+
+def obtener_usuario(usuario_id):
+    """Usuario desde la caché en memoria, o desde la base de datos si venció o cambió su versión"""
+    version = version_usuario(usuario_id)
+    entrada = _USUARIOS.get(usuario_id)
+    if entrada and entrada[0] > time.monotonic() and entrada[1] == version:
+        return copy.copy(entrada[2]) #una copia por petición, las vistas pueden modificar el usuario
+
+    usuario = Usuario.objects.filter(id=usuario_id).first()
+    if usuario is not None and version is not None:
+        with _BLOQUEO:
+            if len(_USUARIOS) >= settings.AUTENTICACION_CACHE_MAXIMO:
+                _USUARIOS.clear() #caché pequeña: al llenarse se vacía
+            _USUARIOS[usuario_id] = (time.monotonic() + settings.AUTENTICACION_CACHE_TTL, version, usuario)
+        usuario = copy.copy(usuario)
+    return usuario
+
+
+def agregar_claims(token, usuario):
+    """Copia al token los datos que las vistas leen en cada petición"""
+    for claim in CLAIMS:
+        token[claim] = getattr(usuario, claim)
+    token['version'] = version_usuario(usuario.id)
+    return token
+
+
+def tokens_para(usuario):
+    """RefreshToken con los claims del usuario; su access_token los hereda"""
+    return agregar_claims(RefreshToken.for_user(usuario), usuario)
+
+
+class UsuarioDelToken(SimpleLazyObject):
+    """
+    request.user perezoso: id, rol y suspendido vienen del token y el resto de atributos
+    carga el usuario completo la primera vez que se necesita.
+    """
+
+    def __init__(self, usuario_id, claims):
+        super().__init__(lambda: self._cargar(usuario_id))
+        # Atributos propios de la instancia: __getattr__ no se llama para ellos y no cargan el usuario
+        object.__setattr__(self, 'id', usuario_id)
+        object.__setattr__(self, 'pk', usuario_id)
+        for claim in CLAIMS:
+            object.__setattr__(self, claim, claims[claim])
+        object.__setattr__(self, 'is_authenticated', True)
+        object.__setattr__(self, 'is_anonymous', False)
+        object.__setattr__(self, 'is_active', True) #una baja cambia la versión y el token deja de usarse
+
+    @staticmethod
+    def _cargar(usuario_id):
+        usuario = obtener_usuario(usuario_id)
+        if usuario is None:
+            raise AuthenticationFailed('Usuario no encontrado', code='user_not_found')
+        return usuario
+
+    def __bool__(self):
+        return True
+
+    def __setattr__(self, nombre, valor):
+        if nombre in self.__dict__ and nombre not in ('_wrapped', '_setupfunc'):
+            object.__setattr__(self, nombre, valor) #mantener el valor local igual al del usuario
+        super().__setattr__(nombre, valor)
+
+
+class JWTAutenticacionCacheada(JWTAuthentication):
+    """JWTAuthentication que no consulta la tabla de usuarios en cada petición"""
+
+    def get_user(self, validated_token):
+        try:
+            usuario_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed('El token no identifica al usuario', code='token_not_valid')
+
+        # Token con claims vigentes: no hace falta leer el usuario
+        version = version_usuario(usuario_id)
+        if version is not None and all(claim in validated_token for claim in CLAIMS) and \
+                validated_token.get('version') == version:
+            return UsuarioDelToken(usuario_id, validated_token)
+
+        # Token viejo, usuario modificado después de emitirlo o caché sin la versión
+        usuario = obtener_usuario(usuario_id)
+        if usuario is None:
+            raise AuthenticationFailed('Usuario no encontrado', code='user_not_found')
+        if not usuario.is_active:
+            raise AuthenticationFailed('Usuario desactivado', code='user_inactive')
+        return usuario
@@ -0,0 +1,11 @@
+# Backend MySQL con pool de conexiones: ENGINE = 'biblioteca.backends.mysql'
+
+from django.db.backends.mysql import base
+
+from ..pool import ConexionesEnPoolMixin
+
+
+class DatabaseWrapper(ConexionesEnPoolMixin, base.DatabaseWrapper):
+
+    def verificar_conexion(self, conexion):
+        conexion.ping()
@@ -0,0 +1,195 @@
+# POOL DE CONEXIONES A LA BASE DE DATOS
+#
+# Django abre una conexión nueva por petición (CONN_MAX_AGE=0) y la cierra al terminar. Con los backends
+# biblioteca.backends.mysql o biblioteca.backends.sqlite3 "cerrar" devuelve la conexión a un pool del
+# proceso y la siguiente petición la reutiliza sin el handshake TCP ni la autenticación.
+#
+# DATABASES['default']['POOL'] (ver settings.py):
+#   CONEXIONES           conexiones que se mantienen abiertas por proceso (por worker de gunicorn)
+#   DESBORDE             conexiones extra permitidas en picos; se cierran al devolverlas
+#   VIDA_MAXIMA          segundos tras los que una conexión se reemplaza (antes que wait_timeout de MySQL)
+#   VERIFICAR_INACTIVAS  segundos sin uso tras los que se hace ping antes de entregar la conexión
+#   ESPERA               segundos que se espera una conexión libre antes de fallar
+
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from django.db.utils import OperationalError
+
+POOL_POR_DEFECTO = {
+    'CONEXIONES': 5,
+    'DESBORDE': 5,
+    'VIDA_MAXIMA': 1800,
+    'VERIFICAR_INACTIVAS': 30,
+    'ESPERA': 10,
+}
+
+_POOLS = {} #(alias, pid) -> Pool
+_BLOQUEO = threading.Lock()
+
+
+class PoolAgotado(OperationalError):
+    """No se liberó ninguna conexión dentro del tiempo de espera"""
+
+
+class Pool:
+    """Conexiones del driver libres para reutilizar, con límite de tamaño, vida máxima y verificación"""
+
+    def __init__(self, crear, verificar, CONEXIONES, DESBORDE, VIDA_MAXIMA, VERIFICAR_INACTIVAS, ESPERA):
+        self.crear = crear #función sin argumentos que abre una conexión nueva
+        self.verificar = verificar #función(conexión) que lanza una excepción si la conexión no sirve
+        self.tamaño = CONEXIONES
+        self.maximo = CONEXIONES + DESBORDE
+        self.vida_maxima = VIDA_MAXIMA
+        self.verificar_inactivas = VERIFICAR_INACTIVAS
+        self.espera = ESPERA
+        self._libres = deque() #(conexión, creada, devuelta)
+        self._creadas = {} #id(conexión) -> momento de creación, de las conexiones abiertas
+        self._conectando = 0 #lugares reservados mientras se abre una conexión fuera del bloqueo
+        self._condicion = threading.Condition()
+        self.estadisticas = {'creadas': 0, 'reutilizadas': 0, 'cerradas': 0, 'descartadas': 0, 'esperas': 0, 'maximo_abiertas': 0}
+
+    def _cerrar(self, conexion, motivo='cerradas'):
+        self._creadas.pop(id(conexion), None)
+        self.estadisticas[motivo] += 1
+        try:
+            conexion.close()
+        except Exception:
+            pass #ya estaba cortada
+
+    def _util(self, conexion, creada, devuelta):
+        """La conexión libre todavía se puede entregar"""
+        ahora = time.monotonic()
+        if ahora - creada > self.vida_maxima:
+            return False
+        if ahora - devuelta > self.verificar_inactivas:
+            try:
+                self.verificar(conexion)
+            except Exception:
+                return False
+        return True
+
+    def obtener(self):
+        limite = time.monotonic() + self.espera
+        with self._condicion:
+            while True:
+                while self._libres:
+                    conexion, creada, devuelta = self._libres.pop() #la más reciente, la que menos tiempo estuvo inactiva
+                    if self._util(conexion, creada, devuelta):
+                        self.estadisticas['reutilizadas'] += 1
+                        return conexion
+                    self._cerrar(conexion, 'descartadas')
+
+                if len(self._creadas) + self._conectando < self.maximo:
+                    self._conectando += 1
+                    break
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise PoolAgotado(f'Sin conexiones libres tras {self.espera} s ({self.maximo} en uso)')
+                self.estadisticas['esperas'] += 1
+                self._condicion.wait(restante)
+
+        try:
+            conexion = self.crear()
+        except Exception:
+            with self._condicion:
+                self._conectando -= 1
+                self._condicion.notify()
+            raise
+        with self._condicion:
+            self._conectando -= 1
+            self._creadas[id(conexion)] = time.monotonic()
+            self.estadisticas['creadas'] += 1
+            self.estadisticas['maximo_abiertas'] = max(self.estadisticas['maximo_abiertas'], len(self._creadas))
+        return conexion
+
+    def devolver(self, conexion):
+        """Deja la conexión libre, o la cierra si sobra, venció o quedó en mal estado"""
+        try:
+            conexion.rollback() #ninguna transacción a medias pasa a la siguiente petición
+        except Exception:
+            with self._condicion:
+                self._cerrar(conexion, 'descartadas')
+                self._condicion.notify()
+            return
+
+        with self._condicion:
+            creada = self._creadas.get(id(conexion), 0)
+            if len(self._libres) >= self.tamaño or time.monotonic() - creada > self.vida_maxima:
+                self._cerrar(conexion)
+            else:
+                self._libres.append((conexion, creada, time.monotonic()))
+            self._condicion.notify()
+
+    def descartar(self, conexion):
+        with self._condicion:
+            self._cerrar(conexion, 'descartadas')
+            self._condicion.notify()
+
+    def vaciar(self):
+        with self._condicion:
+            while self._libres:
+                self._cerrar(self._libres.pop()[0])
+
+    def estado(self):
+        with self._condicion:
+            return {
+                **self.estadisticas,
+                'abiertas': len(self._creadas),
+                'libres': len(self._libres),
+                'tamaño': self.tamaño,
+                'maximo': self.maximo,
+            }
+
+
+def obtener_pool(alias, opciones, crear, verificar):
+    """Pool del proceso actual: tras un fork (gunicorn --preload) el hijo arma el suyo"""
+    clave = (alias, os.getpid())
+    pool = _POOLS.get(clave)
+    if pool is None:
+        with _BLOQUEO:
+            pool = _POOLS.get(clave)
+            if pool is None:
+                pool = _POOLS[clave] = Pool(crear, verificar, **{**POOL_POR_DEFECTO, **opciones})
+    return pool
+
+
+def estado_pools():
+    """Estado de los pools de este proceso, por alias de base de datos"""
+    return {alias: pool.estado() for (alias, pid), pool in _POOLS.items() if pid == os.getpid()}
+
+
+class ConexionesEnPoolMixin:
+    """Para DatabaseWrapper: toma las conexiones del pool y las devuelve al cerrarlas"""
+
+    def verificar_conexion(self, conexion):
+        """Lanza una excepción si la conexión del driver ya no sirve; cada backend puede usar algo más barato"""
+        cursor = conexion.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    @property
+    def pool(self):
+        return _POOLS.get((self.alias, os.getpid()))
+
+    def get_new_connection(self, conn_params):
+        pool = obtener_pool(
+            self.alias, self.settings_dict.get('POOL', {}),
+            partial(super().get_new_connection, conn_params), self.verificar_conexion
+        )
+        return pool.obtener()
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                self.pool.descartar(self.connection) #el wrapper la sigue usando, no se puede compartir
+            else:
+                self.pool.devolver(self.connection)
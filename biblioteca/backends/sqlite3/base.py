@@ -0,0 +1,11 @@
+# Backend SQLite con pool de conexiones: ENGINE = 'biblioteca.backends.sqlite3' (desarrollo y benchmark_pool)
+
+from django.db.backends.sqlite3 import base
+
+from ..pool import ConexionesEnPoolMixin
+
+
+class DatabaseWrapper(ConexionesEnPoolMixin, base.DatabaseWrapper):
+
+    def verificar_conexion(self, conexion):
+        conexion.execute('SELECT 1')
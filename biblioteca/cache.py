@@ -0,0 +1,258 @@
+# CACHÉ DE RESULTADOS CALCULADOS (REPORTES Y ESTADÍSTICAS)
+#
+# Las claves incluyen números de generación: uno global y uno por cada modelo que lee el resultado
+# (resultado_en_cache(..., modelos=(Prestamo, Usuario))). Al guardar o eliminar un modelo (signals.py) se
+# incrementa solo su generación, así un préstamo nuevo no descarta el reporte de multas. La generación global
+# se incrementa con cambios masivos que no envían señales (bulk_create, importaciones) y descarta todo.
+# Los reportes agregados (rankings, totales) no dependen de los préstamos: cambian con cada préstamo y se
+# descartarían siempre, en cambio vencen a los RESULTADOS_CACHE_TTL_AGREGADOS segundos.
+# Los resultados de un solo usuario usan un alcance ('usuario:<id>') con su propia versión, así
+# solo se invalidan cuando cambian los datos de ese usuario.
+#
+# Al final está la caché de objetos por clave primaria (Libro, Sucursal) en dos niveles.
+
+import copy
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+
+GENERACION = 'resultados:generacion'
+_FALTA = object() #distingue "no está en caché" de un resultado None
+_BLOQUEOS = [threading.Lock() for _ in range(64)] #un grupo fijo de bloqueos, así no crece con cada clave
+_NOMBRES = set() #resultados registrados, para listar sus métricas
+
+
+def _incrementar(clave):
+    """incr atómico que crea la clave si no existe"""
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, None)
+        return cache.incr(clave)
+
+
+def _generacion(clave=GENERACION):
+    generacion = cache.get(clave)
+    if generacion is None:
+        cache.add(clave, time.time_ns(), None) #valor inicial único para no reutilizar claves de una generación vieja
+        generacion = cache.get(clave)
+    return generacion
+
+
+def _clave_alcance(alcance):
+    return f'resultados:alcance:{alcance}'
+
+
+def alcance_usuario(usuario_id):
+    """Alcance de los resultados que dependen solo de los datos de un usuario"""
+    return f'usuario:{usuario_id}'
+
+
+def _clave_modelo(modelo):
+    return f'resultados:modelo:{modelo._meta.label_lower}'
+
+
+def _generaciones(claves):
+    """Generaciones de varias claves con una sola lectura de la caché, unidas en un texto"""
+    generaciones = cache.get_many(claves)
+    return '.'.join(str(generaciones[clave] if clave in generaciones else _generacion(clave)) for clave in claves)
+
+
+def invalidar_resultados(alcance=None, modelo=None):
+    """
+    Descarta los resultados guardados: los de un alcance, los que leen un modelo o, sin argumentos, todos
+    (se llama al modificar datos)
+    """
+    if not settings.RESULTADOS_CACHE_INVALIDAR:
+        return
+    if alcance:
+        _incrementar(_clave_alcance(alcance))
+    elif modelo is not None:
+        _incrementar(_clave_modelo(modelo))
+    else:
+        _incrementar(GENERACION)
+
+
+def clave_resultado(nombre, parametros, alcance=None, modelos=()):
+    parametros = json.dumps(parametros, sort_keys=True, cls=DjangoJSONEncoder)
+    resumen = hashlib.sha1(parametros.encode('utf-8')).hexdigest()
+    if alcance:
+        generacion = _generacion(_clave_alcance(alcance))
+    else:
+        generacion = _generaciones([GENERACION, *map(_clave_modelo, modelos)])
+    return f'resultados:{nombre}:{alcance or "global"}:{generacion}:{resumen}'
+
+
+def _registrar(nombre, evento):
+    _NOMBRES.add(nombre)
+    _incrementar(f'resultados:metricas:{nombre}:{evento}')
+
+
+def obtener_o_calcular(nombre, parametros, calcular, ttl=None, alcance=None, modelos=()):
+    """
+    Devuelve el resultado guardado o lo calcula una sola vez aunque lleguen muchas peticiones juntas.
+    modelos: los que lee calcular(); guardar o eliminar uno de ellos descarta el resultado.
+    """
+    ttl = settings.RESULTADOS_CACHE_TTL if ttl is None else ttl
+    clave = clave_resultado(nombre, parametros, alcance, modelos)
+
+    valor = cache.get(clave, _FALTA)
+    if valor is not _FALTA:
+        _registrar(nombre, 'aciertos')
+        return valor
+
+    # Dentro del proceso: los hilos con la misma clave esperan al primero
+    with _BLOQUEOS[hash(clave) % len(_BLOQUEOS)]:
+        valor = cache.get(clave, _FALTA)
+        if valor is not _FALTA:
+            _registrar(nombre, 'aciertos')
+            return valor
+
+        # Entre procesos: cache.add es atómico, solo uno obtiene el bloqueo y los demás esperan el resultado
+        bloqueo = f'{clave}:calculando'
+        limite = time.monotonic() + settings.RESULTADOS_CACHE_ESPERA
+        tengo_bloqueo = cache.add(bloqueo, 1, settings.RESULTADOS_CACHE_ESPERA)
+        while not tengo_bloqueo and time.monotonic() < limite:
+            time.sleep(0.05)
+            valor = cache.get(clave, _FALTA)
+            if valor is not _FALTA:
+                _registrar(nombre, 'aciertos')
+                return valor
+            tengo_bloqueo = cache.add(bloqueo, 1, settings.RESULTADOS_CACHE_ESPERA)
+
+        # Si el otro proceso tardó demasiado se calcula igual, para no dejar la petición sin respuesta
+        try:
+            _registrar(nombre, 'fallos')
+            valor = calcular()
+            cache.set(clave, valor, ttl)
+        finally:
+            if tengo_bloqueo:
+                cache.delete(bloqueo)
+    return valor
+
+
+def resultado_en_cache(nombre, ttl=None, modelos=()):
+    """Decorador: guarda en caché el resultado de la función según sus argumentos con nombre"""
+    def decorador(funcion):
+        _NOMBRES.add(nombre)
+
+        @functools.wraps(funcion)
+        def envoltura(**parametros):
+            return obtener_o_calcular(nombre, parametros, lambda: funcion(**parametros), ttl, modelos=modelos)
+        return envoltura
+    return decorador
+
+
+def metricas_resultados():
+    """Aciertos y fallos acumulados por cada resultado registrado"""
+    metricas = {}
+    for nombre in sorted(_NOMBRES):
+        aciertos = cache.get(f'resultados:metricas:{nombre}:aciertos', 0)
+        fallos = cache.get(f'resultados:metricas:{nombre}:fallos', 0)
+        total = aciertos + fallos
+        metricas[nombre] = {
+            'aciertos': aciertos,
+            'fallos': fallos,
+            'porcentaje_aciertos': round(100 * aciertos / total, 1) if total else None
+        }
+    return metricas
+
+
+# ============================================================================
+# CACHÉ DE OBJETOS POR CLAVE PRIMARIA (LIBRO, SUCURSAL)
+# ============================================================================
+# L1: LRU en memoria del proceso, a lo más OBJETOS_CACHE_L1_MAXIMO objetos. Una entrada se usa sin consultar
+#     nada durante OBJETOS_CACHE_L1_TTL segundos; después se compara su versión con la guardada en L2.
+# L2: la caché compartida (CACHES) con claves 'objetos:<modelo>:<pk>:<versión>'.
+# Guardar o eliminar el objeto incrementa su versión (signals.py), así los demás procesos dejan de usar
+# la copia vieja a más tardar al vencer su L1. Solo para lecturas: para modificar un objeto se lee de la base.
+# Solo modelos que casi no cambian: el estado de un Ejemplar cambia con cada préstamo y devolución, así que
+# sus relaciones en los serializers se traen con select_related (PlanRelacionesMixin) y no desde aquí.
+
+MODELOS_CACHEADOS = {'biblioteca.libro', 'biblioteca.sucursal'}
+_L1 = OrderedDict() #(modelo, pk) -> (vence, versión, objeto), el más usado al final
+_L1_BLOQUEO = threading.Lock()
+_ESTADISTICAS_OBJETOS = Counter()
+
+
+def _clave_objeto(modelo, pk):
+    return f'objetos:{modelo._meta.label_lower}:{pk}'
+
+
+def invalidar_objeto(modelo, pk):
+    """Nueva versión del objeto: las copias en L2 y en la L1 de los demás procesos dejan de usarse"""
+    clave = f'{_clave_objeto(modelo, pk)}:version'
+    if not cache.add(clave, time.time_ns(), None): #sin versión guardada se crea una nueva única
+        _incrementar(clave)
+    with _L1_BLOQUEO:
+        _L1.pop((modelo._meta.label_lower, pk), None)
+
+
+def obtener_objeto(modelo, pk):
+    """
+    Copia del objeto con esa clave primaria, desde L1, L2 o la base de datos principal.
+    Lanza modelo.DoesNotExist igual que modelo.objects.get(pk=pk).
+    """
+    if modelo._meta.label_lower not in MODELOS_CACHEADOS:
+        raise ValueError(f'{modelo.__name__} no está en la caché de objetos')
+    try:
+        pk = modelo._meta.pk.to_python(pk)
+    except ValidationError:
+        pk = None
+    if pk is None:
+        raise modelo.DoesNotExist(f'{modelo.__name__} sin id válido')
+
+    clave = (modelo._meta.label_lower, pk)
+    ahora = time.monotonic()
+    entrada = _L1.get(clave)
+    if entrada and entrada[0] > ahora:
+        _ESTADISTICAS_OBJETOS['l1_aciertos'] += 1
+        with _L1_BLOQUEO:
+            if clave in _L1:
+                _L1.move_to_end(clave)
+        return copy.copy(entrada[2]) #cada petición recibe su copia, puede modificarla
+
+    version = _generacion(f'{_clave_objeto(modelo, pk)}:version') #antes de leer la base, ver signals.py
+    if entrada and entrada[1] == version:
+        _ESTADISTICAS_OBJETOS['l1_aciertos'] += 1
+        objeto = entrada[2]
+    else:
+        objeto = cache.get(f'{_clave_objeto(modelo, pk)}:{version}')
+        if objeto is not None:
+            _ESTADISTICAS_OBJETOS['l2_aciertos'] += 1
+        else:
+            _ESTADISTICAS_OBJETOS['fallos'] += 1
+            objeto = modelo._base_manager.using(DEFAULT_DB_ALIAS).get(pk=pk) #nunca de una réplica atrasada
+            cache.set(f'{_clave_objeto(modelo, pk)}:{version}', objeto, settings.OBJETOS_CACHE_L2_TTL)
+
+    with _L1_BLOQUEO:
+        _L1[clave] = (ahora + settings.OBJETOS_CACHE_L1_TTL, version, objeto)
+        _L1.move_to_end(clave)
+        while len(_L1) > settings.OBJETOS_CACHE_L1_MAXIMO:
+            _L1.popitem(last=False)
+    return copy.copy(objeto)
+
+
+def metricas_objetos():
+    """Aciertos por nivel en este proceso (L1 es propia de cada proceso)"""
+    aciertos = _ESTADISTICAS_OBJETOS['l1_aciertos'] + _ESTADISTICAS_OBJETOS['l2_aciertos']
+    total = aciertos + _ESTADISTICAS_OBJETOS['fallos']
+    return {
+        'proceso': os.getpid(),
+        'l1_aciertos': _ESTADISTICAS_OBJETOS['l1_aciertos'],
+        'l2_aciertos': _ESTADISTICAS_OBJETOS['l2_aciertos'],
+        'fallos': _ESTADISTICAS_OBJETOS['fallos'],
+        'porcentaje_aciertos': round(100 * aciertos / total, 1) if total else None,
+        'l1_objetos': len(_L1),
+        'l1_maximo': settings.OBJETOS_CACHE_L1_MAXIMO,
+    }
@@ -0,0 +1,137 @@
+# FEED DE CAMBIOS PARA SINCRONIZAR CLIENTES (GET /api/cambios/?desde=<cursor>)
+#
+# Los kioscos y el espejo del catálogo guardan el cursor de la última respuesta y piden solo lo que cambió
+# después, en vez de descargar libros, sucursales y ejemplares completos cada pocos minutos.
+# Cada alta, modificación o baja de Libro, Sucursal, Ejemplar, Prestamo y Reserva agrega una fila a Cambio al
+# confirmar la transacción (signals.py). Una baja lógica (Libro.activo o Sucursal.activa en False) es 'eliminado'.
+# El id de Cambio es el cursor. Solo se leen las filas con más de CAMBIOS_MARGEN segundos: dos inserciones
+# pueden confirmarse en otro orden que el de sus id, y sin el margen un cliente podría saltear la de id menor.
+# compactar_cambios borra las entradas reemplazadas por una más nueva del mismo objeto: con cualquier cursor se
+# sigue recibiendo el último estado de cada objeto, sin las versiones intermedias.
+# Con desde=0 la respuesta es una copia completa (la migración 0010 registró los objetos que ya existían).
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Libro, Sucursal, Ejemplar, Prestamo, Reserva, Cambio
+from .serializers import (
+    LibroValoresSerializer, SucursalValoresSerializer, EjemplarValoresSerializer,
+    PrestamoValoresSerializer, ReservaValoresSerializer
+)
+
+CATALOGO = ('libro', 'sucursal', 'ejemplar') #los demás (préstamos y reservas) los usuarios solo ven los suyos
+MODELOS = { #nombre en Cambio -> (modelo, objetos vigentes, serializer de los listados)
+    'libro': (Libro, Q(activo=True), LibroValoresSerializer),
+    'sucursal': (Sucursal, Q(activa=True), SucursalValoresSerializer),
+    'ejemplar': (Ejemplar, Q(), EjemplarValoresSerializer),
+    'prestamo': (Prestamo, Q(), PrestamoValoresSerializer),
+    'reserva': (Reserva, Q(), ReservaValoresSerializer),
+}
+
+
+def registrar(instancia, creado=False, eliminado=False):
+    """Agrega la entrada de la instancia al feed cuando se confirme la transacción (nada si se revierte)"""
+    modelo = instancia._meta.model_name
+    operacion = 'eliminado' if eliminado or not _vigente(modelo, instancia) else 'creado' if creado else 'modificado'
+    cambio = Cambio(modelo=modelo, objeto_id=instancia.pk, operacion=operacion, usuario_id=getattr(instancia, 'usuario_id', None))
+
+    def guardar():
+        cambio.fecha = timezone.now() #la fecha del commit, no la del save: es la que compara CAMBIOS_MARGEN
+        cambio.save()
+    transaction.on_commit(guardar)
+
+
+def _vigente(modelo, instancia):
+    if modelo == 'libro':
+        return instancia.activo
+    if modelo == 'sucursal':
+        return instancia.activa
+    return True
+
+
+def registrar_existentes():
+    """
+    Entrada 'creado' para los objetos vigentes que no tienen ninguna (cargados con bulk_create, que no envía
+    señales, como generar_datos). Devuelve cuántas se agregaron.
+    """
+    agregadas = 0
+    for modelo, (clase, vigentes, _) in MODELOS.items():
+        registrados = Cambio.objects.filter(modelo=modelo, objeto_id=OuterRef('pk'))
+        faltantes = clase.objects.filter(vigentes).filter(~Exists(registrados)).order_by('pk')
+        campos = ['pk', 'usuario_id'] if modelo not in CATALOGO else ['pk']
+        lote = []
+        for fila in faltantes.values(*campos).iterator(chunk_size=2000):
+            lote.append(Cambio(modelo=modelo, objeto_id=fila['pk'], operacion='creado', usuario_id=fila.get('usuario_id')))
+            if len(lote) == 1000:
+                agregadas += len(Cambio.objects.bulk_create(lote))
+                lote = []
+        agregadas += len(Cambio.objects.bulk_create(lote))
+    return agregadas
+
+
+def leer(usuario, desde=0, limite=None, modelos=None):
+    """
+    Hasta limite entradas después del cursor desde, con los datos actuales de cada objeto en el mismo formato
+    que su listado (None si fue eliminado). Si un objeto aparece varias veces en el lote solo queda la última.
+    ValueError si modelos tiene un nombre que no existe.
+    """
+    limite = min(limite or settings.CAMBIOS_LIMITE, settings.CAMBIOS_LIMITE)
+    desconocidos = [modelo for modelo in modelos or () if modelo not in MODELOS]
+    if desconocidos:
+        raise ValueError(f"Modelos desconocidos: {', '.join(desconocidos)}. Disponibles: {', '.join(MODELOS)}")
+
+    entradas = Cambio.objects.filter(id__gt=desde, fecha__lte=timezone.now() - timedelta(seconds=settings.CAMBIOS_MARGEN))
+    if modelos:
+        entradas = entradas.filter(modelo__in=modelos)
+    if usuario.rol == 'usuario':
+        entradas = entradas.filter(Q(modelo__in=CATALOGO) | Q(usuario_id=usuario.id))
+    filas = list(entradas.order_by('id').values('id', 'modelo', 'objeto_id', 'operacion')[:limite + 1])
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    ultimas = {} #(modelo, objeto_id) -> fila más nueva del lote
+    for fila in filas:
+        ultimas.pop((fila['modelo'], fila['objeto_id']), None)
+        ultimas[(fila['modelo'], fila['objeto_id'])] = fila #al final: el orden queda el de la última entrada
+
+    pendientes = {} #modelo -> ids cuyos datos hay que leer
+    for (modelo, objeto_id), fila in ultimas.items():
+        if fila['operacion'] != 'eliminado':
+            pendientes.setdefault(modelo, []).append(objeto_id)
+    datos = {}
+    for modelo, ids in pendientes.items():
+        clase, vigentes, serializer = MODELOS[modelo]
+        for item in serializer(clase.objects.filter(vigentes, id__in=ids)).data: #una lectura por modelo
+            datos[(modelo, item['id'])] = item
+
+    return {
+        'cambios': [
+            {
+                'cursor': fila['id'],
+                'modelo': modelo,
+                'id': objeto_id,
+                'operacion': fila['operacion'],
+                'datos': datos.get((modelo, objeto_id)), #None también si dejó de estar vigente después
+            }
+            for (modelo, objeto_id), fila in ultimas.items()
+        ],
+        'cursor': filas[-1]['id'] if filas else desde, #el siguiente desde, aunque el lote no devuelva nada
+        'hay_mas': hay_mas,
+    }
+
+
+def compactar(lote=1000):
+    """Borra las entradas que tienen otra más nueva del mismo objeto; devuelve cuántas borró"""
+    reemplazadas = Cambio.objects.filter(Exists(Cambio.objects.filter(
+        modelo=OuterRef('modelo'), objeto_id=OuterRef('objeto_id'), id__gt=OuterRef('id')
+    )))
+    borradas = 0
+    while True:
+        ids = list(reemplazadas.order_by('id').values_list('id', flat=True)[:lote]) #MySQL no borra con una subconsulta sobre la misma tabla
+        if not ids:
+            return borradas
+        borradas += Cambio.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,46 @@
+# VERIFICACIONES DEL SISTEMA (python manage.py check)
+#
+# La versión de los usuarios autenticados (autenticacion.py) y las escrituras recientes de cada usuario
+# (replicas.py) viven en CACHES: con una caché en memoria de cada proceso, un cambio de rol o una suspensión
+# guardados en un proceso no se ven en los demás hasta que vence el token, y un usuario que escribió puede leer
+# de una réplica atrasada si la siguiente petición la atiende otro worker. Se verifica con "check --deploy"
+# porque en desarrollo y en las pruebas hay un solo proceso.
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+CACHES_LOCALES = { #backends cuyo contenido no comparten los procesos
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def cache_local():
+    return settings.CACHES['default']['BACKEND'] in CACHES_LOCALES
+
+
+@register(Tags.caches, deploy=True)
+def cache_compartida_autenticacion(app_configs, **kwargs):
+    """La versión de los usuarios tiene que ser la misma en todos los procesos"""
+    if not cache_local():
+        return []
+    return [Error(
+        'CACHE_BACKEND no es una caché compartida: un cambio de rol, suspensión o baja no llega a los demás procesos',
+        hint='Configurar CACHE_BACKEND con Redis o Memcached (CACHE_LOCATION)',
+        obj='biblioteca.autenticacion',
+        id='biblioteca.E001',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def cache_compartida_replicas(app_configs, **kwargs):
+    """Con réplicas, la lectura propia tras escribir tiene que valer en todos los procesos"""
+    if not settings.REPLICAS_BD or not cache_local():
+        return []
+    return [Error(
+        'DB_REPLICAS está configurado con una caché local: tras escribir, un usuario puede leer de una réplica '
+        'atrasada en otro proceso',
+        hint='Configurar CACHE_BACKEND con Redis o Memcached (CACHE_LOCATION)',
+        obj='biblioteca.replicas',
+        id='biblioteca.E002',
+    )]
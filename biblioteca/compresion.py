@@ -0,0 +1,17 @@
+# COMPRESIÓN DE RESPUESTAS
+#
+# GZipMiddleware de Django solo para respuestas de al menos COMPRESION_MINIMO bytes: en las chicas
+# la cabecera gzip y el tiempo de compresión no compensan. Se comprime solo si el cliente envía
+# Accept-Encoding: gzip, y Django agrega Vary: Accept-Encoding y relleno aleatorio contra BREACH.
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompresionMiddleware(GZipMiddleware):
+    """GZipMiddleware con tamaño mínimo configurable (COMPRESION_MINIMO)"""
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.COMPRESION_MINIMO:
+            return response
+        return super().process_response(request, response)
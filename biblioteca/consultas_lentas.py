@@ -0,0 +1,305 @@
+# REGISTRO DE CONSULTAS LENTAS Y ESTADÍSTICAS POR HUELLA
+#
+# Con CONSULTAS_ESTADISTICAS cada conexión a la base (también las réplicas) lleva un execute_wrapper que mide
+# todas las consultas y las agrupa por huella (instrumentacion.huella: la misma SQL con otros valores) y vista
+# (nombre de URL; vacío en comandos). Por grupo se acumula en memoria del proceso: cantidad, tiempo total y
+# máximo, filas y una muestra de duraciones para el p95.
+# Las que tardan más de CONSULTAS_LENTAS_UMBRAL_MS se registran en el logger biblioteca.consultas_lentas con
+# la línea de biblioteca/ que las originó.
+# Cada CONSULTAS_VOLCAR_CADA segundos, al terminar una petición, el proceso suma lo acumulado a
+# EstadisticaConsulta (una fila por huella, vista y hora) y borra las horas de más de CONSULTAS_CONSERVAR_DIAS.
+# El ranking está en /api/reportes/consultas/ (administradores).
+#
+# Costo por consulta: la huella se calcula una vez por texto SQL y la pila solo se recorre en las lentas.
+
+import contextvars
+import hashlib
+import logging
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Case, F, FloatField, Max, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .instrumentacion import huella, sin_medir, _sin_medir
+from .models import EstadisticaConsulta
+
+logger = logging.getLogger('biblioteca.consultas_lentas')
+
+MUESTRAS = 100 #duraciones guardadas por grupo para estimar el p95 (muestreo de reservorio)
+MARCOS_UBICACION = 3 #líneas de biblioteca/ guardadas por consulta lenta
+MAXIMO_HUELLAS = 5000 #textos SQL distintos con la huella en caché; al llenarse se vacía
+ORDENES = {
+    'tiempo_total': '-tiempo_total',
+    'promedio': '-promedio',
+    'p95': '-p95',
+    'cantidad': '-veces',
+    'lentas': '-cantidad_lentas',
+}
+
+_BIBLIOTECA = str(Path(__file__).parent)
+_PROPIOS = tuple(str(Path(_BIBLIOTECA) / nombre) for nombre in ( #marcos que no son el origen de la consulta
+    'consultas_lentas.py', 'instrumentacion.py', 'backends'
+))
+_peticion = contextvars.ContextVar('peticion_consultas', default=None)
+_candado = threading.Lock()
+_huellas = {} #sql -> (clave, huella)
+_grupos = {} #(clave, vista) -> Grupo
+_proximo_volcado = 0.0
+
+
+class Grupo:
+    """Consultas de una huella y una vista acumuladas desde el último volcado"""
+    __slots__ = ('huella', 'cantidad', 'tiempo_total', 'tiempo_maximo', 'filas', 'lentas', 'muestras', 'ubicacion')
+
+    def __init__(self, huella):
+        self.huella = huella
+        self.cantidad = 0
+        self.tiempo_total = 0.0
+        self.tiempo_maximo = 0.0
+        self.filas = 0
+        self.lentas = 0
+        self.muestras = []
+        self.ubicacion = '' #de la consulta lenta más lenta
+
+    def agregar(self, duracion, filas):
+        self.cantidad += 1
+        self.tiempo_total += duracion
+        if filas > 0:
+            self.filas += filas
+        if duracion > self.tiempo_maximo:
+            self.tiempo_maximo = duracion
+        if len(self.muestras) < MUESTRAS:
+            self.muestras.append(duracion)
+        else:
+            indice = random.randrange(self.cantidad)
+            if indice < MUESTRAS:
+                self.muestras[indice] = duracion
+
+    def p95(self):
+        muestras = sorted(self.muestras)
+        return muestras[min(int(len(muestras) * 0.95), len(muestras) - 1)] if muestras else 0.0
+
+
+def _huella(sql):
+    encontrada = _huellas.get(sql)
+    if encontrada is None:
+        normalizada = huella(sql)
+        encontrada = (hashlib.sha1(normalizada.encode('utf-8')).hexdigest(), normalizada)
+        if len(_huellas) >= MAXIMO_HUELLAS:
+            _huellas.clear()
+        _huellas[sql] = encontrada
+    return encontrada
+
+
+def _vista():
+    request = _peticion.get()
+    coincidencia = getattr(request, 'resolver_match', None)
+    return (coincidencia.url_name or '') if coincidencia else ''
+
+
+@contextmanager
+def atribuir_a(request):
+    """Las consultas del bloque cuentan para la vista de request (subpeticiones de /api/batch/, lote.py)"""
+    token = _peticion.set(request)
+    try:
+        yield
+    finally:
+        _peticion.reset(token)
+
+
+def _ubicacion():
+    """
+    Líneas de biblioteca/ (fuera de este módulo y de los backends) en la pila de la consulta, de la más
+    interna a la externa: 'biblioteca/serializers.py:339 (data) < biblioteca/views.py:210 (buscar_libros_api)'
+    """
+    lineas = []
+    marco = sys._getframe(2)
+    while marco is not None and len(lineas) < MARCOS_UBICACION:
+        archivo = marco.f_code.co_filename
+        if archivo.startswith(_BIBLIOTECA) and not archivo.startswith(_PROPIOS):
+            lineas.append(f'biblioteca{archivo[len(_BIBLIOTECA):]}:{marco.f_lineno} ({marco.f_code.co_name})')
+        marco = marco.f_back
+    return ' < '.join(lineas)[:300]
+
+
+def registrar_consulta(execute, sql, params, many, context):
+    """execute_wrapper de Django: mide la consulta y la suma al grupo de su huella y vista"""
+    if _sin_medir.get(): #el propio volcado
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        clave, normalizada = _huella(sql)
+        vista = _vista()
+        filas = getattr(context.get('cursor'), 'rowcount', -1) #-1 si el motor no lo sabe (SELECT en SQLite)
+        lenta = duracion * 1000 >= settings.CONSULTAS_LENTAS_UMBRAL_MS
+        ubicacion = _ubicacion() if lenta else ''
+        with _candado:
+            grupo = _grupos.get((clave, vista))
+            if grupo is None:
+                grupo = _grupos[(clave, vista)] = Grupo(normalizada)
+            if lenta:
+                grupo.lentas += 1
+                if duracion > grupo.tiempo_maximo:
+                    grupo.ubicacion = ubicacion
+            grupo.agregar(duracion, filas or 0)
+        if lenta:
+            logger.warning('Consulta lenta %.1f ms en %s desde %s: %s', duracion * 1000, vista or '-', ubicacion or '-', normalizada[:500])
+
+
+@receiver(connection_created)
+def instalar_en_conexion(sender, connection, **kwargs):
+    """Agrega registrar_consulta a cada conexión nueva (una sola vez por DatabaseWrapper)"""
+    if settings.CONSULTAS_ESTADISTICAS and registrar_consulta not in connection.execute_wrappers:
+        # Al principio: si la conexión se abre dentro de un execute_wrapper() (medir()), este quita el último al salir
+        connection.execute_wrappers.insert(0, registrar_consulta)
+
+
+def _guardar(clave, vista, hora, grupo):
+    """Suma un grupo a su fila de la hora (incremento atómico con F, como ContadorPrestamos)"""
+    filtro = {'clave': clave, 'vista': vista, 'hora': hora}
+    maximo_ms = grupo.tiempo_maximo * 1000
+    cambios = {}
+    if grupo.ubicacion: #antes que tiempo_maximo_ms: MySQL evalúa el SET en orden con los valores ya asignados
+        cambios['ubicacion'] = Case(When(tiempo_maximo_ms__lt=maximo_ms, then=Value(grupo.ubicacion)), default=F('ubicacion'))
+    cambios.update({
+        'cantidad': F('cantidad') + grupo.cantidad,
+        'tiempo_total_ms': F('tiempo_total_ms') + grupo.tiempo_total * 1000,
+        'tiempo_maximo_ms': Greatest('tiempo_maximo_ms', Value(maximo_ms)),
+        'p95_ms': Greatest('p95_ms', Value(grupo.p95() * 1000)), #aproximado: el mayor p95 de los volcados de la hora
+        'filas': F('filas') + grupo.filas,
+        'lentas': F('lentas') + grupo.lentas,
+    })
+    if EstadisticaConsulta.objects.filter(**filtro).update(**cambios):
+        return
+    nueva = EstadisticaConsulta(
+        huella=grupo.huella, cantidad=grupo.cantidad, tiempo_total_ms=grupo.tiempo_total * 1000,
+        tiempo_maximo_ms=maximo_ms, p95_ms=grupo.p95() * 1000, filas=grupo.filas, lentas=grupo.lentas,
+        ubicacion=grupo.ubicacion, **filtro
+    )
+    try:
+        with transaction.atomic():
+            nueva.save()
+    except IntegrityError: #otro proceso creó la fila de la hora al mismo tiempo
+        EstadisticaConsulta.objects.filter(**filtro).update(**cambios)
+
+
+def volcar():
+    """Guarda en EstadisticaConsulta lo acumulado por este proceso y empieza de cero"""
+    global _grupos
+    with _candado:
+        grupos, _grupos = _grupos, {}
+    if not grupos:
+        return 0
+    hora = timezone.now().replace(minute=0, second=0, microsecond=0)
+    try:
+        with sin_medir():
+            for (clave, vista), grupo in grupos.items():
+                _guardar(clave, vista, hora, grupo)
+            EstadisticaConsulta.objects.filter(hora__lt=hora - timedelta(days=settings.CONSULTAS_CONSERVAR_DIAS)).delete()
+    except Exception as error: #sin tabla o sin base: se pierde este intervalo, pero la petición no falla
+        logger.error('No se pudieron guardar las estadísticas de consultas: %s', error)
+    return len(grupos)
+
+
+def volcar_si_corresponde():
+    """volcar() si pasaron CONSULTAS_VOLCAR_CADA segundos desde el último volcado del proceso"""
+    global _proximo_volcado
+    ahora = time.monotonic()
+    with _candado:
+        if ahora < _proximo_volcado:
+            return 0
+        _proximo_volcado = ahora + settings.CONSULTAS_VOLCAR_CADA
+    return volcar()
+
+
+def _debe_volcar():
+    return settings.CONSULTAS_ESTADISTICAS and time.monotonic() >= _proximo_volcado
+
+
+def ranking(horas=24, orden='tiempo_total', limite=20, vista=None):
+    """Huellas con más costo en las últimas horas, sumando las filas de todos los procesos"""
+    estadisticas = EstadisticaConsulta.objects.filter(hora__gte=timezone.now() - timedelta(hours=horas))
+    if vista is not None:
+        estadisticas = estadisticas.filter(vista=vista)
+    filas = list(estadisticas.values('clave', 'vista').annotate(
+        huella_sql=Max('huella'),
+        veces=Sum('cantidad'),
+        tiempo_total=Sum('tiempo_total_ms'),
+        maximo=Max('tiempo_maximo_ms'),
+        p95=Max('p95_ms'),
+        cantidad_filas=Sum('filas'),
+        cantidad_lentas=Sum('lentas'),
+    ).annotate(
+        promedio=Case(When(veces=0, then=Value(0.0)), default=F('tiempo_total') / F('veces'), output_field=FloatField())
+    ).order_by(ORDENES[orden], 'clave')[:limite])
+
+    # Línea de origen de la consulta más lenta de cada grupo
+    ubicaciones = {}
+    for fila in estadisticas.filter(
+        clave__in={fila['clave'] for fila in filas}
+    ).exclude(ubicacion='').order_by('tiempo_maximo_ms').values('clave', 'vista', 'ubicacion'):
+        ubicaciones[(fila['clave'], fila['vista'])] = fila['ubicacion']
+
+    return [
+        {
+            'huella': fila['huella_sql'],
+            'vista': fila['vista'],
+            'cantidad': fila['veces'],
+            'tiempo_total_ms': round(fila['tiempo_total'], 1),
+            'promedio_ms': round(fila['promedio'], 2),
+            'p95_ms': round(fila['p95'], 2),
+            'maximo_ms': round(fila['maximo'], 2),
+            'filas': fila['cantidad_filas'],
+            'lentas': fila['cantidad_lentas'],
+            'ubicacion': ubicaciones.get((fila['clave'], fila['vista']), ''),
+        }
+        for fila in filas
+    ]
+
+
+class ConsultasLentasMiddleware:
+    """Da la vista de la petición a registrar_consulta y vuelca las estadísticas al terminar (WSGI y ASGI)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._llamar_async(request)
+        token = _peticion.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        if _debe_volcar():
+            volcar_si_corresponde()
+        return response
+
+    async def _llamar_async(self, request):
+        token = _peticion.set(request) #las consultas en hilos (sync_to_async) heredan el contexto
+        try:
+            response = await self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        if _debe_volcar():
+            await sync_to_async(volcar_si_corresponde)()
+        return response
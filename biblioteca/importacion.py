@@ -0,0 +1,161 @@
+# IMPORTACIÓN MASIVA DE USUARIOS DESDE CSV
+#
+# El archivo se lee por lotes sin cargarlo completo. Por cada lote se descartan los usernames repetidos
+# (en el archivo o ya registrados), las contraseñas se encriptan en varios procesos (PBKDF2 usa una
+# CPU entera por contraseña) y los usuarios se insertan con bulk_create. Mientras se inserta un lote,
+# los procesos ya están encriptando el siguiente.
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .cache import invalidar_resultados
+from .models import Usuario
+
+COLUMNAS = ['username', 'password', 'email', 'first_name', 'last_name', 'telefono', 'rol']
+ROLES_IMPORTABLES = ['usuario', 'bibliotecario'] #los administradores se crean a mano
+MAXIMO_ERRORES = 100 #errores detallados en el resumen, el resto solo se cuenta
+
+
+def _inicializar_proceso():
+    """Cada proceso del pool necesita Django configurado para leer PASSWORD_HASHERS"""
+    if not apps.ready:
+        django.setup()
+
+
+def _encriptar(contraseñas):
+    return [make_password(contraseña) for contraseña in contraseñas]
+
+
+def _validar(fila):
+    """Devuelve los datos del usuario o lanza ValueError con el motivo"""
+    username = Usuario.normalize_username((fila.get('username') or '').strip())
+    if not username:
+        raise ValueError('username vacío')
+    if len(username) > 150:
+        raise ValueError('username de más de 150 caracteres')
+    if not fila.get('password'):
+        raise ValueError('password vacío')
+
+    email = (fila.get('email') or '').strip()
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValueError('email inválido')
+
+    rol = (fila.get('rol') or 'usuario').strip()
+    if rol not in ROLES_IMPORTABLES:
+        raise ValueError(f"rol inválido, opciones: {', '.join(ROLES_IMPORTABLES)}")
+
+    return {
+        'username': username,
+        'email': Usuario.objects.normalize_email(email),
+        'first_name': (fila.get('first_name') or '').strip()[:150],
+        'last_name': (fila.get('last_name') or '').strip()[:150],
+        'telefono': (fila.get('telefono') or '').strip()[:15],
+        'rol': rol,
+    }
+
+
+class ImportacionUsuarios:
+    """Importa usuarios de un CSV (archivo de texto abierto) y acumula el resumen"""
+
+    def __init__(self, lote=1000, procesos=None):
+        self.lote = lote
+        self.procesos = procesos or settings.IMPORTACION_PROCESOS or os.cpu_count()
+        self.resumen = {'filas': 0, 'creados': 0, 'duplicados': 0, 'con_errores': 0, 'errores': []}
+        self._vistos = set() #usernames ya leídos del archivo
+
+    def _error(self, numero, mensaje):
+        self.resumen['con_errores'] += 1
+        if len(self.resumen['errores']) < MAXIMO_ERRORES:
+            self.resumen['errores'].append({'fila': numero, 'error': mensaje})
+
+    def _lotes(self, archivo):
+        """Filas válidas y sin repetir, agrupadas de a self.lote"""
+        lector = csv.DictReader(archivo)
+        faltantes = {'username', 'password'} - set(lector.fieldnames or [])
+        if faltantes:
+            raise ValueError(f"Faltan columnas: {', '.join(sorted(faltantes))}")
+
+        lote = []
+        for numero, fila in enumerate(lector, start=2): #la fila 1 es el encabezado
+            self.resumen['filas'] += 1
+            try:
+                datos = _validar(fila)
+            except ValueError as error:
+                self._error(numero, str(error))
+                continue
+            if datos['username'] in self._vistos:
+                self.resumen['duplicados'] += 1
+                continue
+            self._vistos.add(datos['username'])
+            lote.append((datos, fila['password']))
+            if len(lote) == self.lote:
+                yield self._sin_registrados(lote)
+                lote = []
+        if lote:
+            yield self._sin_registrados(lote)
+
+    def _sin_registrados(self, lote):
+        """Quita los usernames que ya existen, con una sola consulta por lote"""
+        existentes = set(Usuario.objects.filter(
+            username__in=[datos['username'] for datos, _ in lote]
+        ).values_list('username', flat=True))
+        self.resumen['duplicados'] += len(existentes)
+        return [(datos, contraseña) for datos, contraseña in lote if datos['username'] not in existentes]
+
+    def _insertar(self, lote, contraseñas):
+        usuarios = [Usuario(password=contraseña, **datos) for (datos, _), contraseña in zip(lote, contraseñas)]
+        try:
+            with transaction.atomic():
+                Usuario.objects.bulk_create(usuarios, batch_size=500)
+            self.resumen['creados'] += len(usuarios)
+        except IntegrityError:
+            # Alguien registró uno de estos usernames mientras se encriptaba el lote
+            nombres = [usuario.username for usuario in usuarios]
+            antes = Usuario.objects.filter(username__in=nombres).count()
+            Usuario.objects.bulk_create(usuarios, batch_size=500, ignore_conflicts=True)
+            creados = Usuario.objects.filter(username__in=nombres).count() - antes
+            self.resumen['creados'] += creados
+            self.resumen['duplicados'] += len(usuarios) - creados
+
+    def _encriptar_lote(self, pool, lote):
+        contraseñas = [contraseña for _, contraseña in lote]
+        partes = max(1, len(contraseñas) // (self.procesos * 4)) #varias partes por proceso para repartir la carga
+        return [
+            pool.submit(_encriptar, contraseñas[inicio:inicio + partes])
+            for inicio in range(0, len(contraseñas), partes)
+        ]
+
+    def importar(self, archivo):
+        with ProcessPoolExecutor(max_workers=self.procesos, initializer=_inicializar_proceso) as pool:
+            anterior = None #(lote, futuros) encriptándose mientras se lee e inserta
+            for lote in self._lotes(archivo):
+                futuros = self._encriptar_lote(pool, lote)
+                if anterior:
+                    self._insertar(anterior[0], [c for futuro in anterior[1] for c in futuro.result()])
+                anterior = (lote, futuros)
+            if anterior:
+                self._insertar(anterior[0], [c for futuro in anterior[1] for c in futuro.result()])
+
+        if self.resumen['creados']:
+            invalidar_resultados() #bulk_create no envía post_save
+        return self.resumen
+
+    def importar_secuencial(self, archivo):
+        """Un usuario por vez, igual que RegistroAPI (para comparar el rendimiento)"""
+        for lote in self._lotes(archivo):
+            for datos, contraseña in lote:
+                Usuario.objects.create_user(password=contraseña, **datos)
+                self.resumen['creados'] += 1
+        return self.resumen
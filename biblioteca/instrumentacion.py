@@ -0,0 +1,325 @@
+# INSTRUMENTACIÓN POR PETICIÓN: CONSULTAS, TIEMPO DE BASE DE DATOS Y SERIALIZACIÓN
+#
+# InstrumentacionMiddleware mide cada petición cuando INSTRUMENTACION_ACTIVA es True:
+#   X-Consultas                 cantidad de consultas SQL
+#   X-Tiempo-BD-ms              tiempo total dentro de la base de datos
+#   X-Consultas-Repetidas       consultas con la misma huella (misma SQL con otros valores), típico de N+1
+#   X-Tiempo-Serializacion-ms   tiempo dentro de serializer.data (incluye las consultas que dispara)
+#   X-Tiempo-Render-ms          tiempo renderizando la respuesta de DRF (JSON)
+#   Server-Timing               lo mismo en el formato que muestran las herramientas del navegador
+#
+# PRESUPUESTOS_CONSULTAS fija el máximo de consultas por nombre de URL (biblioteca/urls.py).
+# presupuesto_consultas() sirve para pruebas y el comando verificar_presupuestos recorre las URL.
+# rutas_get() arma la ruta real de cada endpoint GET (benchmark_api y asesor_indices).
+
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.urls import URLPattern, reverse
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .models import Libro, Sucursal, Ejemplar, Prestamo, Reserva, TrabajoReporte
+from .serializers import ValoresSerializer
+
+logger = logging.getLogger('biblioteca.instrumentacion')
+
+# Máximo de consultas por nombre de URL. Las listas no dependen del tamaño de página: los serializers de values()
+# traen las relaciones en la misma consulta y los de modelo las piden con select_related (PlanRelacionesMixin).
+# La autenticación JWT no consulta la base mientras el token esté vigente (autenticacion.py); si lo hace, cuenta.
+PRESUPUESTOS_CONSULTAS = {
+    'libro-api': 3, #conteo + página + ejemplares_disponibles agrupados
+    'buscar-libros-api': 2,
+    'sucursal-api': 2,
+    'ejemplar-api': 2,
+    'ejemplar-detail-api': 1,
+    'prestamo-api': 2,
+    'prestamo-detail-api': 1,
+    'reserva-api': 2,
+    'cola-reservas-api': 4, #libro, cola y estimación de disponibilidad
+    'perfil-usuario-api': 3,
+    'tablero-usuario-api': 3,
+    'historial-prestamos-api': 1,
+    'mis-reservas-api': 4, #reservas, activas y estimación de disponibilidad de todas juntas
+    'estado-cuenta-multas-api': 2,
+    'prestamos-activos-api': 3,
+    'prestamos-vencidos-api': 1, #préstamos con usuario, libro y sucursal; las estadísticas salen de las mismas filas
+    'reportes-api': 8,
+    'libros-populares-api': 1,
+    'reporte-circulacion-api': 2,
+    'metricas-cache-api': 0,
+    'metricas-cache-objetos-api': 0,
+    'perfiles-api': 0,
+    'consultas-lentas-api': 2, #ranking y ubicaciones
+    'cambios-api': 7, #entradas + una lectura por modelo (libro con sus disponibles)
+}
+
+# Modelo del que se toma un id real para cada parámetro de la URL; pk se deduce del primer segmento
+MODELOS_PARAMETRO = {
+    'libro_id': Libro,
+    'sucursal_id': Sucursal,
+    'ejemplar_id': Ejemplar,
+    'prestamo_id': Prestamo,
+    'reserva_id': Reserva,
+    'trabajo_id': TrabajoReporte,
+}
+MODELOS_SEGMENTO = {
+    'libros': Libro,
+    'sucursales': Sucursal,
+    'ejemplares': Ejemplar,
+    'prestamos': Prestamo,
+    'reservas': Reserva,
+}
+# Parámetros GET para que el endpoint haga un trabajo representativo
+PARAMETROS_GET = {
+    'buscar-libros-api': {'q': 'libro'},
+    'reporte-circulacion-api': {'agrupar': 'mes'},
+}
+
+_medicion = contextvars.ContextVar('medicion', default=None)
+_sin_medir = contextvars.ContextVar('sin_medir', default=False)
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def huella(sql):
+    """SQL sin valores: la misma consulta con distintos parámetros tiene la misma huella"""
+    sql = _LITERALES.sub('?', sql)
+    return _LISTAS.sub('(...)', sql)
+
+
+class Medicion:
+    """Datos acumulados de una petición (o de un bloque medido con medir())"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.tiempo_serializacion = 0.0
+        self.tiempo_render = 0.0
+        self.huellas = Counter()
+        self.externa = None #medición del bloque que la contiene, si hay
+        self._serializando = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper de Django: se llama en cada consulta"""
+        if _sin_medir.get():
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_bd += time.perf_counter() - inicio
+            self.consultas += 1
+            self.huellas[huella(sql)] += 1
+
+    def repetidas(self):
+        """Huellas ejecutadas más de una vez, de la más repetida a la menos"""
+        return [(sql, veces) for sql, veces in self.huellas.most_common() if veces > 1]
+
+    def cabeceras(self, tiempo_total):
+        return {
+            'X-Consultas': str(self.consultas),
+            'X-Tiempo-BD-ms': f'{self.tiempo_bd * 1000:.1f}',
+            'X-Consultas-Repetidas': str(sum(veces - 1 for _, veces in self.repetidas())),
+            'X-Tiempo-Serializacion-ms': f'{self.tiempo_serializacion * 1000:.1f}',
+            'X-Tiempo-Render-ms': f'{self.tiempo_render * 1000:.1f}',
+            'Server-Timing': (
+                f'db;dur={self.tiempo_bd * 1000:.1f};desc="{self.consultas} consultas", '
+                f'ser;dur={self.tiempo_serializacion * 1000:.1f}, render;dur={self.tiempo_render * 1000:.1f}, '
+                f'total;dur={tiempo_total * 1000:.1f}'
+            ),
+        }
+
+
+@contextmanager
+def medir():
+    """
+    Mide las consultas ejecutadas dentro del bloque en todas las bases configuradas.
+    Se puede anidar: los tiempos de serialización y render del bloque interno también suman al externo.
+    """
+    externa = _medicion.get()
+    medicion = Medicion()
+    medicion.externa = externa
+    token = _medicion.set(medicion)
+    try:
+        with ExitStack() as pila:
+            for alias in connections:
+                pila.enter_context(connections[alias].execute_wrapper(medicion))
+            yield medicion
+    finally:
+        _medicion.reset(token)
+        if externa is not None: #las consultas ya las contó su propio execute_wrapper
+            externa.tiempo_serializacion += medicion.tiempo_serializacion
+            externa.tiempo_render += medicion.tiempo_render
+
+
+@contextmanager
+def medir_en_hilo():
+    """
+    Para un hilo que ejecuta parte de la petición con su contexto copiado (lote.py): medir() solo envuelve
+    las conexiones del hilo que lo abrió, así que aquí se envuelven las del hilo actual con las mediciones activas.
+    """
+    with ExitStack() as pila:
+        medicion = _medicion.get()
+        while medicion is not None:
+            for alias in connections:
+                pila.enter_context(connections[alias].execute_wrapper(medicion))
+            medicion = medicion.externa
+        yield
+
+
+@contextmanager
+def sin_medir():
+    """Las consultas del bloque no cuentan en las mediciones (p. ej. el volcado de consultas_lentas)"""
+    token = _sin_medir.set(True)
+    try:
+        yield
+    finally:
+        _sin_medir.reset(token)
+
+
+def _medir_data(propiedad):
+    """Envuelve serializer.data para sumar su tiempo a la medición activa"""
+    def data(self):
+        medicion = _medicion.get()
+        if medicion is None or medicion._serializando: #sin medición o serializer anidado
+            return propiedad.fget(self)
+        medicion._serializando += 1
+        inicio = time.perf_counter()
+        try:
+            return propiedad.fget(self)
+        finally:
+            medicion.tiempo_serializacion += time.perf_counter() - inicio
+            medicion._serializando -= 1
+    return property(data)
+
+
+def _medir_render(propiedad):
+    """Envuelve Response.rendered_content para sumar el tiempo de renderizado a la medición activa"""
+    def rendered_content(self):
+        medicion = _medicion.get()
+        if medicion is None:
+            return propiedad.fget(self)
+        inicio = time.perf_counter()
+        try:
+            return propiedad.fget(self)
+        finally:
+            medicion.tiempo_render += time.perf_counter() - inicio
+    return property(rendered_content)
+
+
+def instalar_mediciones():
+    """Mide serializer.data y el render de DRF; se instala una sola vez, al crear el middleware que lo usa"""
+    for clase in (serializers.Serializer, serializers.ListSerializer, ValoresSerializer):
+        if not getattr(clase.data, '_medido', False):
+            clase.data = _medir_data(clase.data)
+            clase.data.fget._medido = True
+    if not getattr(Response.rendered_content, '_medido', False):
+        Response.rendered_content = _medir_render(Response.rendered_content)
+        Response.rendered_content.fget._medido = True
+
+
+class InstrumentacionMiddleware:
+    """Agrega a la respuesta las cabeceras de consultas y tiempos (si INSTRUMENTACION_ACTIVA), en WSGI y ASGI"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activa = settings.INSTRUMENTACION_ACTIVA
+        if self.activa:
+            instalar_mediciones()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._llamar_async(request)
+        if not self.activa:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with medir() as medicion:
+            response = self.get_response(request)
+        return self._completar(request, response, medicion, inicio)
+
+    async def _llamar_async(self, request):
+        if not self.activa:
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        with medir() as medicion: #las conexiones son las mismas en los hilos de sync_to_async
+            response = await self.get_response(request)
+        return self._completar(request, response, medicion, inicio)
+
+    def _completar(self, request, response, medicion, inicio):
+        for nombre, valor in medicion.cabeceras(time.perf_counter() - inicio).items():
+            response[nombre] = valor
+
+        nombre_url = request.resolver_match.url_name if request.resolver_match else None
+        presupuesto = PRESUPUESTOS_CONSULTAS.get(nombre_url) if request.method == 'GET' else None #los presupuestos son de las lecturas
+        if presupuesto is not None and medicion.consultas > presupuesto:
+            response['X-Presupuesto-Consultas'] = f'excedido {medicion.consultas}/{presupuesto}'
+            logger.warning(
+                '%s usó %d consultas (presupuesto %d). Más repetidas: %s',
+                nombre_url, medicion.consultas, presupuesto, medicion.repetidas()[:3]
+            )
+        return response
+
+
+def rutas_get(solo=None):
+    """
+    (nombre, ruta, parámetros GET, motivo) por cada URL de biblioteca/urls.py.
+    Los parámetros de la ruta se completan con ids existentes; si el endpoint no acepta GET
+    o faltan datos, ruta es None y motivo lo explica.
+    """
+    from . import urls #import tardío: urls importa las vistas
+
+    for patron in urls.urlpatterns:
+        if not isinstance(patron, URLPattern) or (solo and patron.name not in solo):
+            continue
+        vista = patron.callback.cls
+        if not hasattr(vista, 'get'):
+            metodos = [m.upper() for m in vista.http_method_names if hasattr(vista, m) and m not in ('options', 'head')]
+            yield patron.name, None, None, f'solo {", ".join(metodos)}'
+            continue
+
+        parametros = {}
+        for parametro in patron.pattern.converters:
+            modelo = MODELOS_PARAMETRO.get(parametro) or MODELOS_SEGMENTO.get(str(patron.pattern).split('/')[0])
+            id_ = modelo.objects.order_by('id').values_list('id', flat=True).first() if modelo else None
+            if id_ is None:
+                yield patron.name, None, None, f'sin datos para {parametro}'
+                break
+            parametros[parametro] = id_
+        else:
+            yield patron.name, reverse(patron.name, kwargs=parametros), PARAMETROS_GET.get(patron.name, {}), ''
+
+
+class PresupuestoExcedido(AssertionError):
+    """Un endpoint usó más consultas que su presupuesto (AssertionError para que falle una prueba)"""
+
+
+@contextmanager
+def presupuesto_consultas(nombre_url, maximo=None):
+    """
+    Para pruebas:
+        with presupuesto_consultas('libro-api'):
+            cliente.get(reverse('libro-api'))
+    Falla si el bloque ejecuta más consultas que el presupuesto declarado (o que maximo).
+    """
+    maximo = PRESUPUESTOS_CONSULTAS[nombre_url] if maximo is None else maximo
+    with medir() as medicion:
+        yield medicion
+    if medicion.consultas > maximo:
+        repetidas = '\n'.join(f'  {veces}x {sql[:200]}' for sql, veces in medicion.repetidas()[:5])
+        raise PresupuestoExcedido(
+            f'{nombre_url} usó {medicion.consultas} consultas, presupuesto {maximo}\n{repetidas}'
+        )
@@ -0,0 +1,171 @@
+# PETICIONES EN LOTE (POST /api/batch/)
+#
+# Los kioscos y la app móvil piden en cada pantalla muchas cosas chicas (disponibilidad de 20 libros, la
+# posición de cada reserva...). Con el lote mandan todas en un solo POST:
+#   {"peticiones": [{"id": "d1", "ruta": "/api/libros/3/disponibilidad/"},
+#                   {"id": "r1", "metodo": "POST", "ruta": "/api/reservas/", "cuerpo": {"libro_id": 3}}],
+#    "concurrente": true}
+# y reciben {"respuestas": [{"id": "d1", "estado": 200, "cuerpo": {...}}, ...]} en el mismo orden.
+#
+# Cada subpetición llama directamente a la vista de su ruta (solo rutas de urls.py, sin anidar lotes):
+# no pasa otra vez por los middlewares ni por la autenticación JWT. Comparten con la petición del lote el
+# usuario autenticado (y lo que ya cargó), la medición de consultas y las cachés del proceso. Cada una tiene
+# su estado de réplicas (replicas.subpeticion): el lote marca al usuario como que escribió solo si alguna
+# subpetición escribió. Los permisos de cada vista se revisan igual que fuera del lote.
+# Con "concurrente" los GET seguidos se ejecutan en hilos (hasta LOTE_HILOS, cada uno con su conexión);
+# las escrituras se ejecutan solas y en orden, así lo que se lee después ya ve lo que escribieron.
+
+import contextvars
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from . import consultas_lentas, replicas
+from .instrumentacion import medir_en_hilo
+
+logger = logging.getLogger('biblioteca.lote')
+
+METODOS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+RUTA_LOTE = 'lote-api' #no se puede pedir un lote dentro de otro
+_rutas = None #nombres de URL de urls.py que acepta el lote
+
+
+def _rutas_permitidas():
+    global _rutas
+    if _rutas is None:
+        from . import urls #import tardío: urls importa las vistas
+        _rutas = {patron.name for patron in urls.urlpatterns if patron.name} - {RUTA_LOTE}
+    return _rutas
+
+
+def validar(peticiones):
+    """Lista de subpeticiones normalizadas (id, metodo, ruta, cuerpo); ValueError con el motivo si no sirve"""
+    if not isinstance(peticiones, list) or not peticiones:
+        raise ValueError("Debe enviar una lista 'peticiones' con ruta y, opcionalmente, id, metodo y cuerpo")
+    if len(peticiones) > settings.LOTE_MAXIMO:
+        raise ValueError(f'Máximo {settings.LOTE_MAXIMO} peticiones por lote')
+
+    normalizadas = []
+    for numero, peticion in enumerate(peticiones):
+        if not isinstance(peticion, dict) or not isinstance(peticion.get('ruta'), str) or not peticion['ruta'].startswith('/'):
+            raise ValueError(f"La petición {numero} debe tener una 'ruta' que empiece con /")
+        metodo = str(peticion.get('metodo', 'GET')).upper()
+        if metodo not in METODOS:
+            raise ValueError(f"La petición {numero} tiene un método no permitido: {metodo} (usar {', '.join(METODOS)})")
+        normalizadas.append({
+            'id': peticion.get('id', numero),
+            'metodo': metodo,
+            'ruta': peticion['ruta'],
+            'cuerpo': peticion.get('cuerpo'),
+        })
+    return normalizadas
+
+
+def _subpeticion(request, peticion, coincidencia):
+    """WSGIRequest de la subpetición con las cabeceras del lote y el usuario ya autenticado"""
+    partes = urlsplit(peticion['ruta'])
+    cuerpo = b'' if peticion['cuerpo'] is None else json.dumps(peticion['cuerpo']).encode('utf-8')
+    entorno = {
+        clave: valor for clave, valor in request.META.items()
+        if clave.startswith('HTTP_') or clave in ('SERVER_NAME', 'SERVER_PORT', 'REMOTE_ADDR', 'SCRIPT_NAME')
+    }
+    entorno.update({
+        'REQUEST_METHOD': peticion['metodo'],
+        'PATH_INFO': partes.path,
+        'QUERY_STRING': partes.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.url_scheme': request.scheme, #los enlaces de paginación apuntan a la URL real
+    })
+    subpeticion = WSGIRequest(entorno)
+    subpeticion.resolver_match = coincidencia
+    subpeticion._force_auth_user = request.user #DRF usa ForcedAuthentication: no se vuelve a validar el JWT
+    subpeticion._force_auth_token = request.auth
+    return subpeticion
+
+
+def _cuerpo(respuesta):
+    if hasattr(respuesta, 'data'): #Response de DRF: se renderiza una sola vez, con el lote
+        return respuesta.data
+    if respuesta.streaming:
+        if hasattr(respuesta, 'file_to_stream'):
+            respuesta.file_to_stream.close()
+        return 'La respuesta es un archivo, pedirla fuera del lote'
+    contenido = respuesta.content.decode(respuesta.charset)
+    if respuesta.get('Content-Type', '').startswith('application/json'):
+        return json.loads(contenido)
+    return contenido
+
+
+def ejecutar(request, peticion):
+    """Llama a la vista de la subpetición y devuelve {'id', 'estado', 'cuerpo'}"""
+    ruta = urlsplit(peticion['ruta']).path
+    try:
+        coincidencia = resolve(ruta)
+    except Resolver404:
+        coincidencia = None
+    if coincidencia is None or coincidencia.namespace or coincidencia.url_name not in _rutas_permitidas():
+        return {'id': peticion['id'], 'estado': 404, 'cuerpo': f'Ruta no disponible en el lote: {ruta}'}
+
+    subpeticion = _subpeticion(request, peticion, coincidencia)
+    try:
+        with replicas.subpeticion(subpeticion) as estado, consultas_lentas.atribuir_a(subpeticion):
+            respuesta = coincidencia.func(subpeticion, *coincidencia.args, **coincidencia.kwargs)
+            cuerpo = _cuerpo(respuesta)
+            if peticion['metodo'] != 'GET' and respuesta.status_code < 400:
+                estado['escribio'] = True #como una petición suelta: el usuario lee del primario un rato
+    except Exception:
+        logger.exception('Error en la subpetición %s %s del lote', peticion['metodo'], peticion['ruta'])
+        return {'id': peticion['id'], 'estado': 500, 'cuerpo': 'Error interno'}
+    return {'id': peticion['id'], 'estado': respuesta.status_code, 'cuerpo': cuerpo}
+
+
+def _ejecutar_en_hilo(request, peticion):
+    """ejecutar() en un hilo del pool: mide sus consultas y devuelve su conexión al terminar"""
+    try:
+        with medir_en_hilo():
+            return ejecutar(request, peticion)
+    finally:
+        connections.close_all() #con el pool (backends/pool.py) la conexión vuelve al pool
+
+
+def _grupos(peticiones):
+    """GET seguidos en un mismo grupo; cada escritura en un grupo propio"""
+    grupo = []
+    for peticion in peticiones:
+        if peticion['metodo'] != 'GET':
+            if grupo:
+                yield grupo
+                grupo = []
+            yield [peticion]
+        else:
+            grupo.append(peticion)
+    if grupo:
+        yield grupo
+
+
+def ejecutar_lote(request, peticiones, concurrente=False):
+    """Respuestas de las subpeticiones (ya validadas) en el mismo orden"""
+    if not concurrente:
+        return [ejecutar(request, peticion) for peticion in peticiones]
+
+    respuestas = []
+    with ThreadPoolExecutor(max_workers=settings.LOTE_HILOS, thread_name_prefix='lote') as hilos:
+        for grupo in _grupos(peticiones):
+            if len(grupo) == 1:
+                respuestas.append(ejecutar(request, grupo[0]))
+                continue
+            futuros = [ #cada hilo con su copia del contexto: medición y vista de consultas_lentas
+                hilos.submit(contextvars.copy_context().run, _ejecutar_en_hilo, request, peticion)
+                for peticion in grupo
+            ]
+            respuestas.extend(futuro.result() for futuro in futuros)
+    return respuestas
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from biblioteca.cache import invalidar_resultados
+from biblioteca.models import CirculacionDiaria
+
+
+class Command(BaseCommand):
+    """Actualiza incrementalmente la tabla CirculacionDiaria desde la última marca"""
+    help = 'Actualiza las tablas diarias de circulación (préstamos, devoluciones, vencidos, multas y reservas)'
+
+    def handle(self, *args, **options):
+        total = CirculacionDiaria.actualizar()
+        invalidar_resultados(modelo=CirculacionDiaria) #los reportes de circulación en caché quedaron desactualizados
+        self.stdout.write(self.style.SUCCESS(f'{total} filas diarias de circulación recalculadas'))
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from biblioteca.cache import invalidar_resultados
+from biblioteca.instrumentacion import huella, rutas_get
+from biblioteca.models import Usuario
+
+
+class Captura:
+    """execute_wrapper que guarda cada SELECT con sus parámetros, una vez por huella"""
+
+    def __init__(self):
+        self.consultas = {} #huella -> (sql, params)
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.consultas.setdefault(huella(sql), (sql, params))
+        return execute(sql, params, many, context)
+
+
+def problemas_mysql(cursor, sql, params, minimo_filas):
+    """EXPLAIN de MySQL: type=ALL es una lectura completa de la tabla; Extra indica filesort y temporales"""
+    cursor.execute('EXPLAIN ' + sql, params)
+    columnas = [columna[0].lower() for columna in cursor.description]
+    problemas = []
+    for fila in cursor.fetchall():
+        plan = dict(zip(columnas, fila))
+        filas = plan.get('rows') or 0
+        extra = plan.get('extra') or ''
+        if plan.get('type') == 'ALL' and filas >= minimo_filas:
+            problemas.append(f"lectura completa de {plan['table']} (~{filas} filas)")
+        if 'Using filesort' in extra and filas >= minimo_filas:
+            problemas.append(f"filesort en {plan['table']} (~{filas} filas)")
+        if 'Using temporary' in extra and filas >= minimo_filas:
+            problemas.append(f"tabla temporal en {plan['table']}")
+    return problemas
+
+
+def problemas_sqlite(cursor, sql, params, minimo_filas):
+    """EXPLAIN QUERY PLAN de SQLite: SCAN sin índice es una lectura completa, TEMP B-TREE es un ordenamiento"""
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    problemas = []
+    for fila in cursor.fetchall():
+        detalle = fila[-1]
+        if detalle.startswith('SCAN ') and 'INDEX' not in detalle:
+            problemas.append(f'lectura completa: {detalle}')
+        elif 'USE TEMP B-TREE' in detalle:
+            problemas.append(f'ordenamiento sin índice: {detalle}')
+    return problemas
+
+
+EXPLICADORES = {'mysql': problemas_mysql, 'sqlite': problemas_sqlite}
+
+
+class Command(BaseCommand):
+    """Captura las consultas de cada endpoint GET, ejecuta EXPLAIN y avisa de lecturas completas y ordenamientos"""
+    help = 'Revisa con EXPLAIN si las consultas de cada endpoint usan índices (ejecutar con datos de generar_datos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Username con el que se hacen las peticiones (por defecto el primer administrador)')
+        parser.add_argument('--url', action='append', help='Revisar solo estos nombres de URL')
+        parser.add_argument('--minimo-filas', type=int, default=1000,
+                            help='MySQL: no avisar de lecturas completas en tablas estimadas más chicas que esto')
+        parser.add_argument('--estricto', action='store_true', help='Terminar con error si hay avisos')
+
+    def handle(self, *args, **options):
+        explicar = EXPLICADORES.get(connection.vendor)
+        if explicar is None:
+            raise CommandError(f'EXPLAIN no soportado para {connection.vendor}, usar MySQL o SQLite')
+
+        if options['usuario']:
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = Usuario.objects.filter(rol='administrador').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para hacer las peticiones')
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        avisos = 0
+        revisadas = set() #una consulta compartida por varios endpoints se informa una vez
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            for nombre, ruta, datos, motivo in rutas_get(options['url']):
+                if ruta is None:
+                    continue
+                invalidar_resultados() #con la caché llena el endpoint no consulta la base
+                captura = Captura()
+                with connection.execute_wrapper(captura):
+                    cliente.get(ruta, datos)
+
+                lineas = []
+                with connection.cursor() as cursor:
+                    for clave, (sql, params) in captura.consultas.items():
+                        if clave in revisadas:
+                            continue
+                        revisadas.add(clave)
+                        for problema in explicar(cursor, sql, params, options['minimo_filas']):
+                            lineas.append(f'    {problema}\n      {sql[:300]}')
+                if lineas:
+                    avisos += len(lineas)
+                    self.stdout.write(self.style.WARNING(f'{nombre} ({len(captura.consultas)} consultas distintas)'))
+                    self.stdout.write('\n'.join(lineas))
+                else:
+                    self.stdout.write(f'{nombre:30} ok ({len(captura.consultas)} consultas distintas)')
+            transaction.set_rollback(True)
+
+        if avisos and options['estricto']:
+            raise CommandError(f'{avisos} consultas sin índice adecuado')
+        self.stdout.write(self.style.SUCCESS(f'{avisos} avisos') if not avisos else f'{avisos} avisos')
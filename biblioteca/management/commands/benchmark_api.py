@@ -0,0 +1,124 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from biblioteca.cache import invalidar_resultados
+from biblioteca.instrumentacion import medir, rutas_get
+from biblioteca.models import Usuario
+
+
+def percentil(valores, p):
+    """Percentil por el rango más cercano sobre valores ordenados"""
+    indice = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[indice]
+
+
+class Command(BaseCommand):
+    """Llama muchas veces a cada endpoint GET de biblioteca/urls.py y mide latencia, rendimiento y consultas"""
+    help = 'Benchmark de la API: peticiones/s, p50/p95/p99 y consultas por endpoint, con comparación contra una línea base'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=50, help='Peticiones medidas por endpoint')
+        parser.add_argument('--calentamiento', type=int, default=5, help='Peticiones previas que no se miden')
+        parser.add_argument('--usuario', help='Username con el que se hacen las peticiones (por defecto el primer administrador)')
+        parser.add_argument('--url', action='append', help='Medir solo estos nombres de URL')
+        parser.add_argument('--sin-cache', action='store_true', help='Vaciar la caché de resultados antes de cada petición')
+        parser.add_argument('--guardar', help='Guardar los resultados como línea base en este archivo JSON')
+        parser.add_argument('--comparar', help='Comparar con una línea base guardada antes y fallar si hay regresiones')
+        parser.add_argument('--tolerancia', type=float, default=0.25, help='Aumento de p95 permitido (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = Usuario.objects.filter(rol='administrador').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para hacer las peticiones')
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        resultados = {}
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            for nombre, ruta, datos, motivo in rutas_get(options['url']):
+                if ruta is None:
+                    self.stdout.write(self.style.WARNING(f'{nombre:30} omitido: {motivo}'))
+                    continue
+                resultados[nombre] = self.medir_endpoint(cliente, ruta, datos, options)
+                self.escribir(nombre, resultados[nombre])
+            transaction.set_rollback(True) #los GET no deberían escribir, por las dudas no se guarda nada
+
+        if options['guardar']:
+            archivo = Path(options['guardar'])
+            archivo.parent.mkdir(parents=True, exist_ok=True)
+            archivo.write_text(json.dumps(resultados, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Línea base guardada en {archivo}'))
+
+        if options['comparar']:
+            self.comparar(resultados, options['comparar'], options['tolerancia'])
+
+    def medir_endpoint(self, cliente, ruta, datos, options):
+        for _ in range(options['calentamiento']):
+            cliente.get(ruta, datos)
+
+        tiempos, consultas = [], []
+        inicio_total = time.perf_counter()
+        for _ in range(options['iteraciones']):
+            if options['sin_cache']:
+                invalidar_resultados()
+            with medir() as medicion:
+                inicio = time.perf_counter()
+                respuesta = cliente.get(ruta, datos)
+                tiempos.append(time.perf_counter() - inicio)
+            consultas.append(medicion.consultas)
+        total = time.perf_counter() - inicio_total
+
+        tiempos.sort()
+        return {
+            'ruta': ruta,
+            'estado': respuesta.status_code,
+            'peticiones_por_segundo': round(len(tiempos) / total, 1),
+            'p50_ms': round(percentil(tiempos, 50) * 1000, 2),
+            'p95_ms': round(percentil(tiempos, 95) * 1000, 2),
+            'p99_ms': round(percentil(tiempos, 99) * 1000, 2),
+            'media_ms': round(statistics.mean(tiempos) * 1000, 2),
+            'consultas': max(consultas),
+        }
+
+    def escribir(self, nombre, resultado):
+        estilo = self.style.ERROR if resultado['estado'] >= 400 else str
+        self.stdout.write(estilo(
+            f"{nombre:30} {resultado['estado']}  {resultado['peticiones_por_segundo']:8.1f} pet/s  "
+            f"p50 {resultado['p50_ms']:7.2f}  p95 {resultado['p95_ms']:7.2f}  p99 {resultado['p99_ms']:7.2f} ms  "
+            f"{resultado['consultas']:3d} consultas"
+        ))
+
+    def comparar(self, resultados, archivo, tolerancia):
+        """Regresión: más consultas que la línea base o p95 más lento que la tolerancia"""
+        try:
+            base = json.loads(Path(archivo).read_text())
+        except (OSError, ValueError) as error:
+            raise CommandError(f'No se pudo leer la línea base {archivo}: {error}')
+
+        regresiones = []
+        for nombre, actual in resultados.items():
+            anterior = base.get(nombre)
+            if anterior is None:
+                continue
+            if actual['consultas'] > anterior['consultas']:
+                regresiones.append(f"{nombre}: {anterior['consultas']} -> {actual['consultas']} consultas")
+            if actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+                regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} -> {actual['p95_ms']} ms")
+            if actual['estado'] != anterior['estado']:
+                regresiones.append(f"{nombre}: estado {anterior['estado']} -> {actual['estado']}")
+
+        if regresiones:
+            for regresion in regresiones:
+                self.stdout.write(self.style.ERROR(regresion))
+            raise CommandError(f'{len(regresiones)} regresiones respecto de {archivo}')
+        self.stdout.write(self.style.SUCCESS(f'Sin regresiones respecto de {archivo}'))
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from biblioteca.autenticacion import tokens_para
+from biblioteca.models import Usuario, Libro
+from .benchmark_api import percentil
+
+# Endpoint -> ruta bajo /api/ (WSGI, DRF) y /api/async/ (ASGI); {libro} es el libro con más reservas
+RUTAS = {
+    'libros': 'libros/',
+    'buscar': 'libros/buscar/?disponible=true',
+    'disponibilidad': 'libros/{libro}/disponibilidad/',
+    'cola': 'reservas/cola/{libro}/',
+    'tablero': 'usuarios/tablero/',
+}
+
+
+class Command(BaseCommand):
+    """Lanza las mismas peticiones concurrentes contra los endpoints DRF (WSGI) y sus versiones async (ASGI)"""
+    help = 'Compara peticiones/s y p50/p95/p99 de los endpoints de lectura servidos por WSGI con hilos y por ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=200, help='Peticiones por endpoint y servidor')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos del worker WSGI (como gunicorn --threads)')
+        parser.add_argument('--concurrencia', type=int, default=50, help='Clientes simultáneos contra cada servidor')
+        parser.add_argument('--latencia-bd', type=float, default=0, help='Milisegundos extra por consulta, para simular MySQL en red')
+        parser.add_argument('--url', action='append', choices=list(RUTAS), help='Medir solo estos endpoints')
+        parser.add_argument('--usuario', help='Username con el que se hacen las peticiones (por defecto el primer administrador)')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor == 'sqlite' and connections['default'].is_in_memory_db():
+            raise CommandError('Las peticiones concurrentes necesitan MySQL o SQLite en archivo')
+        if options['usuario']:
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = Usuario.objects.filter(rol='administrador').first()
+        libro = Libro.objects.filter(activo=True).annotate(
+            cantidad=Count('reservas')
+        ).order_by('-cantidad').values_list('id', flat=True).first()
+        if usuario is None or libro is None:
+            raise CommandError('Faltan datos: se necesita un usuario y al menos un libro (ver generar_datos)')
+
+        self.autorizacion = f'Bearer {tokens_para(usuario).access_token}' #token real: mide también la autenticación
+        latencia = options['latencia_bd'] / 1000
+
+        def dormir(execute, sql, params, many, context):
+            time.sleep(latencia) #la espera de red de cada consulta
+            return execute(sql, params, many, context)
+
+        def agregar_latencia(sender, connection, **kwargs):
+            if dormir not in connection.execute_wrappers:
+                connection.execute_wrappers.append(dormir)
+
+        if latencia:
+            connection_created.connect(agregar_latencia)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                for nombre in options['url'] or RUTAS:
+                    ruta = RUTAS[nombre].format(libro=libro)
+                    wsgi = self.medir_wsgi('/api/' + ruta, options)
+                    asgi = asyncio.run(self.medir_asgi('/api/async/' + ruta, options))
+                    self.escribir(nombre, 'WSGI', wsgi)
+                    self.escribir(nombre, 'ASGI', asgi)
+        finally:
+            connection_created.disconnect(agregar_latencia)
+
+    def medir_wsgi(self, ruta, options):
+        aplicacion = WSGIHandler()
+        camino, _, query = ruta.partition('?')
+        worker = threading.Semaphore(options['hilos']) #el resto de los clientes espera en la cola del servidor
+
+        def peticion(_):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': camino, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'benchmark', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'benchmark', 'HTTP_AUTHORIZATION': self.autorizacion,
+                'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+            }
+            estado = []
+            inicio = time.perf_counter()
+            with worker:
+                respuesta = aplicacion(environ, lambda status, headers: estado.append(int(status.split()[0])))
+                b''.join(respuesta)
+                respuesta.close() #dispara request_finished, que cierra la conexión como en un servidor real
+            return time.perf_counter() - inicio, estado[0]
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrencia']) as clientes:
+            resultados = list(clientes.map(peticion, range(options['peticiones'])))
+        return self.resumir(resultados, time.perf_counter() - inicio)
+
+    async def medir_asgi(self, ruta, options):
+        aplicacion = ASGIHandler()
+        camino, _, query = ruta.partition('?')
+        limite = asyncio.Semaphore(options['concurrencia'])
+
+        async def peticion():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': camino, 'root_path': '', 'query_string': query.encode(), 'server': ('benchmark', 80),
+                'headers': [(b'host', b'benchmark'), (b'authorization', self.autorizacion.encode())],
+            }
+            cuerpo_enviado = asyncio.Event()
+            estado = []
+
+            async def recibir():
+                if not cuerpo_enviado.is_set():
+                    cuerpo_enviado.set()
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Event().wait() #el cliente nunca se desconecta
+
+            async def enviar(mensaje):
+                if mensaje['type'] == 'http.response.start':
+                    estado.append(mensaje['status'])
+
+            async with limite:
+                inicio = time.perf_counter()
+                await aplicacion(scope, recibir, enviar)
+                return time.perf_counter() - inicio, estado[0]
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(peticion() for _ in range(options['peticiones'])))
+        return self.resumir(resultados, time.perf_counter() - inicio)
+
+    @staticmethod
+    def resumir(resultados, duracion):
+        tiempos = sorted(tiempo for tiempo, _ in resultados)
+        return {
+            'peticiones_por_segundo': round(len(tiempos) / duracion, 1),
+            'p50_ms': round(percentil(tiempos, 50) * 1000, 2),
+            'p95_ms': round(percentil(tiempos, 95) * 1000, 2),
+            'p99_ms': round(percentil(tiempos, 99) * 1000, 2),
+            'errores': sum(1 for _, estado in resultados if estado >= 400),
+        }
+
+    def escribir(self, nombre, servidor, resultado):
+        estilo = self.style.ERROR if resultado['errores'] else str
+        self.stdout.write(estilo(
+            f"{nombre:15} {servidor}  {resultado['peticiones_por_segundo']:8.1f} pet/s  "
+            f"p50 {resultado['p50_ms']:8.2f}  p95 {resultado['p95_ms']:8.2f}  p99 {resultado['p99_ms']:8.2f} ms  "
+            f"{resultado['errores']} errores"
+        ))
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from biblioteca.autenticacion import JWTAutenticacionCacheada, tokens_para
+from biblioteca.models import Usuario
+
+
+class Command(BaseCommand):
+    """Compara las consultas y el tiempo de autenticación de JWTAuthentication y JWTAutenticacionCacheada"""
+    help = 'Mide la autenticación JWT por petición con y sin la caché de usuarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=2000, help='Peticiones simuladas por variante')
+        parser.add_argument('--usuarios', type=int, default=50, help='Usuarios distintos que firman las peticiones')
+
+    def handle(self, *args, **options):
+        usuarios = list(Usuario.objects.filter(is_active=True)[:options['usuarios']])
+        if not usuarios:
+            raise CommandError('No hay usuarios activos, cree algunos o ejecute generar_datos')
+
+        factory = APIRequestFactory()
+        variantes = [
+            ('JWTAuthentication (token sin claims)', JWTAuthentication(),
+             [str(RefreshToken.for_user(u).access_token) for u in usuarios]),
+            ('JWTAutenticacionCacheada (token sin claims)', JWTAutenticacionCacheada(),
+             [str(RefreshToken.for_user(u).access_token) for u in usuarios]),
+            ('JWTAutenticacionCacheada (token con claims)', JWTAutenticacionCacheada(),
+             [str(tokens_para(u).access_token) for u in usuarios]),
+        ]
+
+        for nombre, autenticador, tokens in variantes:
+            peticiones = [
+                factory.get('/api/libros/', HTTP_AUTHORIZATION=f'Bearer {tokens[i % len(tokens)]}')
+                for i in range(options['peticiones'])
+            ]
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                for peticion in peticiones:
+                    usuario, _ = autenticador.authenticate(peticion)
+                    usuario.rol #lo que leen casi todas las vistas
+                duracion = time.perf_counter() - inicio
+
+            total = options['peticiones']
+            self.stdout.write(
+                f'{nombre:45} {len(consultas) / total:6.3f} consultas/petición '
+                f'{duracion / total * 1e6:8.1f} µs/petición'
+            )
@@ -0,0 +1,43 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from biblioteca.importacion import ImportacionUsuarios
+
+
+class Command(BaseCommand):
+    """Compara la importación secuencial con la paralela sobre un CSV generado (no guarda nada)"""
+    help = 'Mide usuarios por segundo registrando de a uno y con la importación en lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=500, help='Filas del CSV generado')
+        parser.add_argument('--procesos', type=int, default=None)
+
+    def _csv(self, prefijo, cantidad):
+        texto = 'username,password,email,first_name\n' + ''.join(
+            f'{prefijo}{i},clave-{i}-segura,{prefijo}{i}@ejemplo.com,Alumno {i}\n' for i in range(cantidad)
+        )
+        return io.StringIO(texto)
+
+    def handle(self, *args, **options):
+        cantidad = options['usuarios']
+        variantes = [
+            ('secuencial (create_user)', 'bench_sec_', lambda imp, archivo: imp.importar_secuencial(archivo)),
+            ('lote + pool de procesos', 'bench_par_', lambda imp, archivo: imp.importar(archivo)),
+        ]
+        velocidades = []
+        for nombre, prefijo, importar in variantes:
+            importacion = ImportacionUsuarios(procesos=options['procesos'])
+            with transaction.atomic():
+                inicio = time.perf_counter()
+                resumen = importar(importacion, self._csv(prefijo, cantidad))
+                duracion = time.perf_counter() - inicio
+                transaction.set_rollback(True) #no dejar los usuarios de prueba
+            velocidades.append(resumen['creados'] / duracion)
+            self.stdout.write(f'{nombre:28} {resumen["creados"]} usuarios en {duracion:6.2f} s  {velocidades[-1]:8.1f} usuarios/s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Aceleración: {velocidades[1] / velocidades[0]:.1f}x con {importacion.procesos} procesos'
+        ))
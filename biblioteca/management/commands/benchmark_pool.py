@@ -0,0 +1,63 @@
+import threading
+import time
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from biblioteca.backends.pool import estado_pools
+
+# Backend de Django y backend con pool para cada motor
+BACKENDS = {
+    'mysql': ('django.db.backends.mysql', 'biblioteca.backends.mysql'),
+    'sqlite': ('django.db.backends.sqlite3', 'biblioteca.backends.sqlite3'),
+}
+
+
+class Command(BaseCommand):
+    """Simula peticiones (conectar, consultar, cerrar) con y sin pool sobre la base configurada"""
+    help = 'Compara conexiones abiertas y tiempo por petición del backend normal y el backend con pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=2000, help='Peticiones por hilo')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos concurrentes, como los threads de un worker')
+        parser.add_argument('--alias', default='default')
+
+    def handle(self, *args, **options):
+        base = connections[options['alias']]
+        if base.vendor not in BACKENDS or (base.vendor == 'sqlite' and base.is_in_memory_db()):
+            raise CommandError(f'Benchmark solo para MySQL o SQLite en archivo, no para {base.vendor}')
+
+        total = options['peticiones'] * options['hilos']
+        for nombre, motor in zip(('sin pool', 'con pool'), BACKENDS[base.vendor]):
+            ajustes = deepcopy(base.settings_dict)
+            ajustes['ENGINE'] = motor
+            ajustes['CONN_MAX_AGE'] = 0 #como en producción: cada petición cierra su conexión
+            alias = f'benchmark_{nombre.replace(" ", "_")}'
+            clase = load_backend(motor).DatabaseWrapper
+
+            def peticiones():
+                wrapper = clase(ajustes, alias) #un wrapper por hilo, igual que connections[...]
+                for _ in range(options['peticiones']):
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    wrapper.close()
+
+            hilos = [threading.Thread(target=peticiones) for _ in range(options['hilos'])]
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            duracion = time.perf_counter() - inicio
+
+            estado = estado_pools().get(alias)
+            if estado:
+                conexiones = (f"{estado['creadas']} conexiones abiertas (máximo {estado['maximo_abiertas']} a la vez), "
+                              f"{estado['reutilizadas']} reutilizadas, {estado['esperas']} esperas")
+            else:
+                conexiones = f'{total} conexiones abiertas y cerradas'
+            self.stdout.write(
+                f'{nombre:9} {total / duracion:9.0f} peticiones/s  {duracion / total * 1e6:8.1f} µs/petición  {conexiones}'
+            )
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from biblioteca.instrumentacion import rutas_get
+from biblioteca.models import Usuario
+from biblioteca.renderers import JSONRapidoRenderer, orjson
+
+
+class Command(BaseCommand):
+    """Renderiza la respuesta de cada endpoint GET con el JSONRenderer de DRF y con JSONRapidoRenderer, y la comprime"""
+    help = 'Compara tiempo de renderizado JSON (DRF vs orjson) y bytes enviados con y sin gzip por endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20, help='Veces que se renderiza cada respuesta (se toma la mejor)')
+        parser.add_argument('--url', action='append', help='Medir solo estos nombres de URL')
+        parser.add_argument('--usuario', help='Username con el que se hacen las peticiones (por defecto el primer administrador)')
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = Usuario.objects.filter(rol='administrador').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para hacer las peticiones')
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson no está instalado: JSONRapidoRenderer usa el renderer de DRF'))
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        drf, rapido = JSONRenderer(), JSONRapidoRenderer()
+        distintos = []
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            for nombre, ruta, datos, motivo in rutas_get(options['url']):
+                if ruta is None:
+                    continue
+                respuesta = cliente.get(ruta, datos)
+                if getattr(respuesta, 'data', None) is None:
+                    continue
+                contenido = drf.render(respuesta.data)
+                if rapido.render(respuesta.data) != contenido:
+                    distintos.append(nombre)
+                tiempo_drf = self.mejor_tiempo(lambda: drf.render(respuesta.data), options['repeticiones'])
+                tiempo_rapido = self.mejor_tiempo(lambda: rapido.render(respuesta.data), options['repeticiones'])
+                tiempo_gzip = self.mejor_tiempo(lambda: compress_string(contenido), options['repeticiones'])
+                comprimido = len(compress_string(contenido))
+
+                estilo = self.style.ERROR if nombre in distintos else str
+                self.stdout.write(estilo(
+                    f'{nombre:30} DRF {tiempo_drf * 1000:7.2f} ms  orjson {tiempo_rapido * 1000:7.2f} ms  '
+                    f'x{tiempo_drf / tiempo_rapido:5.1f}  |  {len(contenido):8d} B  gzip {comprimido:7d} B '
+                    f'({comprimido / len(contenido):4.0%}) en {tiempo_gzip * 1000:6.2f} ms'
+                    + ('  SALIDA DISTINTA' if nombre in distintos else '')
+                ))
+            transaction.set_rollback(True) #los GET no deberían escribir, por las dudas no se guarda nada
+
+        if distintos:
+            raise CommandError(f'El JSON no coincide en: {", ".join(distintos)}')
+        self.stdout.write(self.style.SUCCESS('Mismo JSON en todos los endpoints'))
+
+    @staticmethod
+    def mejor_tiempo(funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos)
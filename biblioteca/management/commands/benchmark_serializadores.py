@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from biblioteca.models import Libro, Sucursal, Ejemplar, Prestamo, Reserva
+from biblioteca.serializers import (
+    LibroSerializer, SucursalSerializer, EjemplarSerializer, PrestamoSerializer, ReservaSerializer,
+    LibroValoresSerializer, SucursalValoresSerializer, EjemplarValoresSerializer, PrestamoValoresSerializer, ReservaValoresSerializer
+)
+
+# Serializer -> (ModelSerializer, serialización desde values(), queryset con los select_related de las vistas)
+SERIALIZADORES = {
+    'libro': (LibroSerializer, LibroValoresSerializer, lambda: Libro.objects.filter(activo=True)),
+    'sucursal': (SucursalSerializer, SucursalValoresSerializer, lambda: Sucursal.objects.filter(activa=True)),
+    'ejemplar': (EjemplarSerializer, EjemplarValoresSerializer, lambda: Ejemplar.objects.select_related('libro', 'sucursal')),
+    'prestamo': (PrestamoSerializer, PrestamoValoresSerializer,
+                 lambda: Prestamo.objects.select_related('usuario', 'ejemplar__libro', 'ejemplar__sucursal')),
+    'reserva': (ReservaSerializer, ReservaValoresSerializer, lambda: Reserva.objects.select_related('usuario', 'libro')),
+}
+
+
+class Command(BaseCommand):
+    """Compara la salida y el tiempo de los ModelSerializer con los ValoresSerializer sobre las mismas filas"""
+    help = 'Verifica que la serialización desde values() produce el mismo JSON que los serializers y mide cuánto más rápida es'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=1000, help='Filas por serializer (como una página grande)')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Veces que se mide cada serializer (se toma la mejor)')
+        parser.add_argument('--solo', action='append', choices=list(SERIALIZADORES), help='Medir solo estos serializers')
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        diferencias = []
+        for nombre in options['solo'] or SERIALIZADORES:
+            clase, valores, consulta = SERIALIZADORES[nombre]
+            queryset = consulta().order_by('id')[:options['filas']]
+            ids = list(queryset.values_list('id', flat=True))
+            if not ids:
+                self.stdout.write(self.style.WARNING(f'{nombre:10} sin filas, omitido (ver generar_datos)'))
+                continue
+            contexto = {'fechas_estimadas': {pk: timezone.now() for pk in ids[::2]}} #para los SerializerMethodField
+
+            def con_modelos():
+                return clase(list(queryset), many=True, context=contexto).data
+
+            def con_valores():
+                return valores(queryset, context=contexto).data
+
+            instancias, filas = list(queryset), list(valores.valores(queryset))
+
+            def solo_modelos():
+                return clase(instancias, many=True, context=contexto).data
+
+            def solo_valores():
+                return valores(filas, context=contexto).data
+
+            if renderer.render(con_modelos()) != renderer.render(con_valores()):
+                diferencias.append(nombre)
+            tiempos = [self.mejor_tiempo(funcion, options['repeticiones'])
+                       for funcion in (con_modelos, con_valores, solo_modelos, solo_valores)]
+            estilo = self.style.ERROR if nombre in diferencias else str
+            self.stdout.write(estilo(
+                f'{nombre:10} {len(ids):6d} filas  con consulta: ModelSerializer {tiempos[0] * 1000:7.1f} ms  '
+                f'values() {tiempos[1] * 1000:7.1f} ms  x{tiempos[0] / tiempos[1]:5.1f}  |  '
+                f'solo serialización: {tiempos[2] * 1000:7.1f} ms  {tiempos[3] * 1000:7.1f} ms  x{tiempos[2] / tiempos[3]:5.1f}'
+                + ('  SALIDA DISTINTA' if nombre in diferencias else '')
+            ))
+
+        if diferencias:
+            raise CommandError(f'La salida no coincide en: {", ".join(diferencias)}')
+        self.stdout.write(self.style.SUCCESS('Misma salida en todos los serializers'))
+
+    @staticmethod
+    def mejor_tiempo(funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F
+
+from biblioteca.models import EstadisticaPrestamo, Prestamo
+
+
+class Command(BaseCommand):
+    """Recalcula la duración promedio de los préstamos por libro y por género"""
+    help = 'Precalcula las estadísticas de duración de préstamos usadas para estimar la espera de las reservas'
+
+    def handle(self, *args, **options):
+        duracion = ExpressionWrapper(F('fecha_devolucion_real') - F('fecha_prestamo'), output_field=DurationField())
+        devueltos = Prestamo.objects.filter(estado='devuelto', fecha_devolucion_real__isnull=False)
+
+        por_libro = devueltos.values('ejemplar__libro', 'ejemplar__libro__genero').annotate(
+            total=Count('id'), promedio=Avg(duracion)
+        )
+        por_genero = devueltos.values('ejemplar__libro__genero').annotate(
+            total=Count('id'), promedio=Avg(duracion)
+        )
+
+        filas = [
+            EstadisticaPrestamo(
+                libro_id=fila['ejemplar__libro'],
+                genero=fila['ejemplar__libro__genero'],
+                total_prestamos=fila['total'],
+                duracion_promedio=fila['promedio'].total_seconds() / 86400
+            )
+            for fila in por_libro
+        ] + [
+            EstadisticaPrestamo(
+                genero=fila['ejemplar__libro__genero'],
+                total_prestamos=fila['total'],
+                duracion_promedio=fila['promedio'].total_seconds() / 86400
+            )
+            for fila in por_genero
+        ]
+
+        with transaction.atomic(): #se reemplaza la tabla completa para que nunca quede a medias
+            EstadisticaPrestamo.objects.all().delete()
+            EstadisticaPrestamo.objects.bulk_create(filas)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(filas)} estadísticas de préstamo actualizadas'))
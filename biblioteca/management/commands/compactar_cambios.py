@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from biblioteca.cambios import compactar, registrar_existentes
+from biblioteca.models import Cambio
+
+
+class Command(BaseCommand):
+    """Deja en el feed de cambios solo la última entrada de cada objeto"""
+    help = 'Borra las entradas del feed de cambios reemplazadas por una más nueva del mismo objeto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Entradas borradas por consulta')
+        parser.add_argument('--registrar-existentes', action='store_true',
+                            help="Antes agrega 'creado' para los objetos sin entradas (cargados con bulk_create)")
+
+    def handle(self, *args, **options):
+        if options['registrar_existentes']:
+            self.stdout.write(f'{registrar_existentes()} objetos registrados')
+        borradas = compactar(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{borradas} entradas reemplazadas borradas, quedan {Cambio.objects.count()}'))
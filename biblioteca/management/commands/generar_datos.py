@@ -0,0 +1,255 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from biblioteca.cache import invalidar_resultados
+from biblioteca.cambios import registrar_existentes
+from biblioteca.models import (
+    Usuario, Sucursal, Libro, Ejemplar, Prestamo, Reserva, MovimientoMulta,
+    CirculacionDiaria, MarcaAgregacion
+)
+
+PREFIJO = 'gen_' #usernames generados; los libros usan ISBN 'G...' y los ejemplares 'GEN-...'
+GENEROS = [codigo for codigo, _ in Libro.GENEROS]
+AUTORES = [f'{nombre} {apellido}' for nombre in ('Ana', 'Luis', 'Marta', 'Jorge', 'Sofía', 'Pablo', 'Elena', 'Diego')
+           for apellido in ('García', 'Rojas', 'Muñoz', 'Soto', 'Silva', 'Torres', 'Díaz', 'Vega')]
+MULTA_POR_DIA = Decimal('1000.00') #igual que Prestamo.calcular_multa
+
+
+@contextmanager
+def _fechas_manuales(*campos):
+    """bulk_create respeta auto_now_add; se desactiva mientras se insertan fechas históricas"""
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+def _insertar(modelo, objetos):
+    """bulk_create que asigna los id también en MySQL (que no los devuelve), leyéndolos en orden de inserción"""
+    anterior = modelo.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+    modelo.objects.bulk_create(objetos, batch_size=1000)
+    ids = list(modelo.objects.filter(id__gt=anterior).order_by('id').values_list('id', flat=True))
+    for objeto, id_ in zip(objetos, ids):
+        objeto.pk = id_
+    return objetos
+
+
+class Command(BaseCommand):
+    """Genera un conjunto de datos realista para medir rendimiento (popularidad de libros con distribución Zipf)"""
+    help = 'Crea sucursales, libros, ejemplares, usuarios y años de préstamos, reservas y multas con bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursales', type=int, default=5)
+        parser.add_argument('--libros', type=int, default=2000)
+        parser.add_argument('--usuarios', type=int, default=2000)
+        parser.add_argument('--anios', type=float, default=1, help='Años de historial de préstamos')
+        parser.add_argument('--prestamos-por-dia', type=int, default=150, help='Promedio de préstamos en un día hábil')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponente de popularidad: mayor = más concentrada')
+        parser.add_argument('--semilla', type=int, default=42, help='Misma semilla, mismos datos')
+        parser.add_argument('--limpiar', action='store_true', help='Borrar antes los datos generados por este comando')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+        self.ahora = timezone.now()
+        inicio = time.perf_counter()
+
+        if options['limpiar']:
+            self.limpiar()
+
+        with transaction.atomic():
+            sucursales = self.crear_sucursales(options['sucursales'])
+            usuarios = self.crear_usuarios(options['usuarios'])
+            libros = self.crear_libros(options['libros'])
+            ejemplares = self.crear_ejemplares(libros, sucursales)
+            prestamos, reservas, multas = self.simular(
+                libros, ejemplares, usuarios, options['anios'], options['prestamos_por_dia'], options['zipf']
+            )
+            movimientos = self.registrar_multas(multas)
+
+        # Tablas derivadas: contador del ranking, circulación diaria completa y feed de cambios
+        call_command('reconstruir_contador_prestamos', stdout=self.stdout)
+        MarcaAgregacion.objects.filter(nombre=CirculacionDiaria.MARCA).delete() #reconstruir desde el principio
+        CirculacionDiaria.actualizar()
+        registrar_existentes() #bulk_create no envía post_save
+        invalidar_resultados()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(sucursales)} sucursales, {len(libros)} libros, {len(ejemplares)} ejemplares, {len(usuarios)} usuarios, '
+            f'{prestamos} préstamos, {reservas} reservas y {movimientos} movimientos de multa '
+            f'en {time.perf_counter() - inicio:.1f} s'
+        ))
+
+    def limpiar(self):
+        with transaction.atomic():
+            Usuario.objects.filter(username__startswith=PREFIJO).delete()
+            Libro.objects.filter(isbn__startswith='G').delete()
+            Sucursal.objects.filter(nombre__startswith='Sucursal Generada').delete()
+
+    def crear_sucursales(self, cantidad):
+        return _insertar(Sucursal, [
+            Sucursal(
+                nombre=f'Sucursal Generada {i + 1}',
+                direccion=f'Calle {self.rng.randint(1, 999)} #{self.rng.randint(100, 9999)}',
+                telefono=f'+5622{self.rng.randint(1000000, 9999999)}',
+                horario_atencion='Lunes a viernes 9:00-19:00, sábado 10:00-14:00'
+            )
+            for i in range(cantidad)
+        ])
+
+    def crear_usuarios(self, cantidad):
+        contraseña = make_password('biblioteca123') #una sola encriptación para todos, PBKDF2 es lento a propósito
+        desde = Usuario.objects.filter(username__startswith=PREFIJO).count()
+        return _insertar(Usuario, [
+            Usuario(
+                username=f'{PREFIJO}{desde + i}',
+                email=f'{PREFIJO}{desde + i}@ejemplo.com',
+                first_name=f'Lector {desde + i}',
+                password=contraseña,
+                rol='bibliotecario' if i % 200 == 0 else 'usuario',
+            )
+            for i in range(cantidad)
+        ])
+
+    def crear_libros(self, cantidad):
+        desde = Libro.objects.filter(isbn__startswith='G').count()
+        return _insertar(Libro, [
+            Libro(
+                titulo=f'Libro generado {desde + i}',
+                autor=self.rng.choice(AUTORES),
+                isbn=f'G{desde + i:012d}',
+                genero=self.rng.choice(GENEROS),
+                año_publicacion=self.rng.randint(1950, timezone.now().year),
+            )
+            for i in range(cantidad)
+        ])
+
+    def crear_ejemplares(self, libros, sucursales):
+        # La posición en la lista es el rango de popularidad (simular): los primeros libros tienen más copias
+        ejemplares = []
+        for posicion, libro in enumerate(libros):
+            copias = 1 + self.rng.randint(0, 1) + (3 if posicion < len(libros) * 0.02 else 1 if posicion < len(libros) * 0.1 else 0)
+            for copia in range(copias):
+                ejemplares.append(Ejemplar(
+                    libro=libro,
+                    sucursal=self.rng.choice(sucursales),
+                    codigo_barras=f'GEN-{libro.isbn}-{copia}',
+                ))
+        return _insertar(Ejemplar, ejemplares)
+
+    def simular(self, libros, ejemplares, usuarios, anios, por_dia, exponente):
+        """Recorre los días en orden: cada préstamo ocupa un ejemplar libre hasta su devolución"""
+        # Zipf: el libro en la posición k se pide con peso 1/k^s (la lista ya está en orden de popularidad)
+        acumulados = []
+        total = 0.0
+        for k in range(1, len(libros) + 1):
+            total += 1 / k ** exponente
+            acumulados.append(total)
+
+        copias = {}
+        for ejemplar in ejemplares:
+            copias.setdefault(ejemplar.libro_id, []).append(ejemplar)
+        libre_desde = {ejemplar.id: None for ejemplar in ejemplares}
+
+        prestamos, reservas, multas = [], [], []
+        reservas_usadas = set() #(usuario, libro, estado) es único en Reserva
+        dias = int(365 * anios)
+        hoy = self.ahora
+
+        for dia in range(dias, 0, -1):
+            fecha = hoy - timedelta(days=dia)
+            media = por_dia * (0.3 if fecha.weekday() == 6 else 1.0) #domingo con poco movimiento
+            cantidad = max(0, int(self.rng.gauss(media, media * 0.2)))
+            for libro in self.rng.choices(libros, cum_weights=acumulados, k=cantidad):
+                momento = fecha.replace(hour=self.rng.randint(9, 18), minute=self.rng.randint(0, 59))
+                usuario = self.rng.choice(usuarios)
+                libres = [e for e in copias[libro.id] if libre_desde[e.id] is None or libre_desde[e.id] <= momento]
+                if not libres:
+                    # Sin copias: a veces el lector reserva y la reserva termina cumplida, expirada o cancelada
+                    estado = self.rng.choices(['cumplida', 'expirada', 'cancelada'], weights=[6, 3, 1])[0]
+                    if self.rng.random() < 0.3 and (usuario.id, libro.id, estado) not in reservas_usadas:
+                        reservas_usadas.add((usuario.id, libro.id, estado))
+                        reservas.append(Reserva(
+                            usuario=usuario, libro=libro, fecha_reserva=momento,
+                            fecha_expiracion=momento + timedelta(days=2), estado=estado, posicion_cola=0,
+                            fecha_cumplida=momento + timedelta(days=self.rng.randint(1, 14)) if estado == 'cumplida' else None
+                        ))
+                    continue
+
+                ejemplar = self.rng.choice(libres)
+                esperada = momento + timedelta(days=14)
+                # La mayoría devuelve a tiempo; una cola larga se atrasa
+                devolucion = momento + timedelta(days=self.rng.randint(2, 13) if self.rng.random() < 0.85 else self.rng.randint(15, 40),
+                                                 hours=self.rng.randint(0, 8))
+                prestamo = Prestamo(usuario=usuario, ejemplar=ejemplar, fecha_prestamo=momento, fecha_devolucion_esperada=esperada)
+                if devolucion <= hoy:
+                    prestamo.estado = 'devuelto'
+                    prestamo.fecha_devolucion_real = devolucion
+                    dias_retraso = (devolucion - esperada).days
+                    if dias_retraso > 0:
+                        prestamo.multa = dias_retraso * MULTA_POR_DIA
+                        multas.append(prestamo)
+                    libre_desde[ejemplar.id] = devolucion
+                else:
+                    libre_desde[ejemplar.id] = hoy + timedelta(days=3650) #sigue prestado
+                prestamos.append(prestamo)
+
+        # Reservas activas: cola para los libros que hoy no tienen copias libres
+        for libro in libros[:max(1, len(libros) // 20)]:
+            if all(libre_desde[e.id] is not None and libre_desde[e.id] > hoy for e in copias[libro.id]):
+                for posicion in range(1, self.rng.randint(1, 5) + 1):
+                    usuario = self.rng.choice(usuarios)
+                    if (usuario.id, libro.id, 'activa') in reservas_usadas:
+                        continue
+                    reservas_usadas.add((usuario.id, libro.id, 'activa'))
+                    momento = hoy - timedelta(hours=self.rng.randint(1, 40))
+                    reservas.append(Reserva(
+                        usuario=usuario, libro=libro, fecha_reserva=momento,
+                        fecha_expiracion=momento + timedelta(days=2), estado='activa', posicion_cola=posicion
+                    ))
+
+        with _fechas_manuales(Prestamo._meta.get_field('fecha_prestamo'), Reserva._meta.get_field('fecha_reserva')):
+            _insertar(Prestamo, prestamos)
+            Reserva.objects.bulk_create(reservas, batch_size=1000)
+
+        prestados = [p.ejemplar_id for p in prestamos if p.estado == 'activo']
+        for inicio in range(0, len(prestados), 1000):
+            Ejemplar.objects.filter(id__in=prestados[inicio:inicio + 1000]).update(estado='prestado')
+        return len(prestamos), len(reservas), multas
+
+    def registrar_multas(self, multas):
+        """Cargo al devolver con atraso y, casi siempre, un pago días después; saldo corrido por usuario"""
+        eventos = []
+        for prestamo in multas:
+            eventos.append((prestamo.usuario_id, prestamo.fecha_devolucion_real, 'cargo', prestamo))
+            pago = prestamo.fecha_devolucion_real + timedelta(days=self.rng.randint(0, 20))
+            if self.rng.random() < 0.85 and pago <= self.ahora:
+                eventos.append((prestamo.usuario_id, pago, 'pago', prestamo))
+        eventos.sort(key=lambda evento: (evento[0], evento[1]))
+
+        movimientos, saldos = [], {}
+        for usuario_id, fecha, tipo, prestamo in eventos:
+            saldo = saldos.get(usuario_id, Decimal('0.00')) + MovimientoMulta.SIGNOS[tipo] * prestamo.multa
+            saldos[usuario_id] = saldo
+            movimientos.append(MovimientoMulta(
+                usuario_id=usuario_id, prestamo=prestamo, tipo=tipo, monto=prestamo.multa,
+                saldo_resultante=saldo, creado_en=fecha,
+                referencia=f'GEN-{prestamo.pk}' if tipo == 'pago' else ''
+            ))
+        MovimientoMulta.objects.bulk_create(movimientos, batch_size=1000)
+
+        usuarios = [Usuario(id=usuario_id, multas_pendientes=saldo) for usuario_id, saldo in saldos.items() if saldo > 0]
+        Usuario.objects.bulk_update(usuarios, ['multas_pendientes'], batch_size=1000)
+        return len(movimientos)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from biblioteca.importacion import ImportacionUsuarios
+
+
+class Command(BaseCommand):
+    """Importa usuarios desde un CSV (columnas username, password, email, first_name, last_name, telefono, rol)"""
+    help = 'Registra usuarios en lote desde un archivo CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV (UTF-8, con encabezado)')
+        parser.add_argument('--lote', type=int, default=1000, help='Usuarios por inserción')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos para encriptar (por defecto IMPORTACION_PROCESOS o todas las CPU)')
+        parser.add_argument('--secuencial', action='store_true', help='Crear de a un usuario, como el registro normal')
+
+    def handle(self, *args, **options):
+        importacion = ImportacionUsuarios(lote=options['lote'], procesos=options['procesos'])
+        inicio = time.perf_counter()
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                if options['secuencial']:
+                    resumen = importacion.importar_secuencial(archivo)
+                else:
+                    resumen = importacion.importar(archivo)
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        duracion = time.perf_counter() - inicio
+
+        for error in resumen['errores']:
+            self.stdout.write(self.style.WARNING(f"Fila {error['fila']}: {error['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['creados']} creados, {resumen['duplicados']} duplicados, {resumen['con_errores']} con errores "
+            f"de {resumen['filas']} filas en {duracion:.1f} s ({resumen['creados'] / duracion:.0f} usuarios/s)"
+        ))
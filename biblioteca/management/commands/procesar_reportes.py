@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from biblioteca.consultas_lentas import volcar, volcar_si_corresponde
+from biblioteca.reportes import ejecutar_trabajo, limpiar_trabajos, tomar_trabajo
+
+
+def ejecutar_en_hilo(trabajo):
+    """Ejecuta un trabajo y cierra la conexión a la base de datos propia del hilo"""
+    try:
+        return ejecutar_trabajo(trabajo)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """Procesa la cola de TrabajoReporte con un grupo de hilos"""
+    help = 'Procesa los reportes encolados en /api/reportes/trabajos/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=2, help='Reportes que se calculan a la vez')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--una-vez', action='store_true', help='Vacía la cola y termina (útil en cron)')
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+
+        with ThreadPoolExecutor(max_workers=hilos) as grupo:
+            while True:
+                limpiar_trabajos()
+                volcar_si_corresponde() #sin peticiones que lo hagan, el proceso vuelca sus estadísticas de consultas aquí
+
+                trabajos = []
+                while len(trabajos) < hilos:
+                    trabajo = tomar_trabajo()
+                    if trabajo is None:
+                        break
+                    trabajos.append(trabajo)
+
+                for trabajo in grupo.map(ejecutar_en_hilo, trabajos):
+                    self.stdout.write(f'{trabajo.id} {trabajo.tipo}: {trabajo.estado}')
+
+                if not trabajos:
+                    if options['una_vez']:
+                        volcar()
+                        break
+                    time.sleep(options['intervalo'])
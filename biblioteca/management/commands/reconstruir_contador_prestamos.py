@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from biblioteca.models import ContadorPrestamos, Prestamo
+
+
+class Command(BaseCommand):
+    """Reconstruye ContadorPrestamos desde el historial de préstamos o verifica que coincida"""
+    help = 'Reconstruye el contador de préstamos por libro, sucursal y día (o lo compara con un conteo directo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true',
+                            help='No modifica nada: compara el contador con un conteo directo sobre Prestamo')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            self.verificar()
+        else:
+            self.reconstruir()
+
+    def reconstruir(self):
+        # La sucursal es la actual del ejemplar; si fue transferido, el historial se atribuye a su sucursal actual
+        filas = Prestamo.objects.annotate(fecha=TruncDate('fecha_prestamo')).values(
+            'ejemplar__libro', 'ejemplar__sucursal', 'ejemplar__libro__genero', 'fecha'
+        ).annotate(total=Count('id'))
+
+        contadores = [
+            ContadorPrestamos(
+                libro_id=fila['ejemplar__libro'],
+                sucursal_id=fila['ejemplar__sucursal'],
+                genero=fila['ejemplar__libro__genero'],
+                fecha=fila['fecha'],
+                total=fila['total']
+            )
+            for fila in filas.iterator()
+        ]
+
+        with transaction.atomic():
+            ContadorPrestamos.objects.all().delete()
+            ContadorPrestamos.objects.bulk_create(contadores, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(contadores)} contadores reconstruidos'))
+
+    def verificar(self):
+        # Conteo directo (lento) contra la suma del contador, libro por libro
+        directo = dict(Prestamo.objects.values_list('ejemplar__libro').annotate(total=Count('id')))
+        contador = dict(ContadorPrestamos.objects.values_list('libro').annotate(total=Sum('total')))
+
+        diferencias = {
+            libro_id: (directo.get(libro_id, 0), contador.get(libro_id, 0))
+            for libro_id in set(directo) | set(contador)
+            if directo.get(libro_id, 0) != contador.get(libro_id, 0)
+        }
+        for libro_id, (esperado, obtenido) in sorted(diferencias.items()):
+            self.stdout.write(f'Libro {libro_id}: {esperado} préstamos, contador {obtenido}')
+
+        if diferencias:
+            raise CommandError(f'{len(diferencias)} libros no coinciden; ejecute el comando sin --verificar')
+        self.stdout.write(self.style.SUCCESS(f'Contador correcto para {len(directo)} libros'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from biblioteca.analitica import actualizar_snapshot
+
+
+class Command(BaseCommand):
+    """Vuelca el historial de préstamos a columnas NumPy para la analítica"""
+    help = 'Agrega al snapshot de analítica los préstamos nuevos y actualiza los que seguían abiertos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directorio', help='Directorio del snapshot (por defecto ANALITICA_DIR)')
+        parser.add_argument('--lote', type=int, default=10000, help='Préstamos leídos por consulta')
+        parser.add_argument('--filas-por-segmento', type=int, help='Préstamos por segmento (por defecto ANALITICA_SEGMENTO_FILAS)')
+
+    def handle(self, *args, **options):
+        resumen = actualizar_snapshot(options['directorio'], lote=options['lote'], filas_por_segmento=options['filas_por_segmento'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['nuevos']} préstamos nuevos, {resumen['actualizados']} actualizados, {resumen['total']} en total, "
+            f"{resumen['segmentos_escritos']} de {resumen['segmentos']} segmentos escritos"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+from biblioteca.models import Usuario, MovimientoMulta
+
+
+class Command(BaseCommand):
+    """Compara multas_pendientes de cada usuario con el saldo de su último movimiento de multa"""
+    help = 'Verifica que el saldo de multas coincida con el libro mayor de movimientos'
+
+    def handle(self, *args, **options):
+        ultimo_saldo = MovimientoMulta.objects.filter(usuario=OuterRef('pk')).order_by('-id').values('saldo_resultante')[:1]
+        usuarios = Usuario.objects.annotate(saldo_libro=Subquery(ultimo_saldo)).values_list(
+            'username', 'multas_pendientes', 'saldo_libro'
+        )
+
+        diferencias = 0
+        for username, saldo, saldo_libro in usuarios.iterator():
+            if saldo != (saldo_libro or 0):
+                diferencias += 1
+                self.stdout.write(self.style.WARNING(f'{username}: multas_pendientes={saldo} libro mayor={saldo_libro or 0}'))
+
+        if diferencias:
+            self.stdout.write(self.style.ERROR(f'{diferencias} usuarios con diferencias'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Todos los saldos coinciden con el libro mayor'))
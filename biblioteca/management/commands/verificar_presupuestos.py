@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+from rest_framework.test import APIClient
+
+from biblioteca.cache import invalidar_resultados
+from biblioteca.instrumentacion import PRESUPUESTOS_CONSULTAS, PresupuestoExcedido, presupuesto_consultas, rutas_get
+from biblioteca.models import Usuario
+
+
+class Command(BaseCommand):
+    """
+    Llama por GET a cada URL con presupuesto y falla si alguna usa más consultas de las permitidas.
+    Con --tamanos-pagina 1,100 repite cada llamada con esos tamaños de página y también falla si la
+    cantidad de consultas crece con el tamaño (una consulta por fila, N+1).
+    """
+    help = 'Verifica los presupuestos de consultas SQL por endpoint (PRESUPUESTOS_CONSULTAS) con los datos actuales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Username con el que se hacen las peticiones (por defecto el primer administrador)')
+        parser.add_argument('--url', action='append', help='Verificar solo estos nombres de URL')
+        parser.add_argument('--tamanos-pagina', default='', help='Tamaños de página separados por coma, ej. 1,100 (por defecto PAGE_SIZE)')
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = Usuario.objects.filter(rol='administrador').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para hacer las peticiones')
+        try:
+            tamanos = [int(tamano) for tamano in options['tamanos_pagina'].split(',') if tamano.strip()]
+        except ValueError:
+            raise CommandError('--tamanos-pagina debe ser una lista de números, ej. 1,100')
+        tamanos = tamanos or [settings.REST_FRAMEWORK['PAGE_SIZE']]
+        paginacion = import_string(settings.REST_FRAMEWORK['DEFAULT_PAGINATION_CLASS'])
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        excedidos = 0
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            for nombre, ruta, datos, motivo in rutas_get(options['url'] or PRESUPUESTOS_CONSULTAS):
+                if nombre not in PRESUPUESTOS_CONSULTAS:
+                    continue
+                if ruta is None:
+                    self.stdout.write(self.style.WARNING(f'{nombre:28} omitido: {motivo}'))
+                    continue
+
+                consultas = {}
+                for tamano in tamanos:
+                    invalidar_resultados() #medir sin resultados en caché, el peor caso
+                    try:
+                        with mock.patch.object(paginacion, 'page_size', tamano), presupuesto_consultas(nombre) as medicion:
+                            respuesta = cliente.get(ruta, datos)
+                    except PresupuestoExcedido as error:
+                        excedidos += 1
+                        self.stdout.write(self.style.ERROR(f'[página {tamano}] {error}'))
+                        break
+                    consultas[tamano] = medicion.consultas
+                else:
+                    detalle = '  '.join(f'p{tamano}:{cantidad}' for tamano, cantidad in consultas.items())
+                    linea = (
+                        f'{nombre:28} {respuesta.status_code}  {max(consultas.values()):3d}/{PRESUPUESTOS_CONSULTAS[nombre]:<3d} consultas'
+                        f'  {len(medicion.repetidas())} repetidas'
+                    )
+                    cantidades = [consultas[tamano] for tamano in sorted(consultas)]
+                    if any(mayor > menor for menor, mayor in zip(cantidades, cantidades[1:])): #menos en la segunda llamada es caché
+                        excedidos += 1
+                        self.stdout.write(self.style.ERROR(f'{linea}  crece con el tamaño de página ({detalle})'))
+                    else:
+                        self.stdout.write(f'{linea}  ({detalle})' if len(tamanos) > 1 else linea)
+            transaction.set_rollback(True) #los GET no deberían escribir, por las dudas no se guarda nada
+
+        if excedidos:
+            raise CommandError(f'{excedidos} endpoints superan su presupuesto de consultas')
+        self.stdout.write(self.style.SUCCESS('Todos los endpoints dentro del presupuesto'))
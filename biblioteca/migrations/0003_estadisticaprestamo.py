@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0002_reserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaPrestamo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genero', models.CharField(choices=[('ficcion', 'Ficción'), ('no_ficcion', 'No Ficción'), ('ciencia', 'Ciencia'), ('historia', 'Historia'), ('biografia', 'Biografía'), ('infantil', 'Infantil'), ('juvenil', 'Juvenil'), ('otros', 'Otros')], max_length=20, verbose_name='Género')),
+                ('total_prestamos', models.IntegerField(default=0, verbose_name='Total de Préstamos')),
+                ('duracion_promedio', models.FloatField(verbose_name='Duración Promedio (días)')),
+                ('actualizado_en', models.DateTimeField(auto_now=True, verbose_name='Actualizado en')),
+                ('libro', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='biblioteca.libro', verbose_name='Libro')),
+            ],
+            options={
+                'verbose_name': 'Estadística de Préstamo',
+                'verbose_name_plural': 'Estadísticas de Préstamos',
+                'indexes': [models.Index(fields=['genero', 'libro'], name='biblioteca__genero_5f24e9_idx')],
+            },
+        ),
+    ]
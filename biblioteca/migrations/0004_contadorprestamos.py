@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def poblar_contadores(apps, schema_editor):
+    """Carga el contador con los préstamos existentes"""
+    Prestamo = apps.get_model('biblioteca', 'Prestamo')
+    ContadorPrestamos = apps.get_model('biblioteca', 'ContadorPrestamos')
+    filas = Prestamo.objects.annotate(fecha=TruncDate('fecha_prestamo')).values(
+        'ejemplar__libro', 'ejemplar__sucursal', 'ejemplar__libro__genero', 'fecha'
+    ).annotate(total=Count('id'))
+    ContadorPrestamos.objects.bulk_create([
+        ContadorPrestamos(
+            libro_id=fila['ejemplar__libro'],
+            sucursal_id=fila['ejemplar__sucursal'],
+            genero=fila['ejemplar__libro__genero'],
+            fecha=fila['fecha'],
+            total=fila['total']
+        )
+        for fila in filas
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0003_estadisticaprestamo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorPrestamos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genero', models.CharField(choices=[('ficcion', 'Ficción'), ('no_ficcion', 'No Ficción'), ('ciencia', 'Ciencia'), ('historia', 'Historia'), ('biografia', 'Biografía'), ('infantil', 'Infantil'), ('juvenil', 'Juvenil'), ('otros', 'Otros')], max_length=20, verbose_name='Género')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('total', models.IntegerField(default=0, verbose_name='Total de Préstamos')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_prestamos', to='biblioteca.libro', verbose_name='Libro')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_prestamos', to='biblioteca.sucursal', verbose_name='Sucursal')),
+            ],
+            options={
+                'verbose_name': 'Contador de Préstamos',
+                'verbose_name_plural': 'Contadores de Préstamos',
+                'indexes': [models.Index(fields=['fecha', 'genero'], name='biblioteca__fecha_954d80_idx'), models.Index(fields=['sucursal', 'fecha'], name='biblioteca__sucursa_147eb7_idx')],
+                'unique_together': {('libro', 'sucursal', 'fecha')},
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0004_contadorprestamos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaAgregacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True, verbose_name='Nombre')),
+                ('valor', models.DateTimeField(verbose_name='Procesado Hasta')),
+            ],
+            options={
+                'verbose_name': 'Marca de Agregación',
+                'verbose_name_plural': 'Marcas de Agregación',
+            },
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='fecha_cumplida',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Cumplimiento'),
+        ),
+        migrations.CreateModel(
+            name='CirculacionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('genero', models.CharField(choices=[('ficcion', 'Ficción'), ('no_ficcion', 'No Ficción'), ('ciencia', 'Ciencia'), ('historia', 'Historia'), ('biografia', 'Biografía'), ('infantil', 'Infantil'), ('juvenil', 'Juvenil'), ('otros', 'Otros')], max_length=20, verbose_name='Género')),
+                ('prestamos', models.IntegerField(default=0, verbose_name='Préstamos')),
+                ('devoluciones', models.IntegerField(default=0, verbose_name='Devoluciones')),
+                ('vencidos', models.IntegerField(default=0, verbose_name='Préstamos Vencidos')),
+                ('multas', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Multas')),
+                ('reservas_creadas', models.IntegerField(default=0, verbose_name='Reservas Creadas')),
+                ('reservas_cumplidas', models.IntegerField(default=0, verbose_name='Reservas Cumplidas')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='circulacion', to='biblioteca.libro', verbose_name='Libro')),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='circulacion', to='biblioteca.sucursal', verbose_name='Sucursal')),
+            ],
+            options={
+                'verbose_name': 'Circulación Diaria',
+                'verbose_name_plural': 'Circulación Diaria',
+                'indexes': [models.Index(fields=['fecha', 'genero'], name='biblioteca__fecha_a0b4bb_idx'), models.Index(fields=['sucursal', 'fecha'], name='biblioteca__sucursa_031511_idx')],
+                'unique_together': {('fecha', 'sucursal', 'libro')},
+            },
+        ),
+    ]
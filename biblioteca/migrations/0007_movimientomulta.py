@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:18
+
+from decimal import Decimal
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def saldos_iniciales(apps, schema_editor):
+    """Un cargo de apertura por cada usuario con multas, así el saldo coincide con el libro mayor"""
+    Usuario = apps.get_model('biblioteca', 'Usuario')
+    MovimientoMulta = apps.get_model('biblioteca', 'MovimientoMulta')
+    MovimientoMulta.objects.bulk_create([
+        MovimientoMulta(
+            usuario_id=usuario_id,
+            tipo='cargo',
+            monto=saldo,
+            saldo_resultante=saldo,
+            referencia='Saldo inicial'
+        )
+        for usuario_id, saldo in Usuario.objects.filter(multas_pendientes__gt=0).values_list('id', 'multas_pendientes')
+    ], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0006_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoMulta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cargo', 'Cargo'), ('pago', 'Pago'), ('condonacion', 'Condonación')], max_length=20, verbose_name='Tipo')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))], verbose_name='Monto')),
+                ('saldo_resultante', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Saldo Resultante')),
+                ('referencia', models.CharField(blank=True, max_length=100, verbose_name='Referencia')),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('prestamo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_multa', to='biblioteca.prestamo', verbose_name='Préstamo')),
+                ('registrado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_multa_registrados', to=settings.AUTH_USER_MODEL, verbose_name='Registrado por')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_multa', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Multa',
+                'verbose_name_plural': 'Movimientos de Multas',
+                'ordering': ['usuario', 'id'],
+                'indexes': [models.Index(fields=['usuario', 'creado_en', 'id'], name='biblioteca__usuario_bceee4_idx'), models.Index(fields=['referencia'], name='biblioteca__referen_1870b1_idx')],
+            },
+        ),
+        migrations.RunPython(saldos_iniciales, migrations.RunPython.noop),
+    ]
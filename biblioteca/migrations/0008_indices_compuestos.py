@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0007_movimientomulta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ejemplar',
+            index=models.Index(fields=['libro', 'estado'], name='biblioteca__libro_i_9ba9b4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ejemplar',
+            index=models.Index(fields=['sucursal', 'estado'], name='biblioteca__sucursa_d5a094_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['usuario', 'estado'], name='biblioteca__usuario_88bede_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_devolucion_esperada'], name='biblioteca__estado_d394b4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['libro', 'estado', 'posicion_cola'], name='biblioteca__libro_i_87107c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['multas_pendientes'], name='biblioteca__multas__c710b3_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0008_indices_compuestos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaConsulta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=40, verbose_name='Clave')),
+                ('huella', models.TextField(verbose_name='Huella')),
+                ('vista', models.CharField(blank=True, max_length=100, verbose_name='Vista')),
+                ('hora', models.DateTimeField(verbose_name='Hora')),
+                ('cantidad', models.PositiveBigIntegerField(default=0, verbose_name='Cantidad')),
+                ('tiempo_total_ms', models.FloatField(default=0, verbose_name='Tiempo Total (ms)')),
+                ('tiempo_maximo_ms', models.FloatField(default=0, verbose_name='Tiempo Máximo (ms)')),
+                ('p95_ms', models.FloatField(default=0, verbose_name='p95 (ms)')),
+                ('filas', models.PositiveBigIntegerField(default=0, verbose_name='Filas')),
+                ('lentas', models.PositiveIntegerField(default=0, verbose_name='Consultas Lentas')),
+                ('ubicacion', models.CharField(blank=True, max_length=300, verbose_name='Ubicación')),
+            ],
+            options={
+                'verbose_name': 'Estadística de Consulta',
+                'verbose_name_plural': 'Estadísticas de Consultas',
+                'ordering': ['-hora'],
+                'indexes': [models.Index(fields=['hora'], name='biblioteca__hora_07c799_idx')],
+                'unique_together': {('clave', 'vista', 'hora')},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def registrar_existentes(apps, schema_editor):
+    """Una entrada 'creado' por cada objeto vigente, así desde=0 devuelve una copia completa"""
+    Cambio = apps.get_model('biblioteca', 'Cambio')
+    vigentes = {
+        'libro': apps.get_model('biblioteca', 'Libro').objects.filter(activo=True).values('id'),
+        'sucursal': apps.get_model('biblioteca', 'Sucursal').objects.filter(activa=True).values('id'),
+        'ejemplar': apps.get_model('biblioteca', 'Ejemplar').objects.values('id'),
+        'prestamo': apps.get_model('biblioteca', 'Prestamo').objects.values('id', 'usuario_id'),
+        'reserva': apps.get_model('biblioteca', 'Reserva').objects.values('id', 'usuario_id'),
+    }
+    for modelo, filas in vigentes.items():
+        lote = []
+        for fila in filas.order_by('id').iterator(chunk_size=2000):
+            lote.append(Cambio(modelo=modelo, objeto_id=fila['id'], operacion='creado', usuario_id=fila.get('usuario_id')))
+            if len(lote) == 1000:
+                Cambio.objects.bulk_create(lote)
+                lote = []
+        Cambio.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteca', '0009_estadisticaconsulta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('libro', 'Libro'), ('sucursal', 'Sucursal'), ('ejemplar', 'Ejemplar'), ('prestamo', 'Préstamo'), ('reserva', 'Reserva')], max_length=20, verbose_name='Modelo')),
+                ('objeto_id', models.PositiveBigIntegerField(verbose_name='ID del Objeto')),
+                ('operacion', models.CharField(choices=[('creado', 'Creado'), ('modificado', 'Modificado'), ('eliminado', 'Eliminado')], max_length=20, verbose_name='Operación')),
+                ('usuario_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Usuario')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+            ],
+            options={
+                'verbose_name': 'Cambio',
+                'verbose_name_plural': 'Cambios',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='biblioteca__modelo_ba014d_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_existentes, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, F, Max, Sum, Count
+from django.db.models.functions import TruncDate, TruncMonth
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
-from datetime import datetime, timedelta
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+import hashlib
+import heapq
+import json
+import uuid
 
 
 class Usuario(AbstractUser):
@@ -18,9 +27,12 @@ class Usuario(AbstractUser):
     multas_pendientes = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, verbose_name='Multas Pendientes')
     suspendido = models.BooleanField(default=False, verbose_name='Suspendido')
     
+    MAXIMO_PRESTAMOS_ACTIVOS = 3
+    
     class Meta:
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
+        indexes = [models.Index(fields=['multas_pendientes'])] #usuarios con deuda
     
     def __str__(self):
         return f"{self.username} ({self.get_rol_display()})"
@@ -33,7 +45,7 @@ class Usuario(AbstractUser):
             return False
         # Verificar que no tenga más de 3 préstamos activos
         prestamos_activos = self.prestamos.filter(estado='activo').count()
-        return prestamos_activos < 3
+        return prestamos_activos < self.MAXIMO_PRESTAMOS_ACTIVOS
 
     def puede_hacer_reserva(self):
         """Verifica si el usuario puede hacer reservas"""
@@ -100,6 +112,53 @@ class Libro(models.Model):
             ejemplares = ejemplares.filter(sucursal=sucursal) 
         return ejemplares.count() #retorna el número de ejemplares disponibles contando los que estan en la sucursal
 
+    def estimar_disponibilidad(self, cantidad):
+        """Estima la fecha en que queda libre un ejemplar para cada una de las primeras `cantidad` posiciones de la cola"""
+        return Libro.estimar_disponibilidad_varios({self: cantidad})[self.id]
+
+    @staticmethod
+    def estimar_disponibilidad_varios(cantidades):
+        """
+        estimar_disponibilidad de varios libros a la vez: {libro: cantidad} -> {libro_id: fechas}.
+        Son dos consultas en total, no dos por libro.
+        """
+        fechas = {libro.id: [] for libro in cantidades}
+        libros = [libro for libro, cantidad in cantidades.items() if cantidad > 0]
+        if not libros:
+            return fechas
+        ahora = timezone.now()
+
+        # Una sola consulta: para cada ejemplar prestable, la fecha de devolución del préstamo activo (None si está disponible)
+        vencimientos = Ejemplar.objects.filter(
+            libro__in=libros,
+            estado__in=['disponible', 'prestado']
+        ).annotate(
+            vence=Max('prestamos__fecha_devolucion_esperada', filter=Q(prestamos__estado='activo'))
+        ).values_list('libro_id', 'vence')
+
+        liberaciones = {libro.id: [] for libro in libros}
+        for libro_id, vence in vencimientos:
+            liberaciones[libro_id].append(max(vence or ahora, ahora)) #un préstamo vencido se considera liberable desde ahora
+
+        con_ejemplares = [libro for libro in libros if liberaciones[libro.id]]
+        duraciones = EstadisticaPrestamo.duraciones_estimadas(con_ejemplares) if con_ejemplares else {}
+        for libro in libros:
+            cantidad = cantidades[libro]
+            if not liberaciones[libro.id]:
+                fechas[libro.id] = [None] * cantidad #sin ejemplares no hay fecha que estimar
+                continue
+
+            duracion = timedelta(days=duraciones[libro.id])
+            cola = liberaciones[libro.id]
+            heapq.heapify(cola)
+
+            # Cada reserva toma el ejemplar que se libera primero y lo retiene durante la duración típica de un préstamo
+            for _ in range(cantidad):
+                fecha = heapq.heappop(cola)
+                fechas[libro.id].append(fecha)
+                heapq.heappush(cola, fecha + duracion)
+        return fechas
+
 
 class Ejemplar(models.Model):
     """Modelo básico para los ejemplares físicos de los libros"""
@@ -119,6 +178,10 @@ class Ejemplar(models.Model):
     class Meta:
         verbose_name = 'Ejemplar'
         verbose_name_plural = 'Ejemplares'
+        indexes = [
+            models.Index(fields=['libro', 'estado']), #disponibles de un libro
+            models.Index(fields=['sucursal', 'estado']), #inventario de una sucursal
+        ]
     
     def __str__(self):
         return f"{self.libro.titulo} - {self.codigo_barras} ({self.sucursal.nombre})" #retorna el titulo del libro, el codigo de barras y el nombre de la sucursal
@@ -148,13 +211,20 @@ class Prestamo(models.Model):
     class Meta:
         verbose_name = 'Préstamo'
         verbose_name_plural = 'Préstamos'
+        indexes = [
+            models.Index(fields=['usuario', 'estado']), #préstamos activos del usuario
+            models.Index(fields=['estado', 'fecha_devolucion_esperada']), #vencidos
+        ]
     
     def save(self, *args, **kwargs):
         # Establecer fecha de devolución esperada (14 días)
         if not self.fecha_devolucion_esperada:
-            self.fecha_devolucion_esperada = datetime.now() + timedelta(days=14)
+            self.fecha_devolucion_esperada = timezone.now() + timedelta(days=14)
+        es_nuevo = self._state.adding #adding es True solo antes del primer guardado
         super().save(*args, **kwargs)   #args y kwargs son para que se pueda guardar el préstamo con los argumentos que se le pasan
         #por ejemplo, si se guarda un préstamo con fecha_devolucion_esperada = None, se establece la fecha de devolución esperada a 14 días desde la fecha actual
+        if es_nuevo:
+            ContadorPrestamos.registrar(self) #mantiene el ranking de libros más prestados
     
     def __str__(self):
         return f"{self.usuario.username} - {self.ejemplar.libro.titulo}"
@@ -163,31 +233,32 @@ class Prestamo(models.Model):
         """Verifica si el préstamo está vencido"""
         if self.estado == 'devuelto': #si el préstamo está devuelto, no está vencido
             return False #retorna False porque el préstamo no está vencido
-        return datetime.now() > self.fecha_devolucion_esperada #retorna True si el préstamo está vencido
+        return timezone.now() > self.fecha_devolucion_esperada #retorna True si el préstamo está vencido
     
     def calcular_multa(self): 
         """Calcula la multa por días de retraso"""
         if not self.esta_vencido(): #si el préstamo no está vencido, no hay multa
             return 0 #retorna 0 porque no hay multa
         
-        dias_retraso = (datetime.now() - self.fecha_devolucion_esperada).days #calcula los días de retraso
-        multa_por_dia = 1000.00  # $1000.00 por día
+        dias_retraso = (timezone.now() - self.fecha_devolucion_esperada).days #calcula los días de retraso
+        multa_por_dia = Decimal('1000.00')  # $1000.00 por día, Decimal igual que multas_pendientes
         return dias_retraso * multa_por_dia
     
     def devolver(self):
         """Marca el préstamo como devuelto"""
-        self.fecha_devolucion_real = datetime.now()
+        multa = self.calcular_multa() #antes de marcarlo devuelto, esta_vencido depende del estado
+        self.fecha_devolucion_real = timezone.now()
         self.estado = 'devuelto'
         self.ejemplar.estado = 'disponible'
         
-        # Calcular multa si hay retraso
-        if self.esta_vencido():
-            self.multa = self.calcular_multa()
-            self.usuario.multas_pendientes += self.multa #suma la multa al total de multas pendientes
-            self.usuario.save() #guarda el total de multas pendientes
-        
-        self.ejemplar.save() #guarda el estado del ejemplar
-        self.save()
+        with transaction.atomic():
+            # Calcular multa si hay retraso
+            if multa > 0:
+                self.multa = multa
+                MovimientoMulta.registrar(self.usuario_id, 'cargo', multa, prestamo=self) #suma la multa al saldo del usuario
+            
+            self.ejemplar.save() #guarda el estado del ejemplar
+            self.save()
 
 
 class Reserva(models.Model): 
@@ -206,6 +277,7 @@ class Reserva(models.Model):
     fecha_expiracion = models.DateTimeField(verbose_name='Fecha de Expiración')
     estado = models.CharField(max_length=20, choices=ESTADOS, default='activa', verbose_name='Estado')
     posicion_cola = models.IntegerField(default=1, verbose_name='Posición en Cola')
+    fecha_cumplida = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de Cumplimiento')
     
     class Meta: #meta es para definir propiedades del modelo
         verbose_name = 'Reserva'
@@ -213,11 +285,12 @@ class Reserva(models.Model):
         # Un usuario no puede tener múltiples reservas activas del mismo libro
         unique_together = [['usuario', 'libro', 'estado']] #unique_together es para que no se pueda tener múltiples reservas activas del mismo libro
         ordering = ['fecha_reserva'] 
+        indexes = [models.Index(fields=['libro', 'estado', 'posicion_cola'])] #cola de reservas de un libro
     
     def save(self, *args, **kwargs): 
         
         if not self.fecha_expiracion: 
-            self.fecha_expiracion = datetime.now() + timedelta(days=2) #si no se ha establecido la fecha de expiración, se establece a 2 días desde la fecha actual
+            self.fecha_expiracion = timezone.now() + timedelta(days=2) #si no se ha establecido la fecha de expiración, se establece a 2 días desde la fecha actual
         super().save(*args, **kwargs) #args y kwargs son para que se pueda guardar la reserva con los argumentos que se le pasan
         #por ejemplo, si se guarda una reserva con fecha_expiracion = None, se establece la fecha de expiración a 2 días desde la fecha actual
     
@@ -226,7 +299,7 @@ class Reserva(models.Model):
     
     def esta_expirada(self):
         """Verifica si la reserva está expirada"""
-        return datetime.now() > self.fecha_expiracion and self.estado == 'activa' #retorna True si la reserva está expirada y activa
+        return timezone.now() > self.fecha_expiracion and self.estado == 'activa' #retorna True si la reserva está expirada y activa
     
     def cancelar(self):
         """Cancela la reserva y reorganiza la cola"""
@@ -251,3 +324,495 @@ class Reserva(models.Model):
             estado='activa', 
             fecha_reserva__lt=self.fecha_reserva #porque lt, es para indicar que la fecha de reserva es menor a la fecha de la reserva actual
         ).count() + 1 # cuenta las reservas activas del mismo libro y las que tienen una fecha de reserva menor a la fecha de la reserva actual
+
+    def obtener_fecha_estimada(self):
+        """Estima la fecha en que habrá un ejemplar disponible para esta reserva"""
+        if self.estado != 'activa':
+            return None
+        return self.libro.estimar_disponibilidad(self.obtener_posicion_en_cola())[-1]
+
+
+class EstadisticaPrestamo(models.Model):
+    """Duración histórica de los préstamos por libro o por género (precalculada con calcular_estadisticas_prestamos)"""
+
+    DURACION_POR_DEFECTO = 14 #días de un préstamo normal, se usa cuando no hay historial
+    MINIMO_PRESTAMOS = 5 #con menos préstamos que esto se usa la estadística del género
+
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, null=True, blank=True, related_name='estadisticas', verbose_name='Libro') #null = fila agregada del género
+    genero = models.CharField(max_length=20, choices=Libro.GENEROS, verbose_name='Género')
+    total_prestamos = models.IntegerField(default=0, verbose_name='Total de Préstamos')
+    duracion_promedio = models.FloatField(verbose_name='Duración Promedio (días)')
+    actualizado_en = models.DateTimeField(auto_now=True, verbose_name='Actualizado en')
+
+    class Meta:
+        verbose_name = 'Estadística de Préstamo'
+        verbose_name_plural = 'Estadísticas de Préstamos'
+        indexes = [models.Index(fields=['genero', 'libro'])]
+
+    def __str__(self):
+        return f"{self.libro or self.get_genero_display()}: {self.duracion_promedio:.1f} días"
+
+    @classmethod
+    def duracion_estimada(cls, libro):
+        """Duración esperada en días de un préstamo del libro, usando el libro o su género"""
+        return cls.duraciones_estimadas([libro])[libro.id]
+
+    @classmethod
+    def duraciones_estimadas(cls, libros):
+        """duracion_estimada de varios libros con una sola consulta: {libro_id: días}"""
+        filas = cls.objects.filter(
+            Q(libro__in=libros) | Q(libro__isnull=True, genero__in={libro.genero for libro in libros})
+        ).values_list('libro_id', 'genero', 'total_prestamos', 'duracion_promedio')
+
+        por_libro, por_genero = {}, {}
+        for libro_id, genero, total, duracion in filas:
+            if libro_id is None:
+                por_genero[genero] = duracion
+            elif total >= cls.MINIMO_PRESTAMOS:
+                por_libro[libro_id] = duracion
+        return {
+            libro.id: por_libro.get(libro.id) or por_genero.get(libro.genero) or cls.DURACION_POR_DEFECTO
+            for libro in libros
+        }
+
+
+class ContadorPrestamos(models.Model):
+    """Préstamos por libro, sucursal y día; se incrementa en cada préstamo para armar el ranking sin recorrer Prestamo"""
+
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='contadores_prestamos', verbose_name='Libro')
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='contadores_prestamos', verbose_name='Sucursal')
+    genero = models.CharField(max_length=20, choices=Libro.GENEROS, verbose_name='Género') #copiado del libro para filtrar sin join
+    fecha = models.DateField(verbose_name='Fecha')
+    total = models.IntegerField(default=0, verbose_name='Total de Préstamos')
+
+    class Meta:
+        verbose_name = 'Contador de Préstamos'
+        verbose_name_plural = 'Contadores de Préstamos'
+        unique_together = [['libro', 'sucursal', 'fecha']]
+        indexes = [
+            models.Index(fields=['fecha', 'genero']),
+            models.Index(fields=['sucursal', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.libro_id} @ {self.sucursal_id} {self.fecha}: {self.total}"
+
+    @classmethod
+    def registrar(cls, prestamo):
+        """Suma un préstamo al contador del día (incremento atómico con F)"""
+        ejemplar = prestamo.ejemplar
+        filtro = {
+            'libro_id': ejemplar.libro_id,
+            'sucursal_id': ejemplar.sucursal_id,
+            'fecha': timezone.localdate(prestamo.fecha_prestamo),
+        }
+        if cls.objects.filter(**filtro).update(total=F('total') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(genero=ejemplar.libro.genero, total=1, **filtro)
+        except IntegrityError: #otro proceso creó la fila del día al mismo tiempo
+            cls.objects.filter(**filtro).update(total=F('total') + 1)
+
+    @classmethod
+    def mas_prestados(cls, limite=10, genero=None, sucursal=None, desde=None, hasta=None):
+        """Ranking de libros más prestados, opcionalmente por género, sucursal y rango de fechas"""
+        contadores = cls.objects.all()
+        if genero:
+            contadores = contadores.filter(genero=genero)
+        if sucursal:
+            contadores = contadores.filter(sucursal_id=sucursal)
+        if desde:
+            contadores = contadores.filter(fecha__gte=desde)
+        if hasta:
+            contadores = contadores.filter(fecha__lte=hasta)
+
+        return list(
+            contadores.values('libro_id', 'libro__titulo', 'libro__autor')
+            .annotate(total_prestamos=Sum('total'))
+            .order_by('-total_prestamos', 'libro_id')[:limite]
+        )
+
+
+class MarcaAgregacion(models.Model):
+    """Hasta dónde llegó la última actualización incremental de una tabla agregada"""
+
+    nombre = models.CharField(max_length=50, unique=True, verbose_name='Nombre')
+    valor = models.DateTimeField(verbose_name='Procesado Hasta')
+
+    class Meta:
+        verbose_name = 'Marca de Agregación'
+        verbose_name_plural = 'Marcas de Agregación'
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+
+class CirculacionDiaria(models.Model):
+    """Hechos diarios de circulación por sucursal, género y libro (se actualiza con actualizar_circulacion)"""
+
+    MARCA = 'circulacion_diaria'
+    METRICAS = ['prestamos', 'devoluciones', 'vencidos', 'multas', 'reservas_creadas', 'reservas_cumplidas']
+    AGRUPACIONES = { #columnas que agrega cada agrupación al resultado
+        'dia': ['dia'],
+        'mes': ['mes'],
+        'sucursal': ['sucursal', 'sucursal_nombre'],
+        'genero': ['genero'],
+        'libro': ['libro', 'libro_titulo'],
+    }
+    ALIAS = {
+        'dia': F('fecha'),
+        'mes': TruncMonth('fecha'),
+        'sucursal_nombre': F('sucursal__nombre'),
+        'libro_titulo': F('libro__titulo'),
+    }
+
+    fecha = models.DateField(verbose_name='Fecha')
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, null=True, blank=True, related_name='circulacion', verbose_name='Sucursal') #las reservas son por libro, no tienen sucursal
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='circulacion', verbose_name='Libro')
+    genero = models.CharField(max_length=20, choices=Libro.GENEROS, verbose_name='Género')
+    prestamos = models.IntegerField(default=0, verbose_name='Préstamos')
+    devoluciones = models.IntegerField(default=0, verbose_name='Devoluciones')
+    vencidos = models.IntegerField(default=0, verbose_name='Préstamos Vencidos')
+    multas = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Multas')
+    reservas_creadas = models.IntegerField(default=0, verbose_name='Reservas Creadas')
+    reservas_cumplidas = models.IntegerField(default=0, verbose_name='Reservas Cumplidas')
+
+    class Meta:
+        verbose_name = 'Circulación Diaria'
+        verbose_name_plural = 'Circulación Diaria'
+        unique_together = [['fecha', 'sucursal', 'libro']]
+        indexes = [
+            models.Index(fields=['fecha', 'genero']),
+            models.Index(fields=['sucursal', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.sucursal_id} {self.libro_id}"
+
+    @classmethod
+    def actualizar(cls):
+        """Recalcula los días desde la última marca (incluido el día de la marca, que pudo quedar incompleto)"""
+        marca = MarcaAgregacion.objects.filter(nombre=cls.MARCA).first()
+        ahora = timezone.now()
+        inicio = timezone.localdate(marca.valor) if marca else None
+        desde = timezone.make_aware(datetime.combine(inicio, time.min)) if inicio else None
+
+        def desde_inicio(queryset, campo):
+            return queryset.filter(**{f'{campo}__gte': desde}) if desde else queryset.filter(**{f'{campo}__isnull': False})
+
+        hechos = {}
+
+        def acumular(filas, sucursal, libro, genero, metricas):
+            for fila in filas:
+                clave = (fila['dia'], fila[sucursal] if sucursal else None, fila[libro])
+                if clave not in hechos:
+                    hechos[clave] = cls(fecha=clave[0], sucursal_id=clave[1], libro_id=clave[2], genero=fila[genero])
+                for campo, alias in metricas.items():
+                    setattr(hechos[clave], campo, fila[alias] or 0)
+
+        ejes_prestamo = ['ejemplar__sucursal', 'ejemplar__libro', 'ejemplar__libro__genero']
+        ejes_reserva = ['libro', 'libro__genero']
+
+        acumular(
+            desde_inicio(Prestamo.objects, 'fecha_prestamo').annotate(dia=TruncDate('fecha_prestamo'))
+            .values('dia', *ejes_prestamo).annotate(total=Count('id')),
+            *ejes_prestamo, {'prestamos': 'total'}
+        )
+        acumular(
+            desde_inicio(Prestamo.objects, 'fecha_devolucion_real').annotate(dia=TruncDate('fecha_devolucion_real'))
+            .values('dia', *ejes_prestamo).annotate(total=Count('id'), suma_multas=Sum('multa')),
+            *ejes_prestamo, {'devoluciones': 'total', 'multas': 'suma_multas'}
+        )
+        # Vencido el día en que pasó su fecha esperada sin haber sido devuelto a tiempo
+        acumular(
+            desde_inicio(Prestamo.objects, 'fecha_devolucion_esperada')
+            .filter(fecha_devolucion_esperada__lt=ahora)
+            .filter(Q(fecha_devolucion_real__isnull=True) | Q(fecha_devolucion_real__gt=F('fecha_devolucion_esperada')))
+            .annotate(dia=TruncDate('fecha_devolucion_esperada'))
+            .values('dia', *ejes_prestamo).annotate(total=Count('id')),
+            *ejes_prestamo, {'vencidos': 'total'}
+        )
+        acumular(
+            desde_inicio(Reserva.objects, 'fecha_reserva').annotate(dia=TruncDate('fecha_reserva'))
+            .values('dia', *ejes_reserva).annotate(total=Count('id')),
+            None, *ejes_reserva, {'reservas_creadas': 'total'}
+        )
+        acumular(
+            desde_inicio(Reserva.objects, 'fecha_cumplida').annotate(dia=TruncDate('fecha_cumplida'))
+            .values('dia', *ejes_reserva).annotate(total=Count('id')),
+            None, *ejes_reserva, {'reservas_cumplidas': 'total'}
+        )
+
+        with transaction.atomic():
+            pendientes = cls.objects.filter(fecha__gte=inicio) if inicio else cls.objects.all()
+            pendientes.delete()
+            cls.objects.bulk_create(hechos.values(), batch_size=1000)
+            MarcaAgregacion.objects.update_or_create(nombre=cls.MARCA, defaults={'valor': ahora})
+        return len(hechos)
+
+    @classmethod
+    def resumen(cls, desde=None, hasta=None, agrupar=(), sucursal=None, genero=None):
+        """Suma las métricas en un rango de fechas agrupando por día, mes, sucursal, género y/o libro"""
+        hechos = cls.objects.all()
+        if desde:
+            hechos = hechos.filter(fecha__gte=desde)
+        if hasta:
+            hechos = hechos.filter(fecha__lte=hasta)
+        if sucursal:
+            hechos = hechos.filter(sucursal_id=sucursal)
+        if genero:
+            hechos = hechos.filter(genero=genero)
+
+        columnas = [columna for nombre in agrupar for columna in cls.AGRUPACIONES[nombre]]
+        sumas = {metrica: Sum(metrica) for metrica in cls.METRICAS}
+
+        if not columnas:
+            return [hechos.aggregate(**sumas)]
+        hechos = hechos.annotate(**{columna: cls.ALIAS[columna] for columna in columnas if columna in cls.ALIAS})
+        return list(hechos.values(*columnas).annotate(**sumas).order_by(*columnas))
+
+
+class TrabajoReporte(models.Model):
+    """Reporte solicitado para calcularse en segundo plano (lo ejecuta el comando procesar_reportes)"""
+
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En Proceso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False) #no secuencial, así no se pueden adivinar trabajos ajenos
+    tipo = models.CharField(max_length=50, verbose_name='Tipo de Reporte')
+    parametros = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder, verbose_name='Parámetros')
+    clave = models.CharField(max_length=64, db_index=True, verbose_name='Clave') #hash de tipo + parámetros para reutilizar resultados
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente', verbose_name='Estado')
+    resultado = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name='Resultado')
+    error = models.TextField(blank=True, verbose_name='Error')
+    solicitado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='trabajos_reporte', verbose_name='Solicitado por')
+    creado_en = models.DateTimeField(auto_now_add=True, verbose_name='Creado en')
+    iniciado_en = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado en')
+    completado_en = models.DateTimeField(null=True, blank=True, verbose_name='Completado en')
+    expira_en = models.DateTimeField(null=True, blank=True, verbose_name='Expira en')
+
+    class Meta:
+        verbose_name = 'Trabajo de Reporte'
+        verbose_name_plural = 'Trabajos de Reporte'
+        ordering = ['creado_en']
+        indexes = [models.Index(fields=['estado', 'creado_en'])]
+
+    def __str__(self):
+        return f"{self.tipo} ({self.get_estado_display()})"
+
+    @staticmethod
+    def calcular_clave(tipo, parametros):
+        """Mismo tipo y mismos parámetros producen la misma clave"""
+        contenido = json.dumps([tipo, parametros], sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+class MovimientoMulta(models.Model):
+    """
+    Libro mayor de multas: cada cargo, pago o condonación es una fila que no se modifica.
+    Usuario.multas_pendientes es el saldo, actualizado con F() en la misma transacción que el movimiento.
+    """
+
+    TIPOS = [
+        ('cargo', 'Cargo'),
+        ('pago', 'Pago'),
+        ('condonacion', 'Condonación'),
+    ]
+    SIGNOS = {'cargo': 1, 'pago': -1, 'condonacion': -1} #efecto de cada tipo sobre el saldo
+
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='movimientos_multa', verbose_name='Usuario')
+    prestamo = models.ForeignKey(Prestamo, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_multa', verbose_name='Préstamo')
+    tipo = models.CharField(max_length=20, choices=TIPOS, verbose_name='Tipo')
+    monto = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))], verbose_name='Monto')
+    saldo_resultante = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Saldo Resultante') #saldo del usuario después del movimiento
+    referencia = models.CharField(max_length=100, blank=True, verbose_name='Referencia') #n° de recibo o motivo
+    registrado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_multa_registrados', verbose_name='Registrado por')
+    creado_en = models.DateTimeField(default=timezone.now, verbose_name='Fecha')
+
+    class Meta:
+        verbose_name = 'Movimiento de Multa'
+        verbose_name_plural = 'Movimientos de Multas'
+        ordering = ['usuario', 'id']
+        indexes = [
+            models.Index(fields=['usuario', 'creado_en', 'id']), #estado de cuenta y saldo a una fecha
+            models.Index(fields=['referencia']),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario_id} {self.tipo} {self.monto} -> {self.saldo_resultante}"
+
+    @staticmethod
+    def a_monto(valor):
+        """Convierte texto o número en Decimal con dos decimales; lanza ValueError si no es válido"""
+        try:
+            monto = Decimal(str(valor)).quantize(Decimal('0.01'))
+        except (InvalidOperation, TypeError):
+            raise ValueError('monto inválido')
+        if not monto.is_finite() or monto <= 0:
+            raise ValueError('El monto debe ser mayor a 0')
+        return monto
+
+    @classmethod
+    def registrar(cls, usuario_id, tipo, monto, prestamo=None, registrado_por=None, referencia=''):
+        """
+        Agrega un movimiento y actualiza el saldo del usuario de forma atómica.
+        Los pagos y condonaciones no pueden dejar el saldo negativo (ValueError).
+        """
+        monto = cls.a_monto(monto)
+        cambio = cls.SIGNOS[tipo] * monto
+        with transaction.atomic():
+            usuarios = Usuario.objects.filter(id=usuario_id)
+            if cambio < 0:
+                usuarios = usuarios.filter(multas_pendientes__gte=monto) #la condición se evalúa en el mismo UPDATE
+            if not usuarios.update(multas_pendientes=F('multas_pendientes') + cambio):
+                if not Usuario.objects.filter(id=usuario_id).exists():
+                    raise ValueError('Usuario no encontrado')
+                raise ValueError('El monto excede las multas pendientes')
+            # El UPDATE dejó la fila bloqueada hasta el final de la transacción, el saldo leído es el propio
+            saldo = Usuario.objects.select_for_update().values_list('multas_pendientes', flat=True).get(id=usuario_id)
+            return cls.objects.create(
+                usuario_id=usuario_id,
+                prestamo=prestamo,
+                tipo=tipo,
+                monto=monto,
+                saldo_resultante=saldo,
+                referencia=referencia,
+                registrado_por=registrado_por
+            )
+
+    @classmethod
+    def pagar_en_lote(cls, pagos, registrado_por=None):
+        """
+        Registra varios pagos [{'usuario': id, 'monto': '100.00', 'referencia': 'R-1'}, ...].
+        Cada pago es independiente: uno rechazado no deshace los demás. Una referencia ya registrada se omite,
+        también si el mismo lote llega dos veces al mismo tiempo.
+        """
+        referencias = [str(pago.get('referencia') or '').strip() for pago in pagos]
+        registradas = set(cls.objects.filter(
+            tipo='pago', referencia__in=[referencia for referencia in referencias if referencia]
+        ).values_list('referencia', flat=True))
+
+        resultados = [None] * len(pagos)
+        # Por orden de usuario: dos lotes simultáneos bloquean las filas en el mismo orden y no se traban
+        orden = sorted(range(len(pagos)), key=lambda i: str(pagos[i].get('usuario')))
+        for i in orden:
+            pago, referencia = pagos[i], referencias[i]
+            if referencia and referencia in registradas:
+                resultados[i] = {'estado': 'duplicado', 'referencia': referencia}
+                continue
+            try:
+                if len(referencia) > cls._meta.get_field('referencia').max_length:
+                    raise ValueError('La referencia tiene más de 100 caracteres') #recortada podría coincidir con otra
+                try:
+                    usuario_id = int(pago.get('usuario'))
+                except (TypeError, ValueError):
+                    raise ValueError('usuario inválido')
+                with transaction.atomic():
+                    # Bloquea al usuario: otro lote con el mismo pago espera aquí y después lo ve registrado
+                    list(Usuario.objects.select_for_update().filter(id=usuario_id).values_list('id', flat=True))
+                    if referencia and cls.objects.filter(tipo='pago', referencia=referencia).exists():
+                        movimiento = None
+                    else:
+                        movimiento = cls.registrar(
+                            usuario_id, 'pago', pago.get('monto'),
+                            registrado_por=registrado_por, referencia=referencia
+                        )
+            except ValueError as error:
+                resultados[i] = {'estado': 'rechazado', 'error': str(error)}
+                continue
+            if referencia:
+                registradas.add(referencia)
+            if movimiento is None:
+                resultados[i] = {'estado': 'duplicado', 'referencia': referencia}
+            else:
+                resultados[i] = {'estado': 'registrado', 'movimiento': movimiento.id, 'saldo': movimiento.saldo_resultante}
+        return resultados
+
+    @classmethod
+    def estado_de_cuenta(cls, usuario_id, desde=None, hasta=None):
+        """Saldo inicial, movimientos del período y saldo final leyendo saldo_resultante (sin sumar el historial)"""
+        movimientos = cls.objects.filter(usuario_id=usuario_id)
+        anterior = None
+        if desde:
+            inicio = timezone.make_aware(datetime.combine(desde, time.min))
+            anterior = movimientos.filter(creado_en__lt=inicio).order_by('-creado_en', '-id').values_list('saldo_resultante', flat=True).first()
+            movimientos = movimientos.filter(creado_en__gte=inicio)
+        if hasta:
+            movimientos = movimientos.filter(creado_en__lt=timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)))
+
+        movimientos = list(movimientos.order_by('creado_en', 'id').values(
+            'id', 'tipo', 'monto', 'saldo_resultante', 'referencia', 'prestamo_id', 'creado_en'
+        ))
+        saldo_inicial = anterior if anterior is not None else Decimal('0.00')
+        return {
+            'saldo_inicial': saldo_inicial,
+            'movimientos': movimientos,
+            'saldo_final': movimientos[-1]['saldo_resultante'] if movimientos else saldo_inicial,
+        }
+
+
+class EstadisticaConsulta(models.Model):
+    """Consultas SQL agrupadas por huella, vista y hora; las suma cada proceso (biblioteca/consultas_lentas.py)"""
+
+    clave = models.CharField(max_length=40, verbose_name='Clave') #sha1 de la huella
+    huella = models.TextField(verbose_name='Huella') #SQL sin valores
+    vista = models.CharField(max_length=100, blank=True, verbose_name='Vista') #nombre de URL, vacío fuera de una petición
+    hora = models.DateTimeField(verbose_name='Hora')
+    cantidad = models.PositiveBigIntegerField(default=0, verbose_name='Cantidad')
+    tiempo_total_ms = models.FloatField(default=0, verbose_name='Tiempo Total (ms)')
+    tiempo_maximo_ms = models.FloatField(default=0, verbose_name='Tiempo Máximo (ms)')
+    p95_ms = models.FloatField(default=0, verbose_name='p95 (ms)') #el mayor p95 de los volcados de la hora
+    filas = models.PositiveBigIntegerField(default=0, verbose_name='Filas')
+    lentas = models.PositiveIntegerField(default=0, verbose_name='Consultas Lentas') #superaron CONSULTAS_LENTAS_UMBRAL_MS
+    ubicacion = models.CharField(max_length=300, blank=True, verbose_name='Ubicación') #línea de biblioteca/ de la más lenta
+
+    class Meta:
+        verbose_name = 'Estadística de Consulta'
+        verbose_name_plural = 'Estadísticas de Consultas'
+        ordering = ['-hora']
+        unique_together = [['clave', 'vista', 'hora']]
+        indexes = [models.Index(fields=['hora'])]
+
+    def __str__(self):
+        return f"{self.vista or '-'} {self.hora:%Y-%m-%d %H}h: {self.cantidad} x {self.huella[:60]}"
+
+
+class Cambio(models.Model):
+    """
+    Feed de cambios para sincronizar clientes (/api/cambios/, biblioteca/cambios.py): el id es el cursor.
+    Se registra al confirmar cada alta, modificación o baja (también la lógica: Libro.activo, Sucursal.activa);
+    compactar_cambios deja solo la última entrada de cada objeto.
+    """
+
+    MODELOS = [
+        ('libro', 'Libro'),
+        ('sucursal', 'Sucursal'),
+        ('ejemplar', 'Ejemplar'),
+        ('prestamo', 'Préstamo'),
+        ('reserva', 'Reserva'),
+    ]
+    OPERACIONES = [
+        ('creado', 'Creado'),
+        ('modificado', 'Modificado'),
+        ('eliminado', 'Eliminado'),
+    ]
+
+    modelo = models.CharField(max_length=20, choices=MODELOS, verbose_name='Modelo')
+    objeto_id = models.PositiveBigIntegerField(verbose_name='ID del Objeto')
+    operacion = models.CharField(max_length=20, choices=OPERACIONES, verbose_name='Operación')
+    usuario_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name='Usuario') #dueño de préstamos y reservas, sin FK: la fila sobrevive al usuario
+    fecha = models.DateTimeField(default=timezone.now, verbose_name='Fecha')
+
+    class Meta:
+        verbose_name = 'Cambio'
+        verbose_name_plural = 'Cambios'
+        ordering = ['id']
+        indexes = [models.Index(fields=['modelo', 'objeto_id'])] #entradas anteriores del mismo objeto (compactación)
+
+    def __str__(self):
+        return f"#{self.id} {self.modelo} {self.objeto_id} {self.operacion}"
@@ -0,0 +1,214 @@
+# PERFILADO DE PETICIONES BAJO DEMANDA (cProfile + tracemalloc)
+#
+# PerfiladoMiddleware perfila una fracción PERFILADO_MUESTREO de las peticiones (0 = ninguna) y toda petición
+# que traiga la cabecera X-Perfilar con una firma vigente (la entrega un administrador en /api/reportes/perfiles/firma/).
+# Por cada petición perfilada se guardan en PERFILADO_DIR:
+#   <id>.json     ruta, tiempos (total, base de datos, serialización, render, resto), funciones más costosas y memoria
+#   <id>.prof     estadísticas de cProfile (python -m pstats, snakeviz)
+#   <id>.memoria  snapshot de tracemalloc al terminar (tracemalloc.Snapshot.load), si PERFILADO_MEMORIA
+# Se conservan los últimos PERFILADO_MAXIMO perfiles. La respuesta perfilada lleva X-Perfil con su id.
+# Solo se perfila una petición a la vez por proceso (tracemalloc es global) y solo en WSGI: con ASGI
+# las vistas corren en otros hilos y cProfile no las vería.
+
+import cProfile
+import json
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .instrumentacion import medir, instalar_mediciones
+
+logger = logging.getLogger('biblioteca.perfilado')
+
+CABECERA = 'HTTP_X_PERFILAR'
+_FIRMA_SAL = 'biblioteca.perfilado'
+_ID_PERFIL = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+EXTENSIONES = {'json': '.json', 'cprofile': '.prof', 'memoria': '.memoria'}
+FUNCIONES_RESUMEN = 30 #funciones por tiempo acumulado en el .json
+MEMORIA_RESUMEN = 20 #líneas que más memoria reservaron
+_ocupado = threading.Lock()
+
+
+def directorio():
+    return Path(settings.PERFILADO_DIR)
+
+
+def firmar_perfilado(usuario_id):
+    """Valor para la cabecera X-Perfilar, válido PERFILADO_FIRMA_VIGENCIA segundos"""
+    return signing.TimestampSigner(salt=_FIRMA_SAL).sign(str(usuario_id))
+
+
+def firma_valida(valor):
+    try:
+        signing.TimestampSigner(salt=_FIRMA_SAL).unsign(valor, max_age=settings.PERFILADO_FIRMA_VIGENCIA)
+        return True
+    except signing.BadSignature: #incluye SignatureExpired
+        return False
+
+
+def archivo_perfil(perfil_id, tipo='json'):
+    """Ruta del archivo de un perfil, o None si el id o el tipo no son válidos o no existe"""
+    if not _ID_PERFIL.match(perfil_id or '') or tipo not in EXTENSIONES:
+        return None
+    archivo = directorio() / f'{perfil_id}{EXTENSIONES[tipo]}'
+    return archivo if archivo.exists() else None
+
+
+def listar_perfiles():
+    """Resumen de los perfiles guardados, del más reciente al más antiguo"""
+    perfiles = []
+    for archivo in sorted(directorio().glob('*.json'), reverse=True):
+        try:
+            datos = json.loads(archivo.read_text())
+        except (OSError, ValueError):
+            continue #rotado o escribiéndose en este momento
+        perfiles.append({clave: datos.get(clave) for clave in (
+            'id', 'fecha', 'metodo', 'ruta', 'vista', 'estado', 'motivo', 'tiempos_ms', 'consultas'
+        )})
+    return perfiles
+
+
+def _funciones(perfil):
+    """Funciones con más tiempo acumulado"""
+    estadisticas = pstats.Stats(perfil).sort_stats(pstats.SortKey.CUMULATIVE)
+    funciones = []
+    for funcion in estadisticas.fcn_list[:FUNCIONES_RESUMEN]:
+        llamadas_primitivas, llamadas, propio, acumulado, _ = estadisticas.stats[funcion]
+        archivo, linea, nombre = funcion
+        funciones.append({
+            'funcion': f'{archivo}:{linea}({nombre})',
+            'llamadas': llamadas,
+            'tiempo_propio_ms': round(propio * 1000, 2),
+            'tiempo_acumulado_ms': round(acumulado * 1000, 2),
+        })
+    return funciones
+
+
+def _memoria(antes, despues, pico):
+    """Líneas que más memoria reservaron durante la petición"""
+    diferencias = despues.compare_to(antes, 'lineno')[:MEMORIA_RESUMEN]
+    return {
+        'pico_kb': round(pico / 1024, 1),
+        'lineas': [
+            {
+                'linea': str(diferencia.traceback[0]),
+                'diferencia_kb': round(diferencia.size_diff / 1024, 1),
+                'bloques': diferencia.count_diff,
+            }
+            for diferencia in diferencias
+        ],
+    }
+
+
+def _rotar():
+    """Borra los perfiles más antiguos que sobran de PERFILADO_MAXIMO"""
+    ids = sorted({archivo.stem for archivo in directorio().iterdir() if _ID_PERFIL.match(archivo.stem)}, reverse=True)
+    for perfil_id in ids[settings.PERFILADO_MAXIMO:]:
+        for extension in EXTENSIONES.values():
+            (directorio() / f'{perfil_id}{extension}').unlink(missing_ok=True)
+
+
+class PerfiladoMiddleware:
+    """Perfila peticiones por muestreo o con la cabecera X-Perfilar firmada (ver arriba)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instalar_mediciones()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request) #ASGI: sin perfilado, devuelve la corrutina tal cual
+        motivo = self._motivo(request)
+        if motivo is None or not _ocupado.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self._perfilar(request, motivo)
+        finally:
+            _ocupado.release()
+
+    @staticmethod
+    def _motivo(request):
+        valor = request.META.get(CABECERA)
+        if valor:
+            if firma_valida(valor):
+                return 'cabecera'
+            logger.warning('X-Perfilar con firma inválida o vencida desde %s', request.META.get('REMOTE_ADDR'))
+        if settings.PERFILADO_MUESTREO > 0 and random.random() < settings.PERFILADO_MUESTREO:
+            return 'muestreo'
+        return None
+
+    def _perfilar(self, request, motivo):
+        memoria = settings.PERFILADO_MEMORIA
+        detener_memoria = memoria and not tracemalloc.is_tracing() #si ya estaba activo (PYTHONTRACEMALLOC) se deja
+        if detener_memoria:
+            tracemalloc.start(settings.PERFILADO_MARCOS)
+        if memoria:
+            tracemalloc.reset_peak()
+            antes = tracemalloc.take_snapshot()
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        with medir() as medicion:
+            perfil.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                perfil.disable()
+        total = time.perf_counter() - inicio
+
+        try:
+            if memoria:
+                despues = tracemalloc.take_snapshot()
+                pico = tracemalloc.get_traced_memory()[1]
+            perfil_id = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+            directorio().mkdir(parents=True, exist_ok=True)
+            perfil.dump_stats(directorio() / f'{perfil_id}.prof')
+            if memoria:
+                despues.dump(str(directorio() / f'{perfil_id}.memoria'))
+
+            resto = total - medicion.tiempo_bd - medicion.tiempo_serializacion - medicion.tiempo_render
+            datos = {
+                'id': perfil_id,
+                'fecha': timezone.now().isoformat(),
+                'metodo': request.method,
+                'ruta': request.get_full_path(),
+                'vista': request.resolver_match.url_name if request.resolver_match else None,
+                'usuario': getattr(getattr(request, 'user', None), 'id', None),
+                'estado': response.status_code,
+                'motivo': motivo,
+                'consultas': medicion.consultas,
+                'tiempos_ms': { #la serialización incluye las consultas que dispara, el resto es la vista y Django
+                    'total': round(total * 1000, 2),
+                    'base_datos': round(medicion.tiempo_bd * 1000, 2),
+                    'serializacion': round(medicion.tiempo_serializacion * 1000, 2),
+                    'render': round(medicion.tiempo_render * 1000, 2),
+                    'resto': round(max(resto, 0) * 1000, 2),
+                },
+                'consultas_repetidas': [{'sql': sql, 'veces': veces} for sql, veces in medicion.repetidas()[:10]],
+                'funciones': _funciones(perfil),
+                'memoria': _memoria(antes, despues, pico) if memoria else None,
+            }
+            (directorio() / f'{perfil_id}.json').write_text(json.dumps(datos, indent=2, ensure_ascii=False))
+            _rotar()
+            response['X-Perfil'] = perfil_id
+        except OSError as error:
+            logger.error('No se pudo guardar el perfil de %s: %s', request.path, error)
+        finally:
+            if detener_memoria:
+                tracemalloc.stop()
+        return response
@@ -0,0 +1,39 @@
+# RENDERIZADO JSON RÁPIDO
+#
+# JSONRapidoRenderer produce los mismos bytes que el JSONRenderer de DRF (compacto, UTF-8, fechas ISO 8601 con 'Z')
+# pero codifica con orjson, que convierte en C las fechas, UUID y estructuras. Lo que orjson no conoce
+# (Decimal, timedelta, textos perezosos, arrays de NumPy...) pasa por el mismo JSONEncoder de DRF.
+# Si orjson no está instalado, o no puede con algún valor, se usa el renderer de DRF tal cual.
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError: #orjson es opcional
+    orjson = None
+
+OPCIONES_ORJSON = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+_encoder = JSONEncoder()
+
+
+def _por_defecto(obj):
+    """Tipos que orjson no serializa: misma conversión que el JSONEncoder de DRF"""
+    for tipo in (float, int, str): #subclases que el json de la biblioteca estándar acepta (ej.: numpy.float64)
+        if isinstance(obj, tipo):
+            return tipo(obj)
+    return _encoder.default(obj)
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """JSONRenderer con orjson; con indentación pedida (?indent / Accept) usa el de DRF"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            contenido = orjson.dumps(data, default=_por_defecto, option=OPCIONES_ORJSON)
+        except TypeError: #lo que orjson no puede (enteros de más de 64 bits, anidamiento muy profundo)
+            return super().render(data, accepted_media_type, renderer_context)
+        # Igual que DRF: U+2028 y U+2029 escapados para poder incrustar el JSON en JavaScript
+        return contenido.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,204 @@
+# LECTURAS EN RÉPLICAS DE LA BASE DE DATOS
+#
+# Las vistas marcadas con @lectura_replica leen de una réplica (REPLICAS_BD); todo lo demás usa 'default'.
+# Se lee del primario aunque la vista esté marcada cuando:
+#   - la misma petición ya escribió algo
+#   - el usuario escribió hace menos de REPLICAS_LECTURA_PROPIA segundos (lee lo que acaba de guardar)
+#   - la réplica no responde o su retraso supera REPLICAS_LAG_MAXIMO segundos
+# El estado de cada réplica se revisa como mucho cada REPLICAS_VERIFICAR_CADA segundos por proceso.
+
+import contextvars
+import functools
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger('biblioteca.replicas')
+
+PRIMARIO = 'default'
+_peticion = contextvars.ContextVar('peticion_replicas', default=None) #estado de la petición en curso
+RUTAS_SIN_ESCRITURA = {'lote-api'} #POST que no escriben por sí mismos: cuenta lo que escriben sus subpeticiones
+_estado_replicas = {} #alias -> (revisar después de, sana)
+_turno = itertools.count()
+
+
+def _clave_escritura(usuario_id):
+    return f'replicas:escritura:{usuario_id}'
+
+
+def marcar_escritura(usuario_id):
+    """Las próximas lecturas del usuario van al primario por REPLICAS_LECTURA_PROPIA segundos"""
+    if usuario_id is not None and settings.REPLICAS_BD:
+        cache.set(_clave_escritura(usuario_id), True, settings.REPLICAS_LECTURA_PROPIA)
+
+
+def retraso_replica(alias):
+    """Segundos de retraso de la réplica respecto del primario (None si la replicación está detenida)"""
+    conexion = connections[alias]
+    with conexion.cursor() as cursor:
+        if conexion.vendor != 'mysql':
+            cursor.execute('SELECT 1') #SQLite y otros: solo se verifica que responda
+            return 0
+        cursor.execute('SHOW SLAVE STATUS')
+        fila = cursor.fetchone()
+        if fila is None:
+            return 0 #no es una réplica configurada (por ejemplo en desarrollo)
+        columnas = [columna[0] for columna in cursor.description]
+        return dict(zip(columnas, fila)).get('Seconds_Behind_Master')
+
+
+def replica_sana(alias):
+    """Revisa la réplica si pasó el intervalo; si falla queda fuera hasta la próxima revisión"""
+    revisar, sana = _estado_replicas.get(alias, (0, True))
+    if time.monotonic() < revisar:
+        return sana
+    try:
+        retraso = retraso_replica(alias)
+        sana = retraso is not None and retraso <= settings.REPLICAS_LAG_MAXIMO
+        if not sana:
+            logger.warning('Réplica %s con retraso %s s, se lee del primario', alias, retraso)
+    except Exception as error:
+        sana = False
+        logger.warning('Réplica %s no disponible, se lee del primario: %s', alias, error)
+        connections[alias].close()
+    _estado_replicas[alias] = (time.monotonic() + settings.REPLICAS_VERIFICAR_CADA, sana)
+    return sana
+
+
+def _elegir_replica():
+    """Una réplica sana por turnos, o None"""
+    replicas = settings.REPLICAS_BD
+    inicio = next(_turno)
+    for i in range(len(replicas)):
+        alias = replicas[(inicio + i) % len(replicas)]
+        if replica_sana(alias):
+            return alias
+    return None
+
+
+def lectura_replica(vista):
+    """
+    Marca una vista (o el método get de una vista de clase) como lectura que tolera un retraso
+    de REPLICAS_LAG_MAXIMO segundos. Va debajo de @api_view y @permission_classes.
+    También sirve para las vistas async (views_async.py).
+    """
+    if iscoroutinefunction(vista):
+        @functools.wraps(vista)
+        async def envoltura_async(*args, **kwargs):
+            estado = _peticion.get()
+            if estado is None:
+                return await vista(*args, **kwargs)
+            anterior = estado['replica']
+            estado['replica'] = True
+            try:
+                return await vista(*args, **kwargs)
+            finally:
+                estado['replica'] = anterior
+        return envoltura_async
+
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        estado = _peticion.get()
+        if estado is None:
+            return vista(*args, **kwargs) #fuera del middleware (comandos, pruebas): siempre primario
+        anterior = estado['replica']
+        estado['replica'] = True
+        try:
+            return vista(*args, **kwargs)
+        finally:
+            estado['replica'] = anterior
+    return envoltura
+
+
+@contextmanager
+def subpeticion(request):
+    """
+    Estado propio para una subpetición del lote (lote.py), también dentro de un hilo: @lectura_replica de una
+    no cambia a las demás. Si la petición del lote ya escribió, la subpetición lee del primario; si la
+    subpetición escribe, lo que venga después en el lote también.
+    """
+    exterior = _peticion.get()
+    estado = {'request': request, 'replica': False, 'escribio': bool(exterior and exterior['escribio']), 'alias': None}
+    token = _peticion.set(estado)
+    try:
+        yield estado
+    finally:
+        _peticion.reset(token)
+        if exterior is not None and estado['escribio']:
+            exterior['escribio'] = True
+
+
+class ReplicaRouter:
+    """Router de DATABASE_ROUTERS: escrituras y migraciones al primario, lecturas marcadas a una réplica"""
+
+    def db_for_read(self, model, **hints):
+        estado = _peticion.get()
+        if not settings.REPLICAS_BD or estado is None or not estado['replica'] or estado['escribio']:
+            return PRIMARIO
+        if estado['alias'] is None:
+            estado['alias'] = PRIMARIO if self._escribio_hace_poco(estado['request']) else _elegir_replica() or PRIMARIO
+        return estado['alias'] #toda la petición lee de la misma base
+
+    def db_for_write(self, model, **hints):
+        estado = _peticion.get()
+        if estado is not None:
+            estado['escribio'] = True #lo que se lea después en esta petición sale del primario
+        return PRIMARIO
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True #las réplicas tienen los mismos datos que el primario
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICAS_BD #las réplicas reciben el esquema por replicación
+
+    @staticmethod
+    def _escribio_hace_poco(request):
+        usuario = getattr(request, 'user', None) #DRF ya autenticó: UsuarioDelToken tiene id sin consultar
+        usuario_id = getattr(usuario, 'id', None)
+        return usuario_id is not None and bool(cache.get(_clave_escritura(usuario_id)))
+
+
+class ReplicaMiddleware:
+    """Da a cada petición su estado de replicas y recuerda las escrituras del usuario (WSGI y ASGI)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._llamar_async(request)
+        estado = {'request': request, 'replica': False, 'escribio': False, 'alias': None}
+        token = _peticion.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        self._despues(request, response, estado)
+        return response
+
+    async def _llamar_async(self, request):
+        estado = {'request': request, 'replica': False, 'escribio': False, 'alias': None}
+        token = _peticion.set(estado) #las consultas en hilos (sync_to_async) heredan el contexto
+        try:
+            response = await self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        self._despues(request, response, estado)
+        return response
+
+    @staticmethod
+    def _despues(request, response, estado):
+        nombre_url = request.resolver_match.url_name if getattr(request, 'resolver_match', None) else None
+        escritura = request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400 and nombre_url not in RUTAS_SIN_ESCRITURA
+        if estado['escribio'] or escritura:
+            marcar_escritura(getattr(getattr(request, 'user', None), 'id', None))
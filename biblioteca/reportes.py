@@ -0,0 +1,237 @@
+# REPORTES - FUNCIONES COMPARTIDAS POR LAS VISTAS Y POR LOS TRABAJOS EN SEGUNDO PLANO
+# Cada reporte se guarda en caché (cache.py) hasta que cambian los modelos que lee o vence RESULTADOS_CACHE_TTL;
+# los agregados (ranking y totales) vencen a los RESULTADOS_CACHE_TTL_AGREGADOS segundos
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .cache import resultado_en_cache
+from .models import (
+    Usuario, Libro, Ejemplar, Prestamo, Reserva, MovimientoMulta, ContadorPrestamos,
+    CirculacionDiaria, MarcaAgregacion, TrabajoReporte
+)
+
+# ============================================================================
+# REPORTES
+# ============================================================================
+
+@resultado_en_cache('libros_populares', ttl=settings.RESULTADOS_CACHE_TTL_AGREGADOS, modelos=(Libro,))
+def obtener_libros_populares(limite=10, genero=None, sucursal=None, desde=None, hasta=None):
+    """Obtiene los libros más prestados"""
+    # Una sola lectura del contador mantenido en cada préstamo (ContadorPrestamos)
+    return [
+        {
+            'libro_id': fila['libro_id'],
+            'titulo': fila['libro__titulo'],
+            'autor': fila['libro__autor'],
+            'total_prestamos': fila['total_prestamos']
+        }
+        for fila in ContadorPrestamos.mas_prestados(
+            limite=limite, genero=genero, sucursal=sucursal, desde=desde, hasta=hasta
+        )
+    ]
+
+@resultado_en_cache('usuarios_con_multas', modelos=(Usuario, MovimientoMulta))
+def obtener_usuarios_con_multas():
+    """Obtiene usuarios con multas pendientes"""
+    usuarios_con_multas = Usuario.objects.filter(
+        multas_pendientes__gt=0
+    ).order_by('-multas_pendientes')
+
+    return [
+        {
+            'username': usuario.username,
+            'multas_pendientes': float(usuario.multas_pendientes)
+        }
+        for usuario in usuarios_con_multas
+    ]
+
+@resultado_en_cache('prestamos_vencidos', modelos=(Prestamo, Ejemplar, Usuario, Libro))
+def obtener_prestamos_vencidos():
+    """Obtiene préstamos vencidos"""
+    # 1. Obtener préstamos activos (con usuario y libro en la misma consulta, el bucle no consulta por fila)
+    prestamos_activos = Prestamo.objects.filter(estado='activo').select_related('usuario', 'ejemplar__libro')
+
+    # 2. Filtrar vencidos manualmente
+    prestamos_vencidos = []
+    fecha_actual = timezone.now()
+
+    for prestamo in prestamos_activos:
+        # Verificar si está vencido
+        if prestamo.fecha_devolucion_esperada < fecha_actual:
+            # Calcular días de retraso
+            dias_retraso = (fecha_actual.date() - prestamo.fecha_devolucion_esperada.date()).days
+
+            prestamos_vencidos.append({
+                'prestamo': prestamo,
+                'dias_retraso': dias_retraso
+            })
+
+    return [ # despues de obtener los prestamos vencidos, se retorna un diccionario que contiene el usuario, el libro y los dias de retraso
+        {
+            'usuario': prestamo['prestamo'].usuario.username, #con el punto se accede a los atributos del usuario
+            'libro': prestamo['prestamo'].ejemplar.libro.titulo,
+            'dias_retraso': prestamo['dias_retraso']
+        }
+        for prestamo in prestamos_vencidos
+    ]
+
+@resultado_en_cache('estadisticas_generales', ttl=settings.RESULTADOS_CACHE_TTL_AGREGADOS)
+def obtener_estadisticas_generales():
+    """Obtiene estadísticas generales del sistema"""
+    return {
+        'total_libros': Libro.objects.filter(activo=True).count(),#se esta contando los libros que estan activos y se guardan en total_libros
+        'total_usuarios': Usuario.objects.count(),#se esta contando los usuarios y se guardan en total_usuarios
+        'prestamos_activos': Prestamo.objects.filter(estado='activo').count(),#se esta contando los prestamos que estan activos y se guardan en prestamos_activos
+        'reservas_activas': Reserva.objects.filter(estado='activa').count(),#se esta contando las reservas que estan activas y se guardan en reservas_activas
+        'ejemplares_disponibles': Ejemplar.objects.filter(estado='disponible').count()
+    }
+
+def obtener_reporte_general():
+    """Los cuatro reportes básicos que muestra /api/reportes/"""
+    return {
+        'libros_mas_populares': obtener_libros_populares(),
+        'usuarios_con_multas': obtener_usuarios_con_multas(),
+        'prestamos_vencidos': obtener_prestamos_vencidos(),
+        'estadisticas_generales': obtener_estadisticas_generales()
+    }
+
+@resultado_en_cache('circulacion', modelos=(CirculacionDiaria,))
+def obtener_circulacion(desde=None, hasta=None, sucursal=None, genero=None, agrupar=()):
+    """Circulación por rango de fechas leída de las tablas diarias agregadas"""
+    marca = MarcaAgregacion.objects.filter(nombre=CirculacionDiaria.MARCA).first()
+    return {
+        'datos_hasta': marca.valor if marca else None, #momento de la última actualización de las tablas
+        'resultados': CirculacionDiaria.resumen(
+            desde=desde, hasta=hasta, agrupar=agrupar, sucursal=sucursal, genero=genero
+        )
+    }
+
+REPORTES = { #nombre del reporte -> función que lo calcula
+    'general': obtener_reporte_general,
+    'libros_populares': obtener_libros_populares,
+    'usuarios_con_multas': obtener_usuarios_con_multas,
+    'prestamos_vencidos': obtener_prestamos_vencidos,
+    'estadisticas_generales': obtener_estadisticas_generales,
+    'circulacion': obtener_circulacion,
+}
+
+# ============================================================================
+# PARÁMETROS
+# ============================================================================
+
+def _fecha(valor):
+    """Convierte 'AAAA-MM-DD' en fecha"""
+    try:
+        fecha = parse_date(valor) if isinstance(valor, str) else valor
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ValueError('fecha inválida, use AAAA-MM-DD')
+    return fecha
+
+def _limite(valor):
+    """Número de filas, de 1 a 100 para no devolver tablas enormes"""
+    limite = int(valor)
+    if limite < 1:
+        raise ValueError('limite debe ser mayor que 0')
+    return min(limite, 100)
+
+def _agrupaciones(valor):
+    """Lista (o texto separado por comas) de agrupaciones de CirculacionDiaria"""
+    nombres = [nombre for nombre in (valor.split(',') if isinstance(valor, str) else valor) if nombre]
+    invalidas = [nombre for nombre in nombres if nombre not in CirculacionDiaria.AGRUPACIONES]
+    if invalidas:
+        raise ValueError(f"{', '.join(invalidas)} no existe. Opciones: {', '.join(CirculacionDiaria.AGRUPACIONES)}")
+    return nombres
+
+PARAMETROS = { #parámetros aceptados por cada reporte y cómo se convierten
+    'general': {},
+    'libros_populares': {'limite': _limite, 'genero': str, 'sucursal': int, 'desde': _fecha, 'hasta': _fecha},
+    'usuarios_con_multas': {},
+    'prestamos_vencidos': {},
+    'estadisticas_generales': {},
+    'circulacion': {'desde': _fecha, 'hasta': _fecha, 'sucursal': int, 'genero': str, 'agrupar': _agrupaciones},
+}
+
+def limpiar_parametros(tipo, parametros):
+    """Valida y convierte los parámetros de un reporte; lanza ValueError si algo no es válido"""
+    if tipo not in REPORTES:
+        raise ValueError(f"Reporte desconocido. Opciones: {', '.join(REPORTES)}")
+
+    permitidos = PARAMETROS[tipo]
+    desconocidos = [nombre for nombre in parametros if nombre not in permitidos]
+    if desconocidos:
+        raise ValueError(f"Parámetros no válidos para {tipo}: {', '.join(desconocidos)}")
+
+    limpios = {}
+    for nombre, valor in parametros.items():
+        if valor in ('', None): #vacío es lo mismo que no enviarlo
+            continue
+        try:
+            limpios[nombre] = permitidos[nombre](valor)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Parámetro '{nombre}' inválido: {error}")
+    return limpios
+
+def generar_reporte(tipo, parametros):
+    """Calcula un reporte a partir de parámetros sin validar (por ejemplo los guardados en un trabajo)"""
+    return REPORTES[tipo](**limpiar_parametros(tipo, parametros))
+
+# ============================================================================
+# TRABAJOS EN SEGUNDO PLANO
+# ============================================================================
+
+def encolar_reporte(tipo, parametros, usuario=None):
+    """Crea un trabajo o reutiliza uno igual que esté en cola o con resultado vigente"""
+    clave = TrabajoReporte.calcular_clave(tipo, parametros)
+    existente = TrabajoReporte.objects.filter(clave=clave).filter(
+        Q(estado__in=['pendiente', 'en_proceso']) | Q(estado='completado', expira_en__gt=timezone.now())
+    ).order_by('-creado_en').first()
+    if existente:
+        return existente
+
+    return TrabajoReporte.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        clave=clave,
+        solicitado_por=usuario
+    )
+
+def tomar_trabajo():
+    """Reclama el trabajo pendiente más antiguo; el UPDATE condicionado evita que dos procesos tomen el mismo"""
+    pendientes = TrabajoReporte.objects.filter(estado='pendiente').order_by('creado_en').values_list('id', flat=True)[:10]
+    for trabajo_id in pendientes:
+        reclamado = TrabajoReporte.objects.filter(id=trabajo_id, estado='pendiente').update(
+            estado='en_proceso', iniciado_en=timezone.now()
+        )
+        if reclamado:
+            return TrabajoReporte.objects.get(id=trabajo_id)
+    return None
+
+def ejecutar_trabajo(trabajo):
+    """Calcula el reporte del trabajo y guarda el resultado con su vencimiento"""
+    try:
+        trabajo.resultado = generar_reporte(trabajo.tipo, trabajo.parametros)
+        trabajo.estado = 'completado'
+    except Exception as error:
+        trabajo.error = str(error)
+        trabajo.estado = 'error'
+
+    trabajo.completado_en = timezone.now()
+    trabajo.expira_en = trabajo.completado_en + timedelta(seconds=settings.REPORTES_TTL)
+    trabajo.save()
+    return trabajo
+
+def limpiar_trabajos():
+    """Borra los resultados vencidos y devuelve a la cola los trabajos abandonados por un proceso caído"""
+    ahora = timezone.now()
+    TrabajoReporte.objects.filter(expira_en__lt=ahora).delete()
+    TrabajoReporte.objects.filter(
+        estado='en_proceso',
+        iniciado_en__lt=ahora - timedelta(seconds=settings.REPORTES_TIEMPO_MAXIMO)
+    ).update(estado='pendiente', iniciado_en=None)
@@ -1,6 +1,34 @@
-from rest_framework import serializers
+import functools
+
+from rest_framework import serializers, ISO_8601
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.contrib.auth import authenticate
-from .models import Usuario, Sucursal, Libro, Ejemplar, Prestamo, Reserva
+from django.db.models import Count
+from django.utils import timezone
+from .models import Usuario, Sucursal, Libro, Ejemplar, Prestamo, Reserva, TrabajoReporte
+
+
+class PlanRelacionesMixin:
+    """
+    Plan de consultas del serializer: con_relaciones(queryset) agrega select_related de cada relación que leen
+    sus campos (source='ejemplar.libro.titulo' -> 'ejemplar__libro'), así serializar 1 o 100 filas cuesta lo mismo.
+    Se deduce de los campos, no hay que mantenerlo a mano.
+    """
+    
+    @classmethod
+    def relaciones(cls):
+        if '_relaciones' not in cls.__dict__:
+            cls._relaciones = list(dict.fromkeys(
+                '__'.join(campo.source_attrs[:-1])
+                for campo in cls().fields.values()
+                if not campo.write_only and len(campo.source_attrs) > 1
+            ))
+        return cls._relaciones
+    
+    @classmethod
+    def con_relaciones(cls, queryset):
+        return queryset.select_related(*cls.relaciones())
 
 
 class UsuarioSerializer(serializers.ModelSerializer):
@@ -91,7 +119,7 @@ class LibroSerializer(serializers.ModelSerializer):
         return obj.ejemplares_disponibles()
 
 
-class EjemplarSerializer(serializers.ModelSerializer):
+class EjemplarSerializer(PlanRelacionesMixin, serializers.ModelSerializer):
     """Serializer básico para Ejemplar"""
     libro_titulo = serializers.CharField(source='libro.titulo', read_only=True, label='Título del Libro')
     sucursal_nombre = serializers.CharField(source='sucursal.nombre', read_only=True, label='Nombre de Sucursal')
@@ -108,7 +136,7 @@ class EjemplarSerializer(serializers.ModelSerializer):
         }
 
 
-class PrestamoSerializer(serializers.ModelSerializer):
+class PrestamoSerializer(PlanRelacionesMixin, serializers.ModelSerializer):
     """Serializer básico para Prestamo"""
     usuario_username = serializers.CharField(source='usuario.username', read_only=True, label='Usuario')
     libro_titulo = serializers.CharField(source='ejemplar.libro.titulo', read_only=True, label='Libro')
@@ -177,16 +205,18 @@ class PerfilUsuarioSerializer(serializers.ModelSerializer):
         return obj.prestamos.filter(estado='activo').count()
 
 
-class ReservaSerializer(serializers.ModelSerializer):
+class ReservaSerializer(PlanRelacionesMixin, serializers.ModelSerializer):
     """Serializer básico para Reserva"""
     usuario_username = serializers.CharField(source='usuario.username', read_only=True, label='Usuario')
     libro_titulo = serializers.CharField(source='libro.titulo', read_only=True, label='Libro')
     libro_autor = serializers.CharField(source='libro.autor', read_only=True, label='Autor')
+    fecha_estimada_disponibilidad = serializers.SerializerMethodField(label='Fecha Estimada de Disponibilidad')
     
     class Meta:
         model = Reserva
         fields = ['id', 'usuario', 'libro', 'fecha_reserva', 'fecha_expiracion', 
-                 'estado', 'posicion_cola', 'usuario_username', 'libro_titulo', 'libro_autor']
+                 'estado', 'posicion_cola', 'usuario_username', 'libro_titulo', 'libro_autor',
+                 'fecha_estimada_disponibilidad']
         read_only_fields = ['fecha_reserva', 'fecha_expiracion', 'posicion_cola']
         extra_kwargs = {
             'usuario': {'label': 'Usuario'},
@@ -194,6 +224,10 @@ class ReservaSerializer(serializers.ModelSerializer):
             'estado': {'label': 'Estado'},
         }
     
+    def get_fecha_estimada_disponibilidad(self, obj):
+        """Fecha estimada calculada por la vista para toda la cola (None si no se calculó)"""
+        return self.context.get('fechas_estimadas', {}).get(obj.id)
+    
     def validate(self, data):
         """Validaciones para crear reserva"""
         usuario = data.get('usuario')
@@ -223,4 +257,207 @@ class ReservaSerializer(serializers.ModelSerializer):
         
         validated_data['posicion_cola'] = ultima_posicion + 1
         
-        return super().create(validated_data) 
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class TrabajoReporteSerializer(serializers.ModelSerializer):
+    """Serializer de solo lectura para consultar el estado de un trabajo de reporte"""
+    
+    class Meta:
+        model = TrabajoReporte
+        fields = ['id', 'tipo', 'parametros', 'estado', 'resultado', 'error', 
+                 'creado_en', 'iniciado_en', 'completado_en', 'expira_en']
+        read_only_fields = fields
+
+
+# ============================================================================
+# SERIALIZACIÓN RÁPIDA DE SOLO LECTURA DESDE values()
+# ============================================================================
+
+# Campos cuyo to_representation devuelve tal cual el valor que entrega values() (la clave primaria en las relaciones)
+SIN_CONVERSION = (
+    serializers.CharField, serializers.EmailField, serializers.IntegerField, serializers.BooleanField,
+    serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+)
+FECHA_ISO = object() #DateTimeField en ISO 8601: se convierte con fecha_iso y la zona horaria resuelta una vez por lista
+
+
+def fecha_iso(zona, valor):
+    """Lo mismo que DateTimeField.to_representation en formato ISO 8601, sin buscar la zona horaria en cada valor"""
+    if zona is not None:
+        valor = valor.astimezone(zona) if timezone.is_aware(valor) else timezone.make_aware(valor, zona)
+    texto = valor.isoformat()
+    return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+
+
+class ValoresSerializer:
+    """
+    Misma salida que serializer_class para listas de solo lectura, sin instanciar modelos ni campos por fila:
+    lee filas planas con values() (los source con puntos se vuelven joins) y aplica las conversiones
+    de cada campo resueltas una sola vez por clase. Los SerializerMethodField se calculan con
+    get_<campo>(fila), después de preparar(filas), que puede resolver todas las filas con una consulta.
+    Recibe un queryset o filas ya leídas con valores(queryset) (por ejemplo una página).
+    
+    campos (?fields=) limita la salida y las columnas leídas: un campo no pedido no agrega su join.
+    expandir (?expand=) cambia el id de una relación de expandibles por un objeto con esos campos,
+    leídos en la misma consulta. columnas son rutas extra que la vista necesita en self.filas.
+    """
+    serializer_class = None
+    expandibles = {} #relación -> campos del modelo relacionado que se incluyen con ?expand=
+    expandibles_personal = () #relaciones con datos personales de otros usuarios: solo bibliotecarios y administradores
+    
+    def __init__(self, filas, context=None, campos=None, expandir=(), columnas=()):
+        self.origen = filas
+        self.context = context or {}
+        self.pedidos = campos
+        self.expandir = tuple(expandir)
+        self.columnas = tuple(columnas)
+    
+    @classmethod
+    def campos(cls):
+        """(nombre, ruta de values() o None, conversión) de cada campo legible, en el orden de serializer_class"""
+        if '_campos' not in cls.__dict__:
+            campos = []
+            for nombre, campo in cls.serializer_class().fields.items():
+                if campo.write_only:
+                    continue
+                if isinstance(campo, serializers.SerializerMethodField):
+                    campos.append((nombre, None, getattr(cls, f'get_{nombre}')))
+                else:
+                    if type(campo) in SIN_CONVERSION:
+                        conversion = None
+                    elif (type(campo) is serializers.DateTimeField and not hasattr(campo, 'timezone')
+                          and getattr(campo, 'format', api_settings.DATETIME_FORMAT) == ISO_8601):
+                        conversion = FECHA_ISO
+                    else:
+                        conversion = campo.to_representation
+                    campos.append((nombre, '__'.join(campo.source_attrs), conversion))
+            cls._campos = campos
+        return cls._campos
+    
+    @classmethod
+    def seleccion_pedida(cls, parametros, rol=None):
+        """
+        {'campos': ..., 'expandir': ...} desde ?fields=a,b y ?expand=rel (sin fields se devuelven todos los campos).
+        ValueError con el mensaje para el cliente si pide un campo o una relación que no existe, o una de
+        expandibles_personal sin ser bibliotecario o administrador (rol del usuario autenticado).
+        """
+        campos = [campo.strip() for campo in parametros.get('fields', '').split(',') if campo.strip()] or None
+        expandir = [relacion.strip() for relacion in parametros.get('expand', '').split(',') if relacion.strip()]
+        disponibles = [nombre for nombre, _, _ in cls.campos()]
+        desconocidos = [campo for campo in campos or () if campo not in disponibles]
+        if desconocidos:
+            raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}. Disponibles: {', '.join(disponibles)}")
+        desconocidas = [relacion for relacion in expandir if relacion not in cls.expandibles]
+        if desconocidas:
+            raise ValueError(
+                f"No se puede expandir: {', '.join(desconocidas)}. Disponibles: {', '.join(cls.expandibles) or 'ninguna'}"
+            )
+        restringidas = [relacion for relacion in expandir if relacion in cls.expandibles_personal]
+        if restringidas and rol not in ('bibliotecario', 'administrador'):
+            raise ValueError(f"Solo bibliotecarios y administradores pueden expandir: {', '.join(restringidas)}")
+        return {'campos': campos, 'expandir': expandir}
+    
+    @classmethod
+    def seleccion(cls, campos=None, expandir=()):
+        """Los campos de campos() que se serializan: todos, o los pedidos y los expandidos en el orden de la clase"""
+        if campos is None:
+            return cls.campos()
+        return [campo for campo in cls.campos() if campo[0] in campos or campo[0] in expandir]
+    
+    @classmethod
+    def valores(cls, queryset, campos=None, expandir=(), columnas=()):
+        """El queryset de filas planas con las columnas y joins que necesitan los campos pedidos"""
+        rutas = [ruta for _, ruta, _ in cls.seleccion(campos, expandir) if ruta]
+        for relacion in expandir:
+            rutas += [f'{relacion}__{campo}' for campo in cls.expandibles[relacion]]
+        rutas = dict.fromkeys(rutas + list(columnas) + ['id']) #sin repetir y en orden fijo: misma SQL en todos los procesos
+        return queryset.values(*rutas)
+    
+    def incluye(self, nombre):
+        """True si el campo se serializa (para que preparar no calcule lo que no se pidió)"""
+        return self.pedidos is None or nombre in self.pedidos
+    
+    def preparar(self, filas):
+        """Para que las subclases calculen en bloque lo que necesitan sus get_<campo>"""
+    
+    @property
+    def data(self):
+        fecha = functools.partial(fecha_iso, timezone.get_current_timezone() if settings.USE_TZ else None)
+        campos = [
+            (nombre, ruta, fecha if conversion is FECHA_ISO else conversion)
+            for nombre, ruta, conversion in self.seleccion(self.pedidos, self.expandir)
+        ]
+        expandidos = [
+            (relacion, [(campo, f'{relacion}__{campo}') for campo in self.expandibles[relacion]])
+            for relacion in self.expandir
+        ]
+        if isinstance(self.origen, list):
+            filas = self.origen
+        else:
+            filas = list(self.valores(self.origen, self.pedidos, self.expandir, self.columnas))
+        self.filas = filas #filas crudas, para estadísticas de la vista
+        self.preparar(filas)
+        
+        datos = []
+        for fila in filas:
+            item = {}
+            for nombre, ruta, conversion in campos:
+                if ruta is None:
+                    item[nombre] = conversion(self, fila)
+                else:
+                    valor = fila[ruta]
+                    item[nombre] = valor if conversion is None or valor is None else conversion(valor)
+            for relacion, rutas in expandidos:
+                if item[relacion] is not None:
+                    item[relacion] = {'id': item[relacion], **{campo: fila[ruta] for campo, ruta in rutas}}
+            datos.append(item)
+        return datos
+
+
+class LibroValoresSerializer(ValoresSerializer):
+    """LibroSerializer con los ejemplares disponibles de todos los libros en una consulta agrupada"""
+    serializer_class = LibroSerializer
+    
+    def preparar(self, filas):
+        if not self.incluye('ejemplares_disponibles'):
+            return
+        self.disponibles = dict(Ejemplar.objects.filter(
+            libro_id__in=[fila['id'] for fila in filas], estado='disponible'
+        ).values('libro_id').annotate(cantidad=Count('id')).values_list('libro_id', 'cantidad'))
+    
+    def get_ejemplares_disponibles(self, fila):
+        return self.disponibles.get(fila['id'], 0)
+
+
+class SucursalValoresSerializer(ValoresSerializer):
+    serializer_class = SucursalSerializer
+
+
+class EjemplarValoresSerializer(ValoresSerializer):
+    serializer_class = EjemplarSerializer
+    expandibles = {
+        'libro': ['titulo', 'autor', 'isbn'],
+        'sucursal': ['nombre'],
+    }
+
+
+class PrestamoValoresSerializer(ValoresSerializer):
+    serializer_class = PrestamoSerializer
+    expandibles = {
+        'usuario': ['username', 'first_name', 'last_name'],
+        'ejemplar': ['codigo_barras', 'libro', 'sucursal'],
+    }
+    expandibles_personal = ('usuario',) #nombre y apellido
+
+
+class ReservaValoresSerializer(ValoresSerializer):
+    serializer_class = ReservaSerializer
+    expandibles = {
+        'usuario': ['username', 'first_name', 'last_name'],
+        'libro': ['titulo', 'autor', 'isbn'],
+    }
+    expandibles_personal = ('usuario',) #nombre y apellido
+    
+    def get_fecha_estimada_disponibilidad(self, fila):
+        return self.context.get('fechas_estimadas', {}).get(fila['id'])
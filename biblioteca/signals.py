@@ -0,0 +1,75 @@
+# SEÑALES - ACCIONES AUTOMÁTICAS AL GUARDAR O ELIMINAR MODELOS
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import cambios
+from .autenticacion import invalidar_usuario
+from .cache import invalidar_resultados, alcance_usuario, invalidar_objeto
+from .models import Usuario, Libro, Sucursal, Ejemplar, Prestamo, Reserva, MovimientoMulta
+
+
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Reserva)
+@receiver([post_save, post_delete], sender=Ejemplar)
+@receiver([post_save, post_delete], sender=Usuario)
+@receiver([post_save, post_delete], sender=Libro)
+@receiver(post_save, sender=MovimientoMulta)
+def invalidar_reportes(sender, update_fields=None, **kwargs):
+    """Los reportes y estadísticas en caché que leen este modelo dejan de ser válidos"""
+    if update_fields and set(update_fields) == {'last_login'}: #cada login guarda last_login, no afecta a los reportes
+        return
+    invalidar_resultados(modelo=sender)
+
+
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Reserva)
+@receiver(post_save, sender=MovimientoMulta)
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidar_tablero_usuario(sender, instance, update_fields=None, **kwargs):
+    """El tablero en caché de un usuario se descarta solo cuando cambian sus préstamos, reservas, multas o perfil"""
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidar_resultados(alcance_usuario(instance.id if sender is Usuario else instance.usuario_id))
+
+
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidar_usuario_autenticado(sender, instance, update_fields=None, **kwargs):
+    """Los tokens emitidos antes del cambio vuelven a leer el usuario (rol, suspendido, activo)"""
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    usuario_id = instance.id
+    invalidar_usuario(usuario_id)
+    # Otra vez al confirmar: una petición entre el save y el commit pudo guardar en caché los datos anteriores
+    transaction.on_commit(lambda: invalidar_usuario(usuario_id))
+
+
+@receiver(post_save, sender=MovimientoMulta)
+def invalidar_saldo_usuario(sender, instance, **kwargs):
+    """El saldo se actualiza con UPDATE (sin post_save de Usuario), el usuario en caché quedó desactualizado"""
+    usuario_id = instance.usuario_id
+    invalidar_usuario(usuario_id)
+    transaction.on_commit(lambda: invalidar_usuario(usuario_id))
+
+
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=Sucursal)
+def invalidar_objeto_cacheado(sender, instance, **kwargs):
+    """Nueva versión del objeto en la caché de dos niveles"""
+    pk = instance.pk
+    invalidar_objeto(sender, pk)
+    # Otra vez al confirmar: una lectura entre el save y el commit pudo guardar en caché los datos anteriores
+    transaction.on_commit(lambda: invalidar_objeto(sender, pk))
+
+
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=Sucursal)
+@receiver([post_save, post_delete], sender=Ejemplar)
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Reserva)
+def registrar_cambio(sender, instance, signal, created=False, raw=False, **kwargs):
+    """Entrada en el feed de cambios (/api/cambios/) al confirmar la transacción"""
+    if raw: #loaddata: los fixtures no son cambios de los clientes
+        return
+    cambios.registrar(instance, creado=created, eliminado=signal is post_delete)
@@ -0,0 +1,834 @@
+# PRUEBAS DE LA API DE BIBLIOTECA
+#
+# python manage.py test biblioteca
+# Los datos salen de generar_datos (pocas sucursales, libros y usuarios, unos meses de préstamos), siempre con
+# la misma semilla, así cada prueba compara contra el mismo conjunto.
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as tz
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connections, transaction
+from django.db.models import Count
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from biblioteca import analitica, cambios, replicas, reportes
+from biblioteca.backends import pool as pool_conexiones
+from biblioteca.autenticacion import JWTAutenticacionCacheada, tokens_para
+from biblioteca.cache import invalidar_resultados, obtener_objeto
+from biblioteca.compresion import CompresionMiddleware
+from biblioteca.checks import cache_compartida_autenticacion, cache_compartida_replicas
+from biblioteca.importacion import ImportacionUsuarios
+from biblioteca.management.commands.benchmark_serializadores import SERIALIZADORES
+from biblioteca.instrumentacion import PRESUPUESTOS_CONSULTAS, PresupuestoExcedido, presupuesto_consultas, rutas_get
+from biblioteca.renderers import JSONRapidoRenderer
+from biblioteca.models import Usuario, Sucursal, Libro, Ejemplar, Prestamo, Reserva, ContadorPrestamos, MovimientoMulta, Cambio
+
+
+class DatosGeneradosMixin:
+    """Datos de generar_datos y un administrador para hacer las peticiones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generar_datos', sucursales=3, libros=40, usuarios=30, anios=0.25, prestamos_por_dia=20,
+            stdout=StringIO()
+        )
+        cls.admin = Usuario.objects.create_user(username='admin_pruebas', password='x', rol='administrador')
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.admin)
+
+
+class ContadorPrestamosTests(DatosGeneradosMixin, TestCase):
+    """El contador mantenido en cada préstamo da lo mismo que contar Prestamo directamente"""
+
+    @staticmethod
+    def ranking_directo(limite=10, genero=None, sucursal=None, desde=None, hasta=None):
+        prestamos = Prestamo.objects.all()
+        if genero:
+            prestamos = prestamos.filter(ejemplar__libro__genero=genero)
+        if sucursal:
+            prestamos = prestamos.filter(ejemplar__sucursal_id=sucursal)
+        if desde:
+            prestamos = prestamos.filter(fecha_prestamo__date__gte=desde)
+        if hasta:
+            prestamos = prestamos.filter(fecha_prestamo__date__lte=hasta)
+        return [
+            (fila['ejemplar__libro'], fila['total'])
+            for fila in prestamos.values('ejemplar__libro').annotate(total=Count('id')).order_by('-total', 'ejemplar__libro')[:limite]
+        ]
+
+    def prestar_disponibles(self, cantidad):
+        """Préstamos nuevos por la API, que es donde se incrementa el contador"""
+        usuarios = Usuario.objects.filter(rol='usuario', suspendido=False)
+        creados = 0
+        for ejemplar, usuario in zip(Ejemplar.objects.filter(estado='disponible')[:cantidad], usuarios):
+            respuesta = self.cliente.post('/api/prestamos/', {'usuario_id': usuario.id, 'ejemplar_id': ejemplar.id}, format='json')
+            self.assertIn(respuesta.status_code, (201, 400), respuesta.content) #400 si el usuario no puede pedir más
+            creados += respuesta.status_code == 201
+        self.assertGreater(creados, 0)
+
+    def test_contador_igual_al_conteo_por_libro(self):
+        self.prestar_disponibles(10)
+        directo = dict(Prestamo.objects.values_list('ejemplar__libro').annotate(total=Count('id')))
+        contador = {
+            libro_id: sum(ContadorPrestamos.objects.filter(libro_id=libro_id).values_list('total', flat=True))
+            for libro_id in directo
+        }
+        self.assertEqual(contador, directo)
+
+    def test_ranking_igual_al_agregado_directo(self):
+        self.prestar_disponibles(10)
+        hoy = timezone.localdate()
+        filtros = [
+            {},
+            {'limite': 3},
+            {'genero': Libro.objects.values_list('genero', flat=True).first()},
+            {'sucursal': Sucursal.objects.values_list('id', flat=True).first()},
+            {'desde': hoy - timedelta(days=30), 'hasta': hoy},
+            {'desde': hoy - timedelta(days=60), 'hasta': hoy - timedelta(days=30), 'limite': 5},
+        ]
+        for filtro in filtros:
+            with self.subTest(**filtro):
+                ranking = [(fila['libro_id'], fila['total_prestamos']) for fila in ContadorPrestamos.mas_prestados(**filtro)]
+                self.assertEqual(ranking, self.ranking_directo(**filtro))
+
+    def test_reconstruir_da_el_mismo_contador(self):
+        self.prestar_disponibles(5)
+        antes = sorted(ContadorPrestamos.objects.values_list('libro_id', 'sucursal_id', 'fecha', 'total'))
+        call_command('reconstruir_contador_prestamos', stdout=StringIO())
+        self.assertEqual(sorted(ContadorPrestamos.objects.values_list('libro_id', 'sucursal_id', 'fecha', 'total')), antes)
+
+    def test_limite_invalido_responde_400(self):
+        for limite in ('-5', '0', 'x'):
+            with self.subTest(limite=limite):
+                self.assertEqual(self.cliente.get('/api/reportes/libros-populares/', {'limite': limite}).status_code, 400)
+        respuesta = self.cliente.get('/api/reportes/libros-populares/', {'limite': '500'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertLessEqual(len(respuesta.data['libros']), 100)
+
+
+class ResultadosCacheTests(DatosGeneradosMixin, TestCase):
+    """Cada reporte en caché se descarta solo cuando cambia un modelo que lee"""
+
+    def test_escritura_de_otro_modelo_no_descarta_el_reporte(self):
+        reportes.obtener_usuarios_con_multas()
+        Reserva.objects.filter(estado='activa').first().save()
+        Prestamo.objects.first().save()
+        with self.assertNumQueries(0):
+            reportes.obtener_usuarios_con_multas()
+
+    def test_escritura_de_un_modelo_leido_descarta_el_reporte(self):
+        antes = reportes.obtener_usuarios_con_multas()
+        usuario = Usuario.objects.filter(rol='usuario').exclude(username__in=[fila['username'] for fila in antes]).first()
+        usuario.multas_pendientes = (antes[0]['multas_pendientes'] if antes else 0) + 1000
+        usuario.save()
+        self.assertEqual(reportes.obtener_usuarios_con_multas()[0]['username'], usuario.username)
+
+    def test_agregados_no_se_descartan_con_cada_prestamo(self):
+        reportes.obtener_estadisticas_generales()
+        Prestamo.objects.first().save()
+        with self.assertNumQueries(0):
+            reportes.obtener_estadisticas_generales()
+
+
+class CacheObjetosTests(DatosGeneradosMixin, TestCase):
+    """Caché de objetos de dos niveles: solo Libro y Sucursal, y una copia nueva al guardar"""
+
+    def test_libro_en_cache_hasta_guardarlo(self):
+        libro = Libro.objects.first()
+        obtener_objeto(Libro, libro.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_objeto(Libro, libro.id).titulo, libro.titulo)
+        libro.titulo = 'Otro título'
+        libro.save()
+        self.assertEqual(obtener_objeto(Libro, libro.id).titulo, 'Otro título')
+
+    def test_ejemplar_fuera_de_la_cache(self):
+        with self.assertRaises(ValueError): #su estado cambia con cada préstamo y devolución
+            obtener_objeto(Ejemplar, Ejemplar.objects.first().id)
+
+
+class AutenticacionTests(DatosGeneradosMixin, TestCase):
+    """Los cambios de rol, suspensión y baja se aplican a los tokens ya emitidos"""
+
+    def setUp(self):
+        self.bibliotecario = Usuario.objects.create_user(username='bibliotecario_pruebas', password='x', rol='bibliotecario')
+        self.cliente = APIClient()
+        self.cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_para(self.bibliotecario).access_token}')
+
+    def test_token_vigente(self):
+        self.assertEqual(self.cliente.get('/api/reportes/').status_code, 200)
+
+    def test_token_vigente_sin_consultas(self):
+        peticion = APIRequestFactory().get('/api/libros/', HTTP_AUTHORIZATION=f'Bearer {tokens_para(self.bibliotecario).access_token}')
+        with self.assertNumQueries(0):
+            usuario, _ = JWTAutenticacionCacheada().authenticate(peticion)
+            self.assertEqual((usuario.id, usuario.rol), (self.bibliotecario.id, 'bibliotecario'))
+
+    def test_cambio_de_rol(self):
+        self.bibliotecario.rol = 'usuario'
+        self.bibliotecario.save()
+        self.assertEqual(self.cliente.get('/api/reportes/').status_code, 403)
+
+    def test_usuario_desactivado(self):
+        self.bibliotecario.is_active = False
+        self.bibliotecario.save()
+        self.assertEqual(self.cliente.get('/api/libros/').status_code, 401)
+
+
+class VistasAsincronasTests(DatosGeneradosMixin, TestCase):
+    """Las rutas de /api/async/ responden lo mismo que sus equivalentes DRF de /api/"""
+    maxDiff = None
+
+    def setUp(self):
+        super().setUp()
+        self.cliente_async = AsyncClient()
+
+    async def get_async(self, ruta, encabezados):
+        return await self.cliente_async.get(ruta, headers=encabezados)
+
+    def comparar(self, ruta, usuario=None, token=None):
+        """GET de /api/<ruta> y /api/async/<ruta> con el mismo token; devuelve el estado de ambas"""
+        if usuario is not None:
+            token = str(tokens_para(usuario).access_token)
+        encabezados = {'Authorization': f'Bearer {token}'} if token else {}
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()): #fechas estimadas de la cola
+            sincrona = APIClient().get(f'/api/{ruta}', headers=encabezados)
+            asincrona = async_to_sync(self.get_async)(f'/api/async/{ruta}', encabezados)
+        self.assertEqual(asincrona.status_code, sincrona.status_code, ruta)
+        cuerpo = asincrona.content.decode().replace('/api/async/', '/api/') #enlaces de paginación
+        self.assertEqual(json.loads(cuerpo), json.loads(sincrona.content), ruta)
+        return sincrona.status_code
+
+    def test_mismas_respuestas(self):
+        libro = Reserva.objects.filter(estado='activa').values_list('libro_id', flat=True).first() or Libro.objects.first().id
+        lector = Usuario.objects.filter(rol='usuario', prestamos__isnull=False).first()
+        for ruta in [
+            'libros/', 'libros/?page=2', 'libros/?fields=id,titulo,ejemplares_disponibles',
+            'libros/buscar/?q=libro', f'libros/{libro}/disponibilidad/', f'reservas/cola/{libro}/', 'usuarios/tablero/',
+        ]:
+            self.assertEqual(self.comparar(ruta, self.admin), 200, ruta)
+        self.assertEqual(self.comparar('usuarios/tablero/', lector), 200)
+        self.assertEqual(self.comparar('libros/?fields=no_existe', self.admin), 400)
+
+    def test_sin_autenticar(self):
+        for ruta in ['libros/', 'usuarios/tablero/']:
+            self.assertEqual(self.comparar(ruta), 401)
+            self.assertEqual(self.comparar(ruta, token='no-es-un-token'), 401)
+
+
+class PagosEnLoteTests(TestCase):
+    """Un pago con la misma referencia se registra una sola vez"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='deudor', password='x')
+        MovimientoMulta.registrar(self.usuario.id, 'cargo', '5000.00')
+
+    def pagar(self, *referencias):
+        pagos = [{'usuario': self.usuario.id, 'monto': '100.00', 'referencia': referencia} for referencia in referencias]
+        return [resultado['estado'] for resultado in MovimientoMulta.pagar_en_lote(pagos)]
+
+    def test_lote_repetido(self):
+        self.assertEqual(self.pagar('R-1', 'R-2', ''), ['registrado', 'registrado', 'registrado'])
+        self.assertEqual(self.pagar('R-1', 'R-2'), ['duplicado', 'duplicado'])
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.multas_pendientes, 4700)
+
+    def test_referencia_repetida_en_el_lote(self):
+        self.assertEqual(self.pagar('R-1', 'R-1'), ['registrado', 'duplicado'])
+
+    def test_referencia_larga_rechazada(self):
+        larga = 'R' * 100
+        self.assertEqual(self.pagar(larga + 'a', larga + 'b'), ['rechazado', 'rechazado'])
+        self.assertEqual(self.pagar(larga, larga), ['registrado', 'duplicado'])
+
+
+class FechasPrestamoReservaTests(TestCase):
+    """Las fechas calculadas al guardar son aware y se comparan con timezone.now()"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='lector', password='x')
+        sucursal = Sucursal.objects.create(nombre='Centro', direccion='-', telefono='-', horario_atencion='-')
+        self.libro = Libro.objects.create(titulo='L', autor='A', isbn='1', genero='ficcion', año_publicacion=2000)
+        self.ejemplar = Ejemplar.objects.create(libro=self.libro, sucursal=sucursal, codigo_barras='E-1', estado='prestado')
+
+    def test_prestamo_nuevo(self):
+        prestamo = Prestamo.objects.create(usuario=self.usuario, ejemplar=self.ejemplar)
+        self.assertTrue(timezone.is_aware(prestamo.fecha_devolucion_esperada))
+        self.assertFalse(prestamo.esta_vencido())
+        prestamo.devolver()
+        prestamo.refresh_from_db()
+        self.assertEqual((prestamo.estado, prestamo.multa), ('devuelto', 0))
+
+    def test_reserva_nueva(self):
+        reserva = Reserva.objects.create(usuario=self.usuario, libro=self.libro)
+        self.assertTrue(timezone.is_aware(reserva.fecha_expiracion))
+        self.assertFalse(reserva.esta_expirada())
+        reserva.fecha_expiracion = timezone.now() - timedelta(minutes=1)
+        self.assertTrue(reserva.esta_expirada())
+
+
+class ImportacionUsuariosTests(TestCase):
+    """Importación desde CSV: repetidos, errores por fila y columnas obligatorias"""
+
+    CSV = (
+        'username,password,email,rol\n'
+        'ana,clave1,ana@example.com,usuario\n' #fila 2
+        'beto,clave2,no-es-un-email,usuario\n' #fila 3
+        'carla,clave3,,administrador\n' #fila 4
+        'ana,otra,,usuario\n' #fila 5: repetido en el archivo
+        'existente,clave4,,bibliotecario\n' #fila 6: ya registrado
+        'dario,clave5,,bibliotecario\n' #fila 7
+    )
+
+    def setUp(self):
+        Usuario.objects.create_user(username='existente', password='x')
+
+    def test_importar_csv(self):
+        resumen = ImportacionUsuarios(lote=2, procesos=1).importar(StringIO(self.CSV))
+        self.assertEqual(
+            {clave: resumen[clave] for clave in ('filas', 'creados', 'duplicados', 'con_errores')},
+            {'filas': 6, 'creados': 2, 'duplicados': 2, 'con_errores': 2}
+        )
+        self.assertEqual([(error['fila'], error['error']) for error in resumen['errores']], [
+            (3, 'email inválido'),
+            (4, 'rol inválido, opciones: usuario, bibliotecario'),
+        ])
+        ana, dario = Usuario.objects.get(username='ana'), Usuario.objects.get(username='dario')
+        self.assertTrue(ana.check_password('clave1')) #la primera fila gana, la contraseña queda encriptada
+        self.assertEqual((ana.email, dario.rol), ('ana@example.com', 'bibliotecario'))
+
+    def test_columnas_faltantes(self):
+        with self.assertRaisesMessage(ValueError, 'Faltan columnas: password'):
+            ImportacionUsuarios(procesos=1).importar(StringIO('username,email\nana,ana@example.com\n'))
+        self.assertFalse(Usuario.objects.filter(username='ana').exists())
+
+
+class PresupuestosConsultasTests(DatosGeneradosMixin, TestCase):
+    """Cada endpoint con presupuesto en PRESUPUESTOS_CONSULTAS lo respeta (mismo recorrido que verificar_presupuestos)"""
+
+    def test_endpoints_dentro_del_presupuesto(self):
+        rutas = [(nombre, ruta, datos) for nombre, ruta, datos, _ in rutas_get(PRESUPUESTOS_CONSULTAS) if ruta]
+        self.assertEqual({nombre for nombre, _, _ in rutas}, set(PRESUPUESTOS_CONSULTAS)) #ninguno omitido por falta de datos
+        for nombre, ruta, datos in rutas:
+            with self.subTest(nombre):
+                invalidar_resultados() #sin resultados en caché, el peor caso
+                with presupuesto_consultas(nombre):
+                    respuesta = self.cliente.get(ruta, datos)
+                self.assertEqual(respuesta.status_code, 200, respuesta.content[:200])
+
+    def test_listas_con_tamano_de_pagina_1_y_100(self):
+        lector = Usuario.objects.filter(rol='usuario').annotate(total=Count('reservas')).order_by('-total').first()
+        libro = Reserva.objects.filter(estado='activa').values('libro').annotate(total=Count('id')).order_by('-total')[0]['libro']
+        personales = APIClient()
+        personales.force_authenticate(lector) #historial y reservas propias: el administrador no tiene
+        listas = [
+            ('libro-api', '/api/libros/', self.cliente),
+            ('buscar-libros-api', '/api/libros/buscar/?q=a', self.cliente),
+            ('sucursal-api', '/api/sucursales/', self.cliente),
+            ('ejemplar-api', '/api/ejemplares/', self.cliente),
+            ('prestamo-api', '/api/prestamos/', self.cliente),
+            ('prestamos-activos-api', '/api/prestamos/activos/', self.cliente),
+            ('prestamos-vencidos-api', '/api/prestamos/vencidos/', self.cliente),
+            ('reserva-api', '/api/reservas/', self.cliente),
+            ('cola-reservas-api', f'/api/reservas/cola/{libro}/', self.cliente),
+            ('historial-prestamos-api', '/api/usuarios/historial-prestamos/', personales),
+            ('mis-reservas-api', '/api/usuarios/mis-reservas/', personales),
+        ]
+        paginacion = import_string(settings.REST_FRAMEWORK['DEFAULT_PAGINATION_CLASS'])
+        for nombre, ruta, cliente in listas:
+            consultas = {}
+            for tamano in (1, 100):
+                with self.subTest(nombre, tamano=tamano):
+                    invalidar_resultados()
+                    with mock.patch.object(paginacion, 'page_size', tamano), presupuesto_consultas(nombre) as medicion:
+                        respuesta = cliente.get(ruta)
+                    self.assertEqual(respuesta.status_code, 200, respuesta.content[:200])
+                    consultas[tamano] = medicion.consultas
+                    if tamano == 100: #con una sola fila no se notaría una consulta por fila
+                        self.assertGreater(max(len(valor) for valor in respuesta.data.values() if isinstance(valor, list)), 1)
+            with self.subTest(nombre):
+                self.assertLessEqual(consultas[100], consultas[1])
+
+    def test_presupuesto_excedido(self):
+        with self.assertRaises(PresupuestoExcedido):
+            with presupuesto_consultas('libro-api', maximo=0):
+                self.cliente.get('/api/libros/')
+
+    def test_presupuesto_excedido_ruta_con_parametros(self):
+        libro = Libro.objects.first()
+        with self.assertRaisesMessage(PresupuestoExcedido, 'cola-reservas-api usó'):
+            with presupuesto_consultas('cola-reservas-api', maximo=0):
+                self.cliente.get(f'/api/reservas/cola/{libro.id}/')
+
+
+class SerializadoresValoresTests(DatosGeneradosMixin, TestCase):
+    """Los ValoresSerializer (filas de values()) devuelven el mismo JSON que los ModelSerializer (la velocidad la mide benchmark_serializadores)"""
+
+    FILAS = 200
+
+    def filas(self, nombre):
+        clase, valores, consulta = SERIALIZADORES[nombre]
+        queryset = consulta().order_by('id')[:self.FILAS]
+        ids = list(queryset.values_list('id', flat=True))
+        self.assertTrue(ids, f'generar_datos no creó filas de {nombre}')
+        contexto = {'fechas_estimadas': {pk: timezone.now() for pk in ids[::2]}} #para los SerializerMethodField
+        return clase, valores, queryset, contexto
+
+    def test_misma_salida(self):
+        renderer = JSONRenderer()
+        for nombre in SERIALIZADORES:
+            with self.subTest(nombre):
+                clase, valores, queryset, contexto = self.filas(nombre)
+                self.assertEqual(
+                    renderer.render(valores(queryset, context=contexto).data),
+                    renderer.render(clase(list(queryset), many=True, context=contexto).data)
+                )
+
+
+class RenderersTests(SimpleTestCase):
+    """JSONRapidoRenderer produce los mismos bytes que JSONRenderer y las respuestas chicas no se comprimen"""
+
+    def test_mismos_bytes_que_drf(self):
+        datos = {
+            'multa': Decimal('1500.50'),
+            'fechas': [
+                datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=tz.utc),
+                datetime(2026, 3, 1, 9, 30, tzinfo=tz(timedelta(hours=-3))),
+            ],
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'etiqueta': gettext_lazy('Préstamo'),
+            'texto': 'línea\u2028párrafo\u2029fin',
+            'valores': [1, 2.5, None, True, {'anidado': 'ñ'}],
+        }
+        self.assertEqual(JSONRapidoRenderer().render(datos), JSONRenderer().render(datos))
+
+    def comprimir(self, tamaño):
+        middleware = CompresionMiddleware(lambda request: HttpResponse(b'a' * tamaño))
+        return middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+
+    def test_compresion_desde_el_minimo(self):
+        with self.settings(COMPRESION_MINIMO=500):
+            chica = self.comprimir(499)
+            self.assertFalse(chica.has_header('Content-Encoding'))
+            self.assertEqual(chica.content, b'a' * 499)
+            self.assertEqual(self.comprimir(500)['Content-Encoding'], 'gzip')
+
+
+class ExpandirTests(DatosGeneradosMixin, TestCase):
+    """?expand=usuario muestra nombre y apellido: solo para el personal"""
+
+    def test_usuario_no_expande_otros_usuarios(self):
+        libro = Reserva.objects.filter(estado='activa').values_list('libro', flat=True).first()
+        lector = APIClient()
+        lector.force_authenticate(Usuario.objects.filter(rol='usuario').first())
+        for ruta in (f'/api/reservas/cola/{libro}/', '/api/reservas/', '/api/prestamos/', '/api/usuarios/mis-reservas/'):
+            with self.subTest(ruta):
+                self.assertEqual(lector.get(ruta, {'expand': 'usuario'}).status_code, 400)
+                self.assertEqual(lector.get(ruta).status_code, 200)
+
+    def test_personal_expande_usuario(self):
+        libro = Reserva.objects.filter(estado='activa').values_list('libro', flat=True).first()
+        respuesta = self.cliente.get(f'/api/reservas/cola/{libro}/', {'expand': 'usuario'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('first_name', respuesta.data['cola'][0]['usuario'])
+
+
+class LoteReplicasTests(DatosGeneradosMixin, TestCase):
+    """Cada subpetición del lote tiene su estado de réplicas y el lote solo cuenta como escritura si alguna escribió"""
+
+    def lote(self, peticiones, concurrente=False):
+        respuesta = self.cliente.post('/api/batch/', {'peticiones': peticiones, 'concurrente': concurrente}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content[:200])
+        return respuesta.data['respuestas']
+
+    def test_lote_de_lecturas_no_marca_escritura(self):
+        with mock.patch.object(replicas, 'marcar_escritura') as marcar:
+            self.lote([{'ruta': '/api/libros/'}, {'ruta': '/api/prestamos/activos/'}])
+        marcar.assert_not_called()
+
+    def test_lote_con_escritura_marca_escritura(self):
+        libro = Libro.objects.filter(activo=True).first()
+        lector = Usuario.objects.filter(rol='usuario', suspendido=False).first()
+        with mock.patch.object(replicas, 'marcar_escritura') as marcar:
+            respuestas = self.lote([{'metodo': 'POST', 'ruta': '/api/reservas/', 'cuerpo': {'libro_id': libro.id, 'usuario_id': lector.id}}])
+        self.assertLess(respuestas[0]['estado'], 400, respuestas[0]['cuerpo'])
+        marcar.assert_called_once_with(self.admin.id)
+
+    def test_subpeticiones_concurrentes_con_estado_propio(self):
+        lecturas = [] #(ruta de la subpetición, si la vista pidió réplica) en cada lectura
+        leer = replicas.ReplicaRouter.db_for_read
+
+        def registrar(router, model, **hints):
+            estado = replicas._peticion.get()
+            if estado is not None:
+                lecturas.append((estado['request'].path, estado['replica']))
+            return leer(router, model, **hints)
+
+        rutas = ['/api/libros/buscar/', '/api/prestamos/activos/'] * 4
+        with mock.patch.object(replicas.ReplicaRouter, 'db_for_read', registrar):
+            self.lote([{'ruta': ruta} for ruta in rutas], concurrente=True)
+        self.assertTrue(lecturas)
+        for ruta, replica in lecturas:
+            self.assertIn(ruta, rutas)
+            self.assertEqual(replica, ruta == '/api/libros/buscar/', ruta) #solo buscar está marcada con @lectura_replica
+
+
+@skipUnless('replica1' in settings.DATABASES, 'sin réplicas: DB_REPLICAS=localhost usa una réplica espejo de la base de pruebas')
+class ReplicaRouterTests(TransactionTestCase):
+    """Lecturas marcadas en la réplica, lectura propia tras escribir y primario si la réplica no responde"""
+
+    # replica1 es espejo de default (TEST.MIRROR) y ve lo que se confirma; sin réplicas la clase se omite
+    databases = {'default', 'replica1'} & set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear() #escrituras recientes de otras pruebas
+        replicas._estado_replicas.clear()
+        self.lector = Usuario.objects.create_user(username='lector', password='x')
+        sucursal = Sucursal.objects.create(nombre='Centro', direccion='-', telefono='-', horario_atencion='-')
+        self.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', isbn='1', genero='ficcion', año_publicacion=1963)
+        Ejemplar.objects.create(libro=self.libro, sucursal=sucursal, codigo_barras='E-1', estado='prestado')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.lector)
+
+    def consultas_en_replica(self, ruta, cliente=None):
+        """Respuesta de un GET y cuántas consultas fueron a replica1"""
+        with CaptureQueriesContext(connections['replica1']) as consultas:
+            respuesta = (cliente or self.cliente).get(ruta)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content[:200])
+        return respuesta, len(consultas)
+
+    def test_lectura_marcada_va_a_la_replica(self):
+        respuesta, en_replica = self.consultas_en_replica('/api/libros/buscar/?q=Rayuela')
+        self.assertGreater(en_replica, 0)
+        self.assertIn('Rayuela', respuesta.content.decode())
+        self.assertEqual(self.consultas_en_replica('/api/reservas/')[1], 0) #vista sin @lectura_replica
+
+    def test_lee_del_primario_despues_de_escribir(self):
+        respuesta = self.cliente.post('/api/reservas/', {'libro_id': self.libro.id}, format='json')
+        self.assertLess(respuesta.status_code, 400, respuesta.content[:200])
+        self.assertEqual(self.consultas_en_replica('/api/libros/buscar/?q=Rayuela')[1], 0)
+
+        otro = APIClient()
+        otro.force_authenticate(Usuario.objects.create_user(username='otro', password='x'))
+        self.assertGreater(self.consultas_en_replica('/api/libros/buscar/?q=Rayuela', otro)[1], 0) #solo el que escribió
+
+    def test_replica_caida_lee_del_primario(self):
+        with mock.patch.object(replicas, 'retraso_replica', side_effect=OperationalError('sin conexión')):
+            respuesta, en_replica = self.consultas_en_replica('/api/libros/buscar/?q=Rayuela')
+        self.assertEqual(en_replica, 0)
+        self.assertIn('Rayuela', respuesta.content.decode())
+
+    def test_replica_atrasada_lee_del_primario(self):
+        with mock.patch.object(replicas, 'retraso_replica', return_value=settings.REPLICAS_LAG_MAXIMO + 1):
+            self.assertEqual(self.consultas_en_replica('/api/libros/buscar/?q=Rayuela')[1], 0)
+
+
+class VerificacionesTests(SimpleTestCase):
+    """check --deploy exige una caché compartida para la autenticación y para las réplicas"""
+
+    LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    COMPARTIDA = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+
+    def test_autenticacion_con_cache_local(self):
+        with self.settings(CACHES=self.LOCAL):
+            self.assertEqual([error.id for error in cache_compartida_autenticacion(None)], ['biblioteca.E001'])
+        with self.settings(CACHES=self.COMPARTIDA):
+            self.assertEqual(cache_compartida_autenticacion(None), [])
+
+    def test_replicas_con_cache_local(self):
+        with self.settings(CACHES=self.LOCAL, REPLICAS_BD=['replica1']):
+            self.assertEqual([error.id for error in cache_compartida_replicas(None)], ['biblioteca.E002'])
+        with self.settings(CACHES=self.LOCAL, REPLICAS_BD=[]):
+            self.assertEqual(cache_compartida_replicas(None), [])
+        with self.settings(CACHES=self.COMPARTIDA, REPLICAS_BD=['replica1']):
+            self.assertEqual(cache_compartida_replicas(None), [])
+
+
+class CambiosTests(TestCase):
+    """Feed de cambios: cursor, visibilidad por usuario, bajas lógicas, escrituras revertidas y compactación"""
+
+    def setUp(self):
+        self.admin = Usuario.objects.create_user(username='admin_cambios', password='x', rol='administrador')
+        self.lector = Usuario.objects.create_user(username='lector', password='x')
+        self.otro = Usuario.objects.create_user(username='otro', password='x')
+        with self.captureOnCommitCallbacks(execute=True): #las entradas se agregan al confirmar
+            sucursal = Sucursal.objects.create(nombre='Centro', direccion='-', telefono='-', horario_atencion='-')
+            self.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', isbn='1', genero='ficcion', año_publicacion=1963)
+            otro_libro = Libro.objects.create(titulo='Ficciones', autor='Borges', isbn='2', genero='ficcion', año_publicacion=1944)
+            ejemplar = Ejemplar.objects.create(libro=self.libro, sucursal=sucursal, codigo_barras='E-1', estado='prestado')
+            self.prestamo = Prestamo.objects.create(usuario=self.lector, ejemplar=ejemplar)
+            self.ajeno = Prestamo.objects.create(usuario=self.otro, ejemplar=ejemplar)
+            self.reserva_ajena = Reserva.objects.create(usuario=self.otro, libro=otro_libro)
+        margen = self.settings(CAMBIOS_MARGEN=0)
+        margen.enable()
+        self.addCleanup(margen.disable)
+
+    def todo(self, usuario, desde=0, limite=None):
+        """Recorre el feed con el cursor hasta que hay_mas es False"""
+        entradas = []
+        while True:
+            respuesta = cambios.leer(usuario, desde, limite)
+            entradas += respuesta['cambios']
+            if not respuesta['hay_mas']:
+                return entradas, respuesta['cursor']
+            self.assertGreater(respuesta['cursor'], desde)
+            desde = respuesta['cursor']
+
+    def test_cursor_avanza_con_hay_mas(self):
+        primera = cambios.leer(self.admin, 0, limite=2)
+        self.assertEqual((len(primera['cambios']), primera['hay_mas']), (2, True))
+        self.assertEqual(primera['cursor'], primera['cambios'][-1]['cursor'])
+
+        entradas, cursor = self.todo(self.admin, limite=2)
+        self.assertEqual([entrada['cursor'] for entrada in entradas], list(Cambio.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(cambios.leer(self.admin, cursor), {'cambios': [], 'cursor': cursor, 'hay_mas': False})
+
+    def test_margen_oculta_las_entradas_recientes(self):
+        with self.settings(CAMBIOS_MARGEN=60):
+            self.assertEqual(cambios.leer(self.admin)['cambios'], [])
+
+    def test_usuario_ve_catalogo_y_lo_suyo(self):
+        entradas, _ = self.todo(self.lector)
+        vistos = {(entrada['modelo'], entrada['id']) for entrada in entradas}
+        self.assertEqual({modelo for modelo, _ in vistos}, {'sucursal', 'libro', 'ejemplar', 'prestamo'})
+        self.assertIn(('prestamo', self.prestamo.id), vistos)
+        self.assertNotIn(('prestamo', self.ajeno.id), vistos)
+        self.assertNotIn(('reserva', self.reserva_ajena.id), vistos)
+        self.assertIn(('reserva', self.reserva_ajena.id), {(e['modelo'], e['id']) for e in self.todo(self.admin)[0]})
+
+    def test_baja_logica_sin_datos(self):
+        _, cursor = self.todo(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.activo = False
+            self.libro.save()
+        [entrada] = cambios.leer(self.admin, cursor)['cambios']
+        self.assertEqual((entrada['modelo'], entrada['id'], entrada['operacion'], entrada['datos']), ('libro', self.libro.id, 'eliminado', None))
+
+    def test_escritura_revertida_no_aparece(self):
+        antes = Cambio.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    Libro.objects.create(titulo='Borrador', autor='-', isbn='3', genero='otros', año_publicacion=2000)
+                    raise RuntimeError('se revierte')
+        self.assertEqual(Cambio.objects.count(), antes)
+
+    def test_compactar_deja_la_ultima_entrada(self):
+        for titulo in ('Rayuela (2a ed.)', 'Rayuela (3a ed.)'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.libro.titulo = titulo
+                self.libro.save()
+        self.assertEqual(Cambio.objects.filter(modelo='libro', objeto_id=self.libro.id).count(), 3)
+        total = Cambio.objects.count()
+
+        self.assertEqual(cambios.compactar(lote=1), 2)
+        self.assertEqual(Cambio.objects.count(), total - 2)
+        ultima = Cambio.objects.get(modelo='libro', objeto_id=self.libro.id)
+        self.assertEqual(ultima.operacion, 'modificado')
+        [entrada] = [e for e in self.todo(self.admin)[0] if (e['modelo'], e['id']) == ('libro', self.libro.id)]
+        self.assertEqual((entrada['cursor'], entrada['datos']['titulo']), (ultima.id, 'Rayuela (3a ed.)'))
+        self.assertEqual(cambios.compactar(), 0)
+
+
+class AnaliticaTests(TestCase):
+    """Snapshot por segmentos y cálculos de analitica.py sobre préstamos con fechas conocidas"""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.inicio = datetime(2026, 1, 5, 10, tzinfo=tz.utc)
+        self.usuario = Usuario.objects.create_user(username='lector', password='x')
+        sucursal = Sucursal.objects.create(nombre='Centro', direccion='-', telefono='-', horario_atencion='-')
+        self.ficcion = Ejemplar.objects.create(
+            libro=Libro.objects.create(titulo='F', autor='A', isbn='1', genero='ficcion', año_publicacion=2000),
+            sucursal=sucursal, codigo_barras='E-1'
+        )
+        self.ciencia = Ejemplar.objects.create(
+            libro=Libro.objects.create(titulo='C', autor='A', isbn='2', genero='ciencia', año_publicacion=2000),
+            sucursal=sucursal, codigo_barras='E-2'
+        )
+        # Ficción: 1, 2, 3 y 4 días; ciencia: 2 días; uno de ficción sigue abierto
+        for dia, dias, multa in [(0, 1, 0), (2, 2, 0), (5, 3, 0), (9, 4, 100)]:
+            self.prestar(self.ficcion, dia, dias, multa)
+        self.prestar(self.ciencia, 1, 2, 300)
+        self.abierto = self.prestar(self.ficcion, 20)
+
+    def prestar(self, ejemplar, dia, dias=None, multa=0):
+        """Préstamo que empieza el día indicado desde self.inicio y dura dias (None: sin devolver)"""
+        fecha = self.inicio + timedelta(days=dia)
+        prestamo = Prestamo.objects.create(usuario=self.usuario, ejemplar=ejemplar, fecha_devolucion_esperada=fecha + timedelta(days=14))
+        Prestamo.objects.filter(id=prestamo.id).update(
+            fecha_prestamo=fecha,
+            fecha_devolucion_real=fecha + timedelta(days=dias) if dias is not None else None,
+            estado='devuelto' if dias is not None else 'activo',
+            multa=multa,
+        )
+        return prestamo
+
+    def actualizar(self):
+        return analitica.actualizar_snapshot(self.directorio.name, filas_por_segmento=2)
+
+    def snapshot(self):
+        return analitica.cargar_snapshot(self.directorio.name)
+
+    def test_segmentos_sin_prestamos_abiertos_no_se_reescriben(self):
+        self.assertEqual(self.actualizar()['segmentos'], 3)
+        antes = [segmento['nombre'] for segmento in self.snapshot().segmentos]
+
+        Prestamo.objects.filter(id=self.abierto.id).update(estado='devuelto', multa=50)
+        self.prestar(self.ciencia, 30)
+        resumen = self.actualizar()
+        despues = [segmento['nombre'] for segmento in self.snapshot().segmentos]
+        self.assertEqual((resumen['nuevos'], resumen['actualizados'], resumen['segmentos_escritos']), (1, 1, 2))
+        self.assertEqual(despues[:2], antes[:2]) #segmentos cerrados: mismos archivos
+        self.assertNotEqual(despues[2], antes[2])
+
+        snapshot = self.snapshot()
+        esperado = list(Prestamo.objects.order_by('id').values_list('id', 'multa'))
+        self.assertEqual(list(zip(snapshot['id'].tolist(), snapshot['multa'].tolist())), [(i, float(m)) for i, m in esperado])
+
+    def test_percentiles_de_duracion(self):
+        self.actualizar()
+        resultados = {fila['genero']: fila for fila in analitica.duraciones_por_genero(self.snapshot(), percentiles=(50, 100))}
+        self.assertEqual(resultados['ficcion']['prestamos'], 4)
+        self.assertEqual(resultados['ficcion']['promedio'], 2.5)
+        self.assertEqual(resultados['ficcion']['percentiles'], {'p50': 2.5, 'p100': 4.0})
+        self.assertEqual(resultados['ciencia']['percentiles'], {'p50': 2.0, 'p100': 2.0})
+
+    def test_histograma_de_multas(self):
+        self.actualizar()
+        multas = analitica.distribucion_multas(self.snapshot(), cubetas=2)
+        self.assertEqual((multas['cantidad'], multas['total'], multas['promedio']), (2, 400.0, 200.0))
+        self.assertEqual([(c['desde'], c['hasta'], c['cantidad']) for c in multas['histograma']], [(100.0, 200.0, 1), (200.0, 300.0, 1)])
+        self.assertEqual(
+            {fila['genero']: (fila['cantidad'], fila['total']) for fila in multas['por_genero']},
+            {'ficcion': (1, 100.0), 'ciencia': (1, 300.0)}
+        )
+
+    def test_utilizacion_por_dia(self):
+        self.actualizar()
+        dia = self.inicio.date()
+        [sucursal] = analitica.utilizacion_sucursales(self.snapshot(), dia, dia + timedelta(days=3))
+        self.assertEqual(sucursal['ejemplares'], 2)
+        self.assertEqual([d['prestados'] for d in sucursal['dias']], [1, 2, 2, 2])
+        self.assertEqual(sucursal['utilizacion_promedio'], 0.875)
+        self.assertEqual(sucursal['utilizacion_maxima'], 1.0)
+
+    def test_genero_desconocido(self):
+        Libro.objects.filter(id=self.ciencia.libro_id).update(genero='poesia') #fuera de Libro.GENEROS
+        self.actualizar()
+        generos = [fila['genero'] for fila in analitica.duraciones_por_genero(self.snapshot())]
+        self.assertIn('desconocido', generos)
+        self.assertNotIn('ciencia', generos)
+
+
+class PoolConexionesTests(SimpleTestCase):
+    """Pool de biblioteca/backends/pool.py con el backend biblioteca.backends.sqlite3 sobre un archivo temporal"""
+
+    ALIAS = 'pool_pruebas'
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.archivo = os.path.join(directorio.name, 'pool.sqlite3')
+        with sqlite3.connect(self.archivo) as conexion:
+            conexion.execute('CREATE TABLE prueba (valor INTEGER)')
+        self.addCleanup(self.vaciar_pool)
+
+    def vaciar_pool(self):
+        pool = pool_conexiones._POOLS.pop((self.ALIAS, os.getpid()), None)
+        if pool:
+            pool.vaciar()
+
+    def conexion(self, **pool):
+        """DatabaseWrapper propio (como el de otro hilo o petición) que comparte el pool del alias"""
+        opciones = {'CONEXIONES': 1, 'DESBORDE': 1, 'VIDA_MAXIMA': 60, 'VERIFICAR_INACTIVAS': 60, 'ESPERA': 0.1, **pool}
+        conexiones = ConnectionHandler({'default': {}, self.ALIAS: {'ENGINE': 'biblioteca.backends.sqlite3', 'NAME': self.archivo, 'POOL': opciones}})
+        conexion = conexiones[self.ALIAS]
+        conexion.connect()
+        return conexion
+
+    def test_reutiliza_la_conexion_devuelta(self):
+        primera = self.conexion()
+        driver = primera.connection
+        primera.close()
+        self.assertIs(self.conexion().connection, driver)
+        estado = pool_conexiones.estado_pools()[self.ALIAS]
+        self.assertEqual((estado['creadas'], estado['reutilizadas']), (1, 1))
+
+    def test_desborde_y_pool_agotado(self):
+        primera, segunda = self.conexion(), self.conexion() #la segunda es el desborde
+        with self.assertRaises(pool_conexiones.PoolAgotado):
+            self.conexion()
+        primera.close()
+        segunda.close()
+        estado = pool_conexiones.estado_pools()[self.ALIAS]
+        self.assertEqual((estado['abiertas'], estado['libres'], estado['cerradas']), (1, 1, 1)) #el desborde se cierra
+
+    def test_espera_una_conexion_liberada(self):
+        primera = self.conexion(DESBORDE=0, ESPERA=5)
+        driver = primera.connection
+        recibida = []
+
+        def pedir():
+            conexion = self.conexion()
+            recibida.append(conexion.connection)
+            conexion.close()
+
+        hilo = threading.Thread(target=pedir)
+        hilo.start()
+        time.sleep(0.2)
+        primera.close()
+        hilo.join(5)
+        self.assertEqual(recibida, [driver])
+        self.assertGreaterEqual(pool_conexiones.estado_pools()[self.ALIAS]['esperas'], 1)
+
+    def test_reemplaza_conexion_vencida(self):
+        primera = self.conexion()
+        driver = primera.connection
+        primera.close()
+        mas_tarde = time.monotonic() + 3600
+        with mock.patch.object(pool_conexiones, 'time', mock.Mock(monotonic=lambda: mas_tarde)):
+            self.assertIsNot(self.conexion().connection, driver)
+        estado = pool_conexiones.estado_pools()[self.ALIAS]
+        self.assertEqual((estado['creadas'], estado['descartadas']), (2, 1))
+
+    def test_transaccion_a_medias_no_pasa_a_la_siguiente(self):
+        primera = self.conexion()
+        primera.connection.execute('BEGIN')
+        primera.connection.execute('INSERT INTO prueba VALUES (1)')
+        primera.close() #devolver hace rollback
+        self.assertEqual(self.conexion().connection.execute('SELECT COUNT(*) FROM prueba').fetchone(), (0,))
+
+    def test_conexion_cerrada_dentro_de_atomic_se_descarta(self):
+        conexion = self.conexion()
+        with mock.patch('django.db.transaction.get_connection', return_value=conexion):
+            with transaction.atomic(using=self.ALIAS):
+                conexion.close() #Django la sigue usando hasta salir del bloque
+        estado = pool_conexiones.estado_pools()[self.ALIAS]
+        self.assertEqual((estado['descartadas'], estado['libres'], estado['abiertas']), (1, 0, 0))
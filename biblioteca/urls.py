@@ -26,7 +26,12 @@ urlpatterns = [
     path('usuarios/perfil/actualizar/', v.actualizar_perfil_api, name='actualizar-perfil-api'),
     path('usuarios/historial-prestamos/', v.historial_prestamos_api, name='historial-prestamos-api'),
     path('usuarios/mis-reservas/', v.mis_reservas_api, name='mis-reservas-api'),
+    path('usuarios/tablero/', v.tablero_usuario_api, name='tablero-usuario-api'),#perfil, préstamos, reservas y multas en una llamada
     path('usuarios/pagar-multa/', v.pagar_multa_api, name='pagar-multa-api'),
+    path('usuarios/estado-cuenta/', v.estado_cuenta_multas_api, name='estado-cuenta-multas-api'),#movimientos y saldo de multas
+    path('multas/pagos-lote/', v.pagos_lote_multas_api, name='pagos-lote-multas-api'),#pagos de caja en lote (bibliotecario)
+    path('multas/condonar/', v.condonar_multa_api, name='condonar-multa-api'),#perdonar multas (admin)
+    path('usuarios/importar/', v.importar_usuarios_api, name='importar-usuarios-api'),#registro masivo desde CSV (admin)
     
     # ============================================================================
     # GESTIÓN DE SUCURSALES - CRUD CON MIXINS DRF
@@ -62,4 +67,21 @@ urlpatterns = [
     # REPORTES - CON MIXINS DRF
     # ============================================================================
     path('reportes/', v.ReportesAPI.as_view(), name='reportes-api'),
+    path('reportes/libros-populares/', v.libros_populares_api, name='libros-populares-api'),#ranking por genero, sucursal y fechas
+    path('reportes/circulacion/', v.reporte_circulacion_api, name='reporte-circulacion-api'),#series diarias/mensuales desde las tablas agregadas
+    path('reportes/trabajos/', v.TrabajoReporteAPI.as_view(), name='trabajo-reporte-api'),#encola un reporte en segundo plano
+    path('reportes/trabajos/<uuid:trabajo_id>/', v.trabajo_reporte_api, name='trabajo-reporte-detail-api'),#estado y resultado del trabajo
+    path('reportes/cache/', v.metricas_cache_api, name='metricas-cache-api'),#aciertos y fallos de la caché de reportes
+    path('reportes/cache/objetos/', v.metricas_cache_objetos_api, name='metricas-cache-objetos-api'),#aciertos L1/L2 de la caché de libros y sucursales
+    path('reportes/perfiles/', v.perfiles_api, name='perfiles-api'),#perfiles de peticiones (cProfile y tracemalloc) guardados
+    path('reportes/perfiles/firma/', v.firma_perfilado_api, name='firma-perfilado-api'),#valor de la cabecera X-Perfilar
+    path('reportes/perfiles/<str:perfil_id>/', v.perfil_api, name='perfil-api'),#detalle o descarga de un perfil
+    path('reportes/consultas/', v.consultas_lentas_api, name='consultas-lentas-api'),#huellas SQL con más tiempo, p95 y consultas lentas
+    path('analitica/', v.analitica_api, name='analitica-api'),#duraciones, multas y utilización sobre el snapshot NumPy
+    path('cambios/', v.cambios_api, name='cambios-api'),#feed de cambios desde un cursor para sincronizar kioscos y espejos
+    
+    # ============================================================================
+    # PETICIONES EN LOTE
+    # ============================================================================
+    path('batch/', v.lote_api, name='lote-api'),#varias peticiones GET/POST... a estas rutas en una sola llamada
 ] 
\ No newline at end of file
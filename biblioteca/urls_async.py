@@ -0,0 +1,12 @@
+# URLs DE LAS VISTAS ASÍNCRONAS (ASGI) - MISMAS RESPUESTAS QUE SUS EQUIVALENTES DE urls.py
+
+from django.urls import path
+from . import views_async as va
+
+urlpatterns = [
+    path('libros/', va.libros_async, name='libro-async'),#igual que libro-api (GET)
+    path('libros/buscar/', va.buscar_libros_async, name='buscar-libros-async'),#igual que buscar-libros-api
+    path('libros/<int:libro_id>/disponibilidad/', va.disponibilidad_libro_async, name='disponibilidad-libro-async'),#igual que disponibilidad-libro-api
+    path('reservas/cola/<int:libro_id>/', va.cola_reservas_async, name='cola-reservas-async'),#igual que cola-reservas-api
+    path('usuarios/tablero/', va.tablero_usuario_async, name='tablero-usuario-async'),#igual que tablero-usuario-api
+]
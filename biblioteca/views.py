@@ -8,33 +8,72 @@ from rest_framework.permissions import IsAuthenticated, AllowAny #IsAuthenticate
 from rest_framework.decorators import api_view, permission_classes #api_view es para definir una vista, permission_classes es para definir las clases de permisos
 
 # Importaciones de Django
+from django.conf import settings
 from django.contrib.auth import authenticate #authenticate es para autenticar al usuario
-from django.db.models import Count #Count es para contar los elementos de un modelo
+from django.http import FileResponse #descarga de archivos (perfiles)
+from django.db.models import Count, Q, F #Count es para contar los elementos de un modelo, Q para condiciones y F para leer columnas relacionadas
 from django.utils import timezone #timezone es para manejar las fechas y horas
+from django.utils.dateparse import parse_date #convierte 'AAAA-MM-DD' en fecha
+import io
+import json
+from collections import Counter
 from datetime import timedelta #timedelta es para manejar los intervalos de tiempo
 
 # Importaciones de JWT
 from rest_framework_simplejwt.tokens import RefreshToken
 
 # Importaciones locales
-from .models import Usuario, Sucursal, Libro, Ejemplar, Prestamo, Reserva
+from .models import Usuario, Sucursal, Libro, Ejemplar, Prestamo, Reserva, TrabajoReporte, MovimientoMulta
 from .serializers import (
     UsuarioSerializer, SucursalSerializer, LibroSerializer, 
-    EjemplarSerializer, PrestamoSerializer, ReservaSerializer
+    EjemplarSerializer, PrestamoSerializer, ReservaSerializer, TrabajoReporteSerializer,
+    LibroValoresSerializer, EjemplarValoresSerializer, PrestamoValoresSerializer, ReservaValoresSerializer
 )
+from .autenticacion import tokens_para, agregar_claims, obtener_usuario
+from .cache import obtener_o_calcular, metricas_resultados, alcance_usuario, obtener_objeto, metricas_objetos
+from .importacion import ImportacionUsuarios
+from .replicas import lectura_replica
+from . import analitica, perfilado, consultas_lentas, lote, cambios
+from .reportes import (
+    PARAMETROS, limpiar_parametros, encolar_reporte, obtener_reporte_general,
+    obtener_libros_populares, obtener_circulacion
+)
+
+class ListaValoresMixin(mixins.ListModelMixin):
+    """ListModelMixin de solo lectura que pagina filas de values() y las serializa con valores_serializer_class"""
+    valores_serializer_class = None
+    
+    def list(self, request, *args, **kwargs):
+        try:
+            seleccion = self.valores_serializer_class.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        filas = self.valores_serializer_class.valores(self.filter_queryset(self.get_queryset()), **seleccion)
+        pagina = self.paginate_queryset(filas)
+        if pagina is not None:
+            return self.get_paginated_response(self.valores_serializer_class(pagina, **seleccion).data)
+        return Response(self.valores_serializer_class(list(filas), **seleccion).data)
+
+class RelacionesSerializerMixin:
+    """filter_queryset con el select_related que pide serializer_class (detalle, get_object y respuestas de escritura)"""
+    
+    def filter_queryset(self, queryset):
+        return self.get_serializer_class().con_relaciones(super().filter_queryset(queryset))
 
 # ============================================================================
 # VISTAS DE LIBROS CON MIXINS DRF # drf es para django rest framework
 # ============================================================================
 
-class LibroAPI(mixins.ListModelMixin, #mixins es para las vistas, ListModelMixin es para listar los modelos
+class LibroAPI(ListaValoresMixin, #listado rápido con values(), mismo JSON que LibroSerializer
                mixins.CreateModelMixin, #CreateModelMixin es para crear los modelos
                generics.GenericAPIView): #generics es para las vistas genéricas
     """Vista para gestión de libros usando mixins DRF"""
     queryset = Libro.objects.filter(activo=True) #queryset es para filtrar los libros por activos
     serializer_class = LibroSerializer 
+    valores_serializer_class = LibroValoresSerializer
     permission_classes = [IsAuthenticated] #solo autenticados acceden a permisos
     
+    @lectura_replica #lectura que tolera unos segundos de retraso
     def get(self, request, *args, **kwargs): #get es para obtener los datos
         """Obtener todos los libros activos"""
         return self.list(request, *args, **kwargs) #retorna una lista
@@ -105,10 +144,13 @@ class LibroDetailAPI(mixins.RetrieveModelMixin,
 
 @api_view(['GET']) #solo acepta peticiones get
 @permission_classes([IsAuthenticated]) #requiere autenticacion
+@lectura_replica
 def disponibilidad_libro_api(request, libro_id):  #recibe id del libro
     """Obtener disponibilidad de un libro por sucursal"""
     try:
-        libro = Libro.objects.get(id=libro_id, activo=True) #Busca el libro con el ID especificado, pero solo si está activo
+        libro = obtener_objeto(Libro, libro_id) #Busca el libro con el ID especificado (caché de objetos)
+        if not libro.activo: #solo si está activo
+            raise Libro.DoesNotExist
         
         ejemplares_por_sucursal = Ejemplar.objects.filter(  #Filtra ejemplares del libro específico
             libro=libro, 
@@ -144,8 +186,13 @@ def disponibilidad_libro_api(request, libro_id):  #recibe id del libro
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@lectura_replica
 def buscar_libros_api(request):
     """Búsqueda avanzada de libros con múltiples filtros"""
+    try:
+        seleccion = LibroValoresSerializer.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
     try:
        
         query = request.GET.get('q', '') #Obtén el parámetro 'q' de la URL, si no existe usa cadena vacía
@@ -177,10 +224,11 @@ def buscar_libros_api(request):
             except ValueError:
                 libros = libros.filter(ejemplares__sucursal__nombre__icontains=sucursal).distinct() #Si no se puede convertir a número, filtra por nombre
         
-        datosSerializados = LibroSerializer(libros, many=True)
+        datosSerializados = LibroValoresSerializer(libros, **seleccion) #solo lectura: filas de values() sin instanciar modelos
+        libros_encontrados = datosSerializados.data
         
         response_data = { #Crea un diccionario con la información de la búsqueda
-            'total_resultados': libros.count(),#Incluye el total de libros encontrados
+            'total_resultados': len(libros_encontrados),#Incluye el total de libros encontrados
             'filtros_aplicados': { #Incluye los filtros que se aplicaron
                 'busqueda_general': query,
                 'genero': genero,
@@ -188,7 +236,7 @@ def buscar_libros_api(request):
                 'disponible': disponible,
                 'sucursal': sucursal
             },
-            'libros': datosSerializados.data #Incluye la lista de libros en formato JSON
+            'libros': libros_encontrados #Incluye la lista de libros en formato JSON
         }
         
         return Response(response_data, status=status.HTTP_200_OK)
@@ -265,10 +313,13 @@ class SucursalDetailAPI(mixins.RetrieveModelMixin,#RetrieveModelMixin es para ob
 
 @api_view(['GET']) #solo get porque se esta obteniendo un inventario y solo get es para obtener datos
 @permission_classes([IsAuthenticated]) #SOLO AUTENTICADOS
+@lectura_replica
 def inventario_sucursal_api(request, sucursal_id): #se esta definiendo una vista que se llama inventario_sucursal_api, que es una vista que se encarga de obtener el inventario de una sucursal
     """Obtener inventario completo de una sucursal"""
     try:
-        sucursal = Sucursal.objects.get(id=sucursal_id, activa=True)
+        sucursal = obtener_objeto(Sucursal, sucursal_id)
+        if not sucursal.activa:
+            raise Sucursal.DoesNotExist
         
         # Obtener ejemplares de la sucursal agrupados por libro
         ejemplares = Ejemplar.objects.filter(sucursal=sucursal).select_related('libro') #select_related es para obtener los datos de los libros relacionados con los ejemplares
@@ -333,12 +384,14 @@ def inventario_sucursal_api(request, sucursal_id): #se esta definiendo una vista
 # VISTAS DE EJEMPLARES CON MIXINS DRF
 # ============================================================================
 
-class EjemplarAPI(mixins.ListModelMixin, #se le pone API para que se pueda acceder a la vista desde la URL
+class EjemplarAPI(RelacionesSerializerMixin,
+                  ListaValoresMixin, #se le pone API para que se pueda acceder a la vista desde la URL
                   mixins.CreateModelMixin,
                   generics.GenericAPIView):
     """Vista para gestión de ejemplares usando mixins DRF"""
     queryset = Ejemplar.objects.all()
     serializer_class = EjemplarSerializer
+    valores_serializer_class = EjemplarValoresSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -373,7 +426,8 @@ class EjemplarAPI(mixins.ListModelMixin, #se le pone API para que se pueda acced
         
         return self.create(request, *args, **kwargs) #retorna la creacion de un nuevo ejemplar
 
-class EjemplarDetailAPI(mixins.RetrieveModelMixin,
+class EjemplarDetailAPI(RelacionesSerializerMixin,
+                        mixins.RetrieveModelMixin,
                         mixins.UpdateModelMixin,
                         mixins.DestroyModelMixin,
                         generics.GenericAPIView):
@@ -429,7 +483,7 @@ def transferir_ejemplar_api(request, ejemplar_id):
                           status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            sucursal_destino = Sucursal.objects.get(id=sucursal_destino_id)
+            sucursal_destino = obtener_objeto(Sucursal, sucursal_destino_id)
         except Sucursal.DoesNotExist:
             return Response("Sucursal destino no encontrada", status=status.HTTP_404_NOT_FOUND)
         
@@ -451,11 +505,13 @@ def transferir_ejemplar_api(request, ejemplar_id):
 # VISTAS DE PRÉSTAMOS CON MIXINS DRF
 # ============================================================================
 
-class PrestamoAPI(mixins.ListModelMixin,
+class PrestamoAPI(RelacionesSerializerMixin,
+                  ListaValoresMixin,
                   mixins.CreateModelMixin,
                   generics.GenericAPIView):
     """Vista para gestión de préstamos usando mixins DRF"""
     serializer_class = PrestamoSerializer
+    valores_serializer_class = PrestamoValoresSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -507,7 +563,8 @@ class PrestamoAPI(mixins.ListModelMixin,
         
         return Response("Préstamo creado exitosamente", status=status.HTTP_201_CREATED)
 
-class PrestamoDetailAPI(mixins.RetrieveModelMixin,
+class PrestamoDetailAPI(RelacionesSerializerMixin,
+                        mixins.RetrieveModelMixin,
                         generics.GenericAPIView):
     """Vista para operaciones específicas de préstamos"""
     serializer_class = PrestamoSerializer
@@ -537,25 +594,8 @@ def devolver_prestamo_api(request, prestamo_id): #se esta definiendo una vista q
         if prestamo.estado != 'activo':
             return Response("Préstamo no está activo", status=status.HTTP_400_BAD_REQUEST)
         
-        # Procesar devolución
-        prestamo.fecha_devolucion_real = timezone.now() #se le asigna la fecha actual a la fecha de devolucion real
-        prestamo.estado = 'devuelto' #se cambia el estado del prestamo a devuelto
-        
-        # Calcular multa si hay retraso
-        if prestamo.fecha_devolucion_real > prestamo.fecha_devolucion_esperada:
-            dias_retraso = (prestamo.fecha_devolucion_real - prestamo.fecha_devolucion_esperada).days #.days es para obtener los dias de retraso
-            multa = dias_retraso * 1000.00
-            prestamo.multa = multa 
-            
-            # Agregar multa al usuario
-            prestamo.usuario.multas_pendientes += multa # SE USa punto para acceder a los atributos del usuario. em esdte caso se esta accediendo a la multa pendiente del usuario
-            prestamo.usuario.save() #se guarda el usuario con la multa pendiente
-        
-        prestamo.save() #se guarda el prestamo
-        
-        # Cambiar estado del ejemplar
-        prestamo.ejemplar.estado = 'disponible'
-        prestamo.ejemplar.save()
+        # Procesar devolución (Prestamo.devolver registra la multa en el libro mayor si hay retraso)
+        prestamo.devolver()
         
         # Procesar cola de reservas
         procesar_cola_reservas(prestamo.ejemplar.libro) # se lee como procesar la cola de reservas, y se le pasa el libro como parametro
@@ -571,20 +611,30 @@ def devolver_prestamo_api(request, prestamo_id): #se esta definiendo una vista q
 @permission_classes([IsAuthenticated])
 def prestamos_activos_api(request): 
     """Obtener solo préstamos activos"""
+    try:
+        seleccion = PrestamoValoresSerializer.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
     try:
         if request.user.rol == 'usuario':
-            prestamos = Prestamo.objects.filter(usuario=request.user, estado='activo')
+            prestamos = Prestamo.objects.filter(usuario_id=request.user.id, estado='activo')
         else:
             prestamos = Prestamo.objects.filter(estado='activo')
         
-        datosSerializados = PrestamoSerializer(prestamos, many=True)
-        
-        estadisticas = {
-            'total_prestamos_activos': prestamos.count(),
-            'proximos_a_vencer': prestamos.filter( # se esta filtrando los prestamos que estan activos y que la fecha de devolucion esperada es menor a la fecha actual + 3 dias
-                fecha_devolucion_esperada__lte=timezone.now() + timedelta(days=3)
-            ).count()
-        }
+        datosSerializados = PrestamoValoresSerializer(prestamos, **seleccion) #los joins que necesita salen de values()
+        
+        # Las estadísticas son iguales para todos los bibliotecarios, se guardan en caché por alcance
+        estadisticas = obtener_o_calcular(
+            'prestamos_activos',
+            {'usuario': request.user.id if request.user.rol == 'usuario' else None},
+            lambda: {
+                'total_prestamos_activos': prestamos.count(),
+                'proximos_a_vencer': prestamos.filter( # se esta filtrando los prestamos que estan activos y que la fecha de devolucion esperada es menor a la fecha actual + 3 dias
+                    fecha_devolucion_esperada__lte=timezone.now() + timedelta(days=3)
+                ).count()
+            },
+            modelos=(Prestamo,)
+        )
         
         response_data = { # se esta creando un diccionario que se llama response_data, que contiene el estadisticas y los prestamos activos
             'estadisticas': estadisticas, 
@@ -601,6 +651,10 @@ def prestamos_vencidos_api(request):
     """Obtener solo préstamos vencidos"""
     if request.user.rol not in ['bibliotecario', 'administrador']:
         return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    try:
+        seleccion = PrestamoValoresSerializer.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
     try:
         # Obtener préstamos vencidos ordenados por fecha de devolución esperada
         prestamos_vencidos = Prestamo.objects.filter(
@@ -609,14 +663,14 @@ def prestamos_vencidos_api(request):
         ).order_by('fecha_devolucion_esperada')
         
         # Serializar los préstamos vencidos
-        datosSerializados = PrestamoSerializer(prestamos_vencidos, many=True)
-        
+        datosSerializados = PrestamoValoresSerializer(prestamos_vencidos, columnas=['fecha_devolucion_esperada'], **seleccion)
+        prestamos_data = datosSerializados.data
         
         # Calcular estadísticas de préstamos vencidos de forma ordenada y clara
-        total_prestamos_vencidos = prestamos_vencidos.count() #aqui se esta contando los prestamos vencidos
+        total_prestamos_vencidos = len(datosSerializados.filas) #aqui se esta contando los prestamos vencidos
         multas_estimadas = sum( #aqui se esta sumando las multas estimadas de los prestamos vencidos
-            (timezone.now() - p.fecha_devolucion_esperada).days * 1000.00 #aqui se esta calculando la multa estimada multiplicando los dias de retraso por 1000.00
-            for p in prestamos_vencidos #aqui se esta iterando sobre los prestamos vencidos
+            (timezone.now() - p['fecha_devolucion_esperada']).days * 1000.00 #aqui se esta calculando la multa estimada multiplicando los dias de retraso por 1000.00
+            for p in datosSerializados.filas #aqui se esta iterando sobre las filas ya leídas
         )
         estadisticas = { 
             'total_prestamos_vencidos': total_prestamos_vencidos,  #aqui aun no estan en json, sino mas abajo se serializa
@@ -625,7 +679,7 @@ def prestamos_vencidos_api(request):
         
         response_data = { # se esta creando un diccionario que se llama response_data, que contiene el estadisticas y los prestamos vencidos
             'estadisticas': estadisticas, 
-            'prestamos_vencidos': datosSerializados.data # se esta serializando los prestamos vencidos, el porque es para que se pueda enviar en formato json
+            'prestamos_vencidos': prestamos_data # se esta serializando los prestamos vencidos, el porque es para que se pueda enviar en formato json
         }
         
         return Response(response_data, status=status.HTTP_200_OK)
@@ -636,11 +690,13 @@ def prestamos_vencidos_api(request):
 # VISTAS DE RESERVAS CON MIXINS DRF
 # ============================================================================
 
-class ReservaAPI(mixins.ListModelMixin,
+class ReservaAPI(RelacionesSerializerMixin,
+                 ListaValoresMixin,
                  mixins.CreateModelMixin,
                  generics.GenericAPIView):
     """Vista para gestión de reservas usando mixins DRF"""
     serializer_class = ReservaSerializer
+    valores_serializer_class = ReservaValoresSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -673,7 +729,7 @@ class ReservaAPI(mixins.ListModelMixin,
         # Validar que el libro existe
         libro_id = request.data.get("libro_id")
         try:
-            libro = Libro.objects.get(id=libro_id)
+            libro = obtener_objeto(Libro, libro_id)
         except Libro.DoesNotExist:
             return Response("Libro no existe", status=status.HTTP_404_NOT_FOUND)
         
@@ -724,19 +780,29 @@ def cancelar_reserva_api(request, reserva_id):
 def cola_reservas_api(request, libro_id):
     """Ver la cola de reservas de un libro"""
     try:
-        libro = Libro.objects.get(id=libro_id)
+        seleccion = ReservaValoresSerializer.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+    try:
+        libro = obtener_objeto(Libro, libro_id)
         
         reservas = Reserva.objects.filter(
             libro=libro, 
             estado='activa'
         ).order_by('posicion_cola')
+        datosSerializados = ReservaValoresSerializer(reservas, **seleccion)
+        cola = datosSerializados.data #solo lectura: filas de values() sin instanciar modelos
         
-        datosSerializados = ReservaSerializer(reservas, many=True)
+        # Fecha estimada para toda la cola de una vez (la reserva i-ésima recibe el i-ésimo ejemplar liberado)
+        if datosSerializados.incluye('fecha_estimada_disponibilidad'):
+            fechas = libro.estimar_disponibilidad(len(cola))
+            for reserva, fecha in zip(cola, fechas):
+                reserva['fecha_estimada_disponibilidad'] = fecha
         
         return Response({
             'libro': libro.titulo,
-            'total_reservas': reservas.count(),
-            'cola': datosSerializados.data
+            'total_reservas': len(cola),
+            'cola': cola
         }, status=status.HTTP_200_OK)
     except Libro.DoesNotExist:
         return Response("Libro no encontrado", status=status.HTTP_404_NOT_FOUND)
@@ -762,7 +828,7 @@ class LoginAPI(APIView):
         usuario = authenticate(username=username, password=password)
         
         if usuario is not None:
-            refresh = RefreshToken.for_user(usuario)
+            refresh = tokens_para(usuario) #el token lleva rol y suspendido para los clientes
             
             response_data = {
                 'mensaje': 'Login exitoso',
@@ -825,7 +891,10 @@ class RefreshTokenAPI(APIView):
         
         try:
             refresh = RefreshToken(refresh_token)
-            nuevo_access_token = str(refresh.access_token)
+            usuario = obtener_usuario(refresh['user_id'])
+            if usuario is None or not usuario.is_active:
+                return Response("Token inválido o expirado", status=status.HTTP_401_UNAUTHORIZED)
+            nuevo_access_token = str(agregar_claims(refresh.access_token, usuario)) #claims actualizados por si cambió el rol
             
             response_data = {
                 'access': nuevo_access_token,
@@ -895,27 +964,53 @@ def actualizar_perfil_api(request):
     except:
         return Response("ERROR al actualizar perfil", status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def importar_usuarios_api(request):
+    """Registrar usuarios en lote desde un CSV enviado en el campo 'archivo'"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response("Debe enviar el CSV en el campo 'archivo'", status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='') #se lee por partes, sin cargarlo entero
+        resumen = ImportacionUsuarios().importar(texto)
+    except (ValueError, UnicodeDecodeError) as error:
+        return Response(f"ERROR al importar usuarios: {error}", status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(resumen, status=status.HTTP_201_CREATED)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def historial_prestamos_api(request):
     """Obtener historial de préstamos del usuario autenticado"""
+    try:
+        seleccion = PrestamoValoresSerializer.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
     try:
         usuario = request.user
         
-        prestamos = Prestamo.objects.filter(usuario=usuario).order_by('-fecha_prestamo')
-        datosSerializados = PrestamoSerializer(prestamos, many=True)
+        prestamos = Prestamo.objects.filter(usuario_id=usuario.id).order_by('-fecha_prestamo')
+        datosSerializados = PrestamoValoresSerializer(prestamos, columnas=['estado', 'multa'], **seleccion)
+        historial = datosSerializados.data
         
+        # Estadísticas sobre las filas ya leídas, sin volver a consultar
+        filas = datosSerializados.filas
         estadisticas = {
-            'total_prestamos': prestamos.count(),
-            'prestamos_activos': prestamos.filter(estado='activo').count(),
-            'prestamos_devueltos': prestamos.filter(estado='devuelto').count(),
-            'prestamos_con_multa': prestamos.filter(multa__gt=0).count(),
-            'multas_totales': float(sum(p.multa for p in prestamos if p.multa))
+            'total_prestamos': len(historial),
+            'prestamos_activos': sum(1 for p in filas if p['estado'] == 'activo'),
+            'prestamos_devueltos': sum(1 for p in filas if p['estado'] == 'devuelto'),
+            'prestamos_con_multa': sum(1 for p in filas if p['multa'] and p['multa'] > 0),
+            'multas_totales': float(sum(p['multa'] for p in filas if p['multa']))
         }
         
         response_data = {
             'estadisticas': estadisticas,
-            'historial': datosSerializados.data
+            'historial': historial
         }
         
         return Response(response_data, status=status.HTTP_200_OK)
@@ -926,29 +1021,56 @@ def historial_prestamos_api(request):
 @permission_classes([IsAuthenticated])
 def mis_reservas_api(request):
     """Obtener reservas del usuario autenticado"""
+    try:
+        seleccion = ReservaValoresSerializer.seleccion_pedida(request.GET, request.user.rol) #?fields= y ?expand=
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
     try:
         usuario = request.user
         
         reservas = Reserva.objects.filter(usuario=usuario).order_by('-fecha_reserva')
-        datosSerializados = ReservaSerializer(reservas, many=True)
         
+        datosSerializados = ReservaValoresSerializer(reservas, columnas=['estado'], **seleccion)
+        
+        # Fecha estimada de las reservas activas: todas las colas juntas hasta la posición del usuario (dos consultas)
+        if datosSerializados.incluye('fecha_estimada_disponibilidad'):
+            activas = list(reservas.filter(estado='activa').select_related('libro'))
+            fechas = Libro.estimar_disponibilidad_varios({reserva.libro: reserva.posicion_cola for reserva in activas})
+            datosSerializados.context['fechas_estimadas'] = {reserva.id: fechas[reserva.libro_id][-1] for reserva in activas}
+        
+        mis_reservas = datosSerializados.data
+        
+        estados = Counter(reserva['estado'] for reserva in datosSerializados.filas) #sobre las filas ya leídas
         estadisticas = {
-            'total_reservas': reservas.count(),
-            'reservas_activas': reservas.filter(estado='activa').count(),
-            'reservas_cumplidas': reservas.filter(estado='cumplida').count(),
-            'reservas_canceladas': reservas.filter(estado='cancelada').count(),
-            'reservas_expiradas': reservas.filter(estado='expirada').count()
+            'total_reservas': len(mis_reservas),
+            'reservas_activas': estados['activa'],
+            'reservas_cumplidas': estados['cumplida'],
+            'reservas_canceladas': estados['cancelada'],
+            'reservas_expiradas': estados['expirada']
         }
         
         response_data = {
             'estadisticas': estadisticas,
-            'reservas': datosSerializados.data
+            'reservas': mis_reservas
         }
         
         return Response(response_data, status=status.HTTP_200_OK)
     except:
         return Response("ERROR al obtener reservas", status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def tablero_usuario_api(request):
+    """Pantalla de inicio del usuario: perfil, préstamos activos, reservas activas y multas en una sola llamada"""
+    try:
+        tablero = obtener_tablero_usuario(request.user.id)
+    except Usuario.DoesNotExist:
+        return Response("Usuario no encontrado", status=status.HTTP_404_NOT_FOUND)
+    except:
+        return Response("ERROR al obtener tablero", status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(tablero, status=status.HTTP_200_OK)
+
 # ============================================================================
 # SISTEMA DE REPORTES CON MIXINS DRF
 # ============================================================================
@@ -958,6 +1080,7 @@ class ReportesAPI(mixins.ListModelMixin,
     """Vista para reportes usando mixins DRF"""
     permission_classes = [IsAuthenticated] #SOLO AUTENTICADOS
     
+    @lectura_replica #lectura que tolera unos segundos de retraso
     def get(self, request, *args, **kwargs): #se esta definiendo una vista que se llama get, se encarga de obtener los reportes basicos, 
    
         """Obtener reportes básicos"""
@@ -965,109 +1088,265 @@ class ReportesAPI(mixins.ListModelMixin,
             return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
         
         try: # y si no hay error, se ejecuta el codigo que esta dentro de la linea
-            reportes = { #se esta definiendo un diccionario que se llama reportes, que contiene los reportes basicos
-                'libros_mas_populares': self.obtener_libros_populares(), #self es para obtener los reportes basicos de libros mas populares
-                'usuarios_con_multas': self.obtener_usuarios_con_multas(), #self es para obtener los reportes basicos de usuarios con multas
-                'prestamos_vencidos': self.obtener_prestamos_vencidos(), #self es para obtener los reportes basicos de prestamos vencidos
-                'estadisticas_generales': self.obtener_estadisticas_generales() #self es para obtener los reportes basicos de estadisticas generales
-            }
+            reportes = obtener_reporte_general() #los reportes se calculan en reportes.py para poder reutilizarlos en los trabajos en segundo plano
             
             return Response(reportes, status=status.HTTP_200_OK)
         except:
             return Response("ERROR al generar reportes", status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@lectura_replica
+def libros_populares_api(request):
+    """Ranking de libros más prestados por género, sucursal y rango de fechas"""
+    if request.user.rol not in ['bibliotecario', 'administrador']:
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
     
-    def obtener_libros_populares(self):
-        """Obtiene los 5 libros más prestados"""
-        # 1. Obtener todos los libros
-        libros = Libro.objects.all()
-
-        # 2. Para cada libro, contar sus préstamos manualmente
-        libros_populares = []
-        for libro in libros:
-            # Contar préstamos de este libro
-            total = 0
-            for ejemplar in libro.ejemplares.all():
-                total += ejemplar.prestamos.count()
-            
-            # Agregar a la lista con el total
-            libros_populares.append({
-                'libro': libro,
-                'total_prestamos': total
-            })
+    filtros = {nombre: request.GET.get(nombre, '') for nombre in PARAMETROS['libros_populares']} #desde y hasta en formato AAAA-MM-DD
+    try:
+        parametros = limpiar_parametros('libros_populares', filtros)
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'filtros_aplicados': filtros,
+        'libros': obtener_libros_populares(**parametros)
+    }, status=status.HTTP_200_OK)
 
-        # 3. Ordenar por total de préstamos (más a menos)
-        libros_populares.sort(key=lambda x: x['total_prestamos'], reverse=True)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@lectura_replica
+def reporte_circulacion_api(request):
+    """Reporte de circulación por rango de fechas leído de las tablas diarias agregadas"""
+    if request.user.rol not in ['bibliotecario', 'administrador']:
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    filtros = {nombre: request.GET.get(nombre, '') for nombre in PARAMETROS['circulacion']} #ej: agrupar=mes,sucursal
+    try:
+        parametros = limpiar_parametros('circulacion', filtros)
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'filtros_aplicados': filtros,
+        **obtener_circulacion(**parametros)
+    }, status=status.HTTP_200_OK)
 
-        # 4. Tomar solo los primeros 10
-        libros_populares = libros_populares[:10]
+class TrabajoReporteAPI(APIView):
+    """Encola un reporte para calcularlo en segundo plano (lo procesa el comando procesar_reportes)"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """Crear trabajo de reporte; si ya hay uno igual en cola o con resultado vigente se reutiliza"""
+        if request.user.rol not in ['bibliotecario', 'administrador']:
+            return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
         
-        return [
-            {
-                'titulo': libro.titulo,
-                'autor': libro.autor,
-                'total_prestamos': libro.total_prestamos
-            }
-            for libro in libros_populares
-        ]
-    
-    def obtener_usuarios_con_multas(self):
-        """Obtiene usuarios con multas pendientes"""
-        usuarios_con_multas = Usuario.objects.filter(
-            multas_pendientes__gt=0
-        ).order_by('-multas_pendientes')
-        
-        return [
-            {
-                'username': usuario.username,
-                'multas_pendientes': float(usuario.multas_pendientes)
-            }
-            for usuario in usuarios_con_multas
-        ]
-    
-    def obtener_prestamos_vencidos(self):
-        """Obtiene préstamos vencidos"""
-        # 1. Obtener préstamos activos
-        prestamos_activos = Prestamo.objects.filter(estado='activo')
-
-        # 2. Filtrar vencidos manualmente
-        prestamos_vencidos = []
-        fecha_actual = timezone.now()
-
-        for prestamo in prestamos_activos:
-            # Verificar si está vencido
-            if prestamo.fecha_devolucion_esperada < fecha_actual:
-                # Calcular días de retraso
-                dias_retraso = (fecha_actual.date() - prestamo.fecha_devolucion_esperada.date()).days
-                
-                prestamos_vencidos.append({
-                    'prestamo': prestamo,
-                    'dias_retraso': dias_retraso
-                })
-        
-        return [ # despues de obtener los prestamos vencidos, se retorna un diccionario que contiene el usuario, el libro y los dias de retraso
-            {
-                'usuario': prestamo['prestamo'].usuario.username, #con el punto se accede a los atributos del usuario
-                'libro': prestamo['prestamo'].ejemplar.libro.titulo,
-                'dias_retraso': prestamo['dias_retraso']
-                # .days es para obtener los dias de retraso
-            }
-            for prestamo in prestamos_vencidos
-        ]
-    
-    def obtener_estadisticas_generales(self):
-        """Obtiene estadísticas generales del sistema"""
-        return {
-            'total_libros': Libro.objects.filter(activo=True).count(),#se esta contando los libros que estan activos y se guardan en total_libros 
-            'total_usuarios': Usuario.objects.count(),#se esta contando los usuarios y se guardan en total_usuarios
-            'prestamos_activos': Prestamo.objects.filter(estado='activo').count(),#se esta contando los prestamos que estan activos y se guardan en prestamos_activos
-            'reservas_activas': Reserva.objects.filter(estado='activa').count(),#se esta contando las reservas que estan activas y se guardan en reservas_activas
-            'ejemplares_disponibles': Ejemplar.objects.filter(estado='disponible').count()
-        }
+        tipo = request.data.get('tipo')
+        parametros = request.data.get('parametros') or {}
+        if not isinstance(parametros, dict):
+            return Response("parametros debe ser un objeto", status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            parametros = limpiar_parametros(tipo, parametros)
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        
+        trabajo = encolar_reporte(tipo, parametros, request.user)
+        
+        # 200 si el resultado ya está listo, 202 si hay que esperar y consultar de nuevo
+        codigo = status.HTTP_200_OK if trabajo.estado == 'completado' else status.HTTP_202_ACCEPTED
+        return Response(TrabajoReporteSerializer(trabajo).data, status=codigo)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def trabajo_reporte_api(request, trabajo_id):
+    """Consultar estado y resultado de un trabajo de reporte"""
+    if request.user.rol not in ['bibliotecario', 'administrador']:
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        trabajo = TrabajoReporte.objects.get(id=trabajo_id)
+    except TrabajoReporte.DoesNotExist:
+        return Response("Trabajo no encontrado o vencido", status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(TrabajoReporteSerializer(trabajo).data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metricas_cache_api(request):
+    """Aciertos y fallos de la caché de reportes y estadísticas"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    return Response(metricas_resultados(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metricas_cache_objetos_api(request):
+    """Aciertos de la caché de objetos (L1 del proceso que responde y L2 compartida)"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    return Response(metricas_objetos(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def perfiles_api(request):
+    """Perfiles de peticiones guardados por PerfiladoMiddleware en el servidor que responde"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    return Response({
+        'muestreo': settings.PERFILADO_MUESTREO,
+        'perfiles': perfilado.listar_perfiles()
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def firma_perfilado_api(request):
+    """Valor de la cabecera X-Perfilar para perfilar las peticiones que la envíen"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    return Response({
+        'cabecera': 'X-Perfilar',
+        'valor': perfilado.firmar_perfilado(request.user.id),
+        'vigencia_segundos': settings.PERFILADO_FIRMA_VIGENCIA
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def perfil_api(request, perfil_id):
+    """Detalle de un perfil; con ?descargar=cprofile o ?descargar=memoria devuelve el archivo"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    tipo = request.GET.get('descargar')
+    archivo = perfilado.archivo_perfil(perfil_id, tipo or 'json')
+    if archivo is None:
+        return Response("Perfil no encontrado", status=status.HTTP_404_NOT_FOUND)
+    if tipo:
+        return FileResponse(archivo.open('rb'), as_attachment=True, filename=archivo.name)
+    return Response(json.loads(archivo.read_text()), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def consultas_lentas_api(request):
+    """
+    Huellas SQL con más costo en las últimas ?horas= (24), de todos los procesos.
+    ?orden= tiempo_total, promedio, p95, cantidad o lentas; ?limite= (20); ?vista= nombre de URL
+    """
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    orden = request.GET.get('orden', 'tiempo_total')
+    if orden not in consultas_lentas.ORDENES:
+        return Response(f"orden debe ser uno de: {', '.join(consultas_lentas.ORDENES)}", status=status.HTTP_400_BAD_REQUEST)
+    try:
+        horas = int(request.GET.get('horas', 24))
+        limite = min(int(request.GET.get('limite', 20)), 200)
+    except ValueError:
+        return Response("horas y limite deben ser números", status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'horas': horas,
+        'orden': orden,
+        'umbral_lenta_ms': settings.CONSULTAS_LENTAS_UMBRAL_MS,
+        'consultas': consultas_lentas.ranking(horas, orden, limite, request.GET.get('vista'))
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analitica_api(request):
+    """Estadísticas agrupadas calculadas sobre el snapshot NumPy del historial de préstamos"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    snapshot = analitica.cargar_snapshot()
+    if snapshot is None:
+        return Response("No hay snapshot, ejecute python manage.py snapshot_prestamos", status=status.HTTP_404_NOT_FOUND)
+    
+    consulta = request.GET.get('consulta', 'duraciones') #duraciones, multas o utilizacion
+    try:
+        fechas = {}
+        for nombre in ('desde', 'hasta'): #formato AAAA-MM-DD
+            texto = request.GET.get(nombre, '')
+            fechas[nombre] = parse_date(texto) if texto else None
+            if texto and fechas[nombre] is None:
+                raise ValueError(f'{nombre} inválida, use AAAA-MM-DD')
+        desde, hasta = fechas['desde'], fechas['hasta']
+        if consulta == 'duraciones':
+            percentiles = [float(p) for p in request.GET.get('percentiles', '50,75,90,99').split(',')]
+            if any(p < 0 or p > 100 for p in percentiles):
+                raise ValueError('los percentiles van de 0 a 100')
+            resultado = analitica.duraciones_por_genero(snapshot, percentiles, desde, hasta)
+        elif consulta == 'multas':
+            cubetas = min(max(int(request.GET.get('cubetas', 10)), 1), 100)
+            resultado = analitica.distribucion_multas(snapshot, cubetas, desde, hasta)
+        elif consulta == 'utilizacion':
+            hasta = hasta or timezone.now().date()
+            desde = desde or hasta - timedelta(days=29) #por defecto los últimos 30 días
+            resultado = analitica.utilizacion_sucursales(snapshot, desde, hasta)
+        else:
+            return Response("Consulta desconocida. Opciones: duraciones, multas, utilizacion", status=status.HTTP_400_BAD_REQUEST)
+    except ValueError as error:
+        return Response(f"Parámetro inválido: {error}", status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'snapshot': snapshot.descripcion(),
+        'consulta': consulta,
+        'resultado': resultado
+    }, status=status.HTTP_200_OK)
 
 # ============================================================================
 # FUNCIONES AUXILIARES
 # ============================================================================
 
+def calcular_tablero_usuario(usuario_id):
+    """Datos del tablero con tres consultas: usuario con conteo de préstamos, préstamos activos y reservas activas"""
+    perfil = Usuario.objects.filter(id=usuario_id).annotate(
+        cantidad_prestamos_activos=Count('prestamos', filter=Q(prestamos__estado='activo'))
+    ).values(
+        'id', 'username', 'email', 'first_name', 'last_name', 'telefono', 'rol',
+        'multas_pendientes', 'suspendido', 'date_joined', 'cantidad_prestamos_activos'
+    ).get()
+    
+    prestamos = list(Prestamo.objects.filter(usuario_id=usuario_id, estado='activo').order_by('fecha_devolucion_esperada').values(
+        'id', 'fecha_prestamo', 'fecha_devolucion_esperada',
+        libro_id=F('ejemplar__libro_id'), libro_titulo=F('ejemplar__libro__titulo'),
+        libro_autor=F('ejemplar__libro__autor'), sucursal_nombre=F('ejemplar__sucursal__nombre')
+    ))
+    reservas = list(Reserva.objects.filter(usuario_id=usuario_id, estado='activa').order_by('fecha_reserva').values(
+        'id', 'posicion_cola', 'fecha_reserva', 'fecha_expiracion',
+        libro_titulo=F('libro__titulo'), libro_autor=F('libro__autor')
+    ))
+    
+    # Las mismas reglas que Usuario.puede_pedir_prestamo y puede_hacer_reserva, sin volver a consultar
+    puede_reservar = not perfil['suspendido'] and perfil['multas_pendientes'] <= 0
+    return {
+        'perfil': perfil,
+        'multas_pendientes': perfil['multas_pendientes'],
+        'puede_pedir_prestamos': puede_reservar and perfil['cantidad_prestamos_activos'] < Usuario.MAXIMO_PRESTAMOS_ACTIVOS,
+        'puede_hacer_reservas': puede_reservar,
+        'prestamos_activos': prestamos,
+        'reservas_activas': reservas,
+    }
+
+def obtener_tablero_usuario(usuario_id):
+    """Tablero desde la caché; lo que depende de la hora se calcula en cada llamada, no se guarda"""
+    tablero = obtener_o_calcular(
+        'tablero_usuario', {}, lambda: calcular_tablero_usuario(usuario_id),
+        alcance=alcance_usuario(usuario_id) #se invalida solo con cambios de este usuario
+    )
+    ahora = timezone.now()
+    prestamos = [
+        {**prestamo,
+         'vencido': prestamo['fecha_devolucion_esperada'] < ahora,
+         'dias_restantes': (prestamo['fecha_devolucion_esperada'].date() - ahora.date()).days}
+        for prestamo in tablero['prestamos_activos']
+    ]
+    return {**tablero, 'prestamos_activos': prestamos}
+
 def procesar_cola_reservas(libro):
     """Procesa la cola de reservas cuando se devuelve un libro"""
     try:
@@ -1079,6 +1358,7 @@ def procesar_cola_reservas(libro):
         
         if primera_reserva: #esta linea se lee asi ; si primera_reserva es true, se ejecuta el codigo que esta dentro de la linea
             primera_reserva.estado = 'cumplida' 
+            primera_reserva.fecha_cumplida = timezone.now() #se usa en los reportes de circulación
             primera_reserva.save()
             
             # Reorganizar cola
@@ -1099,24 +1379,137 @@ def procesar_cola_reservas(libro):
 def pagar_multa_api(request): #se esta definiendo una vista que se llama pagar_multa_api, que es una vista que se encarga de pagar multas pendientes
     """Pagar multas pendientes"""
     try:
-        usuario = request.user
-        monto = float(request.data.get('monto', 0)) # esta linea es para obtener el monto de la multa, request.data.get('monto', 0) es para obtener el monto de la multa, 0 es el valor por defecto
-        # se le dice que todo lo que esta en () es como una plantilla para el monto
-        if monto <= 0: 
-            return Response("El monto debe ser mayor a 0", status=status.HTTP_400_BAD_REQUEST)
-        
-        if monto > usuario.multas_pendientes: # si el monto es mayor a las multas pendientes, se retorna un error
-            return Response("El monto excede las multas pendientes", status=status.HTTP_400_BAD_REQUEST)
-        
-        usuario.multas_pendientes -= monto # se le resta el monto a las multas pendientes
-        usuario.save() 
-        
-        return Response({
-            'mensaje': 'Multa pagada exitosamente',
-            'monto_pagado': monto,
-            'multas_restantes': float(usuario.multas_pendientes)
-        }, status=status.HTTP_200_OK)
+        # El monto se valida y se descuenta en un solo UPDATE, dos pagos simultáneos no pueden dejar saldo negativo
+        movimiento = MovimientoMulta.registrar(
+            request.user.id, 'pago', request.data.get('monto', 0),
+            registrado_por=request.user, referencia=request.data.get('referencia', '')
+        )
+    except ValueError as error: # monto inválido, menor o igual a 0 o mayor a las multas pendientes
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
     except:
         return Response("ERROR al procesar pago", status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'mensaje': 'Multa pagada exitosamente',
+        'monto_pagado': float(movimiento.monto),
+        'multas_restantes': float(movimiento.saldo_resultante)
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estado_cuenta_multas_api(request):
+    """Estado de cuenta de multas: saldo inicial, movimientos del período y saldo final"""
+    usuario_id = request.user.id
+    if request.GET.get('usuario'): # bibliotecarios y administradores pueden consultar a otro usuario
+        if request.user.rol not in ['bibliotecario', 'administrador']:
+            return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+        usuario_id = request.GET['usuario']
+    
+    try:
+        fechas = {}
+        for nombre in ('desde', 'hasta'): #formato AAAA-MM-DD
+            texto = request.GET.get(nombre, '')
+            fechas[nombre] = parse_date(texto) if texto else None
+            if texto and fechas[nombre] is None:
+                raise ValueError(f'{nombre} inválida, use AAAA-MM-DD')
+        usuario = Usuario.objects.only('id', 'username', 'multas_pendientes').get(id=int(usuario_id))
+    except Usuario.DoesNotExist:
+        return Response("Usuario no encontrado", status=status.HTTP_404_NOT_FOUND)
+    except ValueError as error:
+        return Response(f"Parámetro inválido: {error}", status=status.HTTP_400_BAD_REQUEST)
+    
+    estado_cuenta = MovimientoMulta.estado_de_cuenta(usuario.id, fechas['desde'], fechas['hasta'])
+    return Response({
+        'usuario': usuario.username,
+        'multas_pendientes': usuario.multas_pendientes,
+        **estado_cuenta
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def pagos_lote_multas_api(request):
+    """Registrar pagos de caja en lote: {"pagos": [{"usuario": 1, "monto": "1000.00", "referencia": "R-1"}]}"""
+    if request.user.rol not in ['bibliotecario', 'administrador']:
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    pagos = request.data.get('pagos')
+    if not isinstance(pagos, list) or not pagos or not all(isinstance(pago, dict) for pago in pagos):
+        return Response("Debe enviar una lista 'pagos' con usuario, monto y referencia", status=status.HTTP_400_BAD_REQUEST)
+    if len(pagos) > 1000:
+        return Response("Máximo 1000 pagos por lote", status=status.HTTP_400_BAD_REQUEST)
+    
+    resultados = MovimientoMulta.pagar_en_lote(pagos, registrado_por=request.user)
+    return Response({
+        'registrados': sum(1 for resultado in resultados if resultado['estado'] == 'registrado'),
+        'resultados': resultados
+    }, status=status.HTTP_200_OK)
 
-     
\ No newline at end of file
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def condonar_multa_api(request):
+    """Condonar (perdonar) parte o todo el saldo de multas de un usuario"""
+    if request.user.rol != 'administrador':
+        return Response("Sin permisos", status=status.HTTP_403_FORBIDDEN)
+    
+    if not request.data.get('motivo'):
+        return Response("Debe indicar el motivo", status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        movimiento = MovimientoMulta.registrar(
+            int(request.data.get('usuario')), 'condonacion', request.data.get('monto', 0),
+            registrado_por=request.user, referencia=request.data['motivo'][:100]
+        )
+    except (ValueError, TypeError) as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'mensaje': 'Multa condonada',
+        'multas_restantes': float(movimiento.saldo_resultante)
+    }, status=status.HTTP_200_OK)
+
+     
+
+# ============================================================================
+# PETICIONES EN LOTE
+# ============================================================================
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def lote_api(request):
+    """
+    Varias peticiones a la API en una sola llamada y con una sola autenticación:
+    {"peticiones": [{"id": "d1", "metodo": "GET", "ruta": "/api/libros/3/disponibilidad/"}], "concurrente": true}
+    """
+    try:
+        peticiones = lote.validar(request.data.get('peticiones'))
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'respuestas': lote.ejecutar_lote(request, peticiones, concurrente=bool(request.data.get('concurrente')))
+    }, status=status.HTTP_200_OK)
+
+# ============================================================================
+# FEED DE CAMBIOS
+# ============================================================================
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def cambios_api(request):
+    """
+    Cambios de libros, sucursales, ejemplares, préstamos y reservas desde un cursor: ?desde=<cursor>&limite=500&modelos=libro,ejemplar
+    Los usuarios reciben el catálogo y sus propios préstamos y reservas.
+    """
+    try:
+        desde = int(request.GET.get('desde', 0))
+        limite = int(request.GET.get('limite', settings.CAMBIOS_LIMITE))
+        if desde < 0 or limite < 1:
+            raise ValueError
+    except ValueError:
+        return Response("desde debe ser un cursor (entero desde 0) y limite un entero positivo", status=status.HTTP_400_BAD_REQUEST)
+    
+    modelos = [modelo.strip() for modelo in request.GET.get('modelos', '').split(',') if modelo.strip()]
+    try:
+        return Response(cambios.leer(request.user, desde, limite, modelos), status=status.HTTP_200_OK)
+    except ValueError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
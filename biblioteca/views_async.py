@@ -0,0 +1,231 @@
+# VISTAS ASÍNCRONAS (ASGI) DE SOLO LECTURA PARA LOS ENDPOINTS CON MÁS CONCURRENCIA
+#
+# Responden lo mismo que sus equivalentes DRF de views.py, pero con el ORM asíncrono de Django: servidas
+# con bossback.asgi (uvicorn, daphne) una petición que espera a MySQL no ocupa un hilo del worker.
+# DRF 3.14 no tiene vistas async, así que la autenticación JWT y el formato JSON se hacen aquí con sus clases.
+# Las rutas están en urls_async.py, bajo /api/async/.
+
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Count
+from django.http import HttpResponse
+from rest_framework import exceptions, serializers
+from .renderers import JSONRapidoRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .autenticacion import JWTAutenticacionCacheada
+from .models import Usuario, Libro, Ejemplar, Reserva
+from .replicas import lectura_replica
+from .serializers import LibroValoresSerializer
+from .views import obtener_tablero_usuario
+
+_autenticador = JWTAutenticacionCacheada()
+_renderer = JSONRapidoRenderer()
+_fecha = serializers.DateTimeField() #mismo formato de fechas que los serializers
+CAMPOS_LIBRO = ['id', 'titulo', 'autor', 'isbn', 'genero', 'año_publicacion', 'descripcion', 'activo'] #LibroSerializer
+
+
+def respuesta(datos, status=200):
+    return HttpResponse(_renderer.render(datos), status=status, content_type='application/json')
+
+
+def api_async(vista):
+    """Equivalente a @api_view(['GET']) + @permission_classes([IsAuthenticated]) para una vista async"""
+    @functools.wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        if request.method != 'GET':
+            return respuesta({'detail': exceptions.MethodNotAllowed(request.method).detail}, status=405)
+        try:
+            autenticado = await sync_to_async(_autenticador.authenticate)(request) #puede leer el usuario de la base
+            if autenticado is None:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as error: #mismo cuerpo que el manejador de excepciones de DRF
+            response = respuesta(error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}, status=401)
+            response['WWW-Authenticate'] = _autenticador.authenticate_header(request)
+            return response
+        request.user = autenticado[0]
+        return await vista(request, *args, **kwargs)
+    return envoltura
+
+
+def _seleccion_libros(request):
+    """Columnas de CAMPOS_LIBRO pedidas con ?fields= (id siempre, lo usa _con_disponibles) y si van los disponibles"""
+    campos = LibroValoresSerializer.seleccion_pedida(request.GET)['campos'] #ValueError si piden un campo que no existe
+    if campos is None:
+        return CAMPOS_LIBRO, None, True
+    return ['id'] + [campo for campo in CAMPOS_LIBRO if campo in campos and campo != 'id'], campos, 'ejemplares_disponibles' in campos
+
+
+async def _completar(libros, campos, disponibles):
+    """Agrega los disponibles si se pidieron y quita el id si no se pidió"""
+    if disponibles:
+        await _con_disponibles(libros)
+    if campos is not None and 'id' not in campos:
+        for libro in libros:
+            del libro['id']
+    return libros
+
+
+async def _con_disponibles(libros):
+    """Agrega ejemplares_disponibles a cada libro con una sola consulta agrupada"""
+    disponibles = {
+        fila['libro_id']: fila['cantidad']
+        async for fila in Ejemplar.objects.filter(
+            libro_id__in=[libro['id'] for libro in libros], estado='disponible'
+        ).values('libro_id').annotate(cantidad=Count('id'))
+    }
+    for libro in libros:
+        libro['ejemplares_disponibles'] = disponibles.get(libro['id'], 0)
+    return libros
+
+
+@api_async
+@lectura_replica
+async def libros_async(request):
+    """Catálogo de libros activos paginado, igual que GET /api/libros/ (también con ?fields=)"""
+    try:
+        columnas, campos, disponibles = _seleccion_libros(request)
+    except ValueError as error:
+        return respuesta(str(error), status=400)
+    libros = Libro.objects.filter(activo=True)
+    paginador = Paginator(range(await libros.acount()), settings.REST_FRAMEWORK['PAGE_SIZE'])
+    numero = request.GET.get('page', 1)
+    try:
+        pagina = paginador.page(paginador.num_pages if numero == 'last' else numero)
+    except InvalidPage:
+        return respuesta({'detail': 'Página inválida.'}, status=404)
+
+    desde = pagina.start_index() - 1 if paginador.count else 0
+    resultados = [libro async for libro in libros.values(*columnas)[desde:desde + len(pagina.object_list)]]
+
+    url = request.build_absolute_uri()
+    anterior = None
+    if pagina.has_previous():
+        anterior = remove_query_param(url, 'page') if pagina.previous_page_number() == 1 \
+            else replace_query_param(url, 'page', pagina.previous_page_number())
+    return respuesta({
+        'count': paginador.count,
+        'next': replace_query_param(url, 'page', pagina.next_page_number()) if pagina.has_next() else None,
+        'previous': anterior,
+        'results': await _completar(resultados, campos, disponibles),
+    })
+
+
+@api_async
+@lectura_replica
+async def buscar_libros_async(request):
+    """Búsqueda de libros con los mismos filtros que GET /api/libros/buscar/ (también con ?fields=)"""
+    try:
+        columnas, campos, disponibles = _seleccion_libros(request)
+    except ValueError as error:
+        return respuesta(str(error), status=400)
+    query = request.GET.get('q', '')
+    genero = request.GET.get('genero', '')
+    autor = request.GET.get('autor', '')
+    disponible = request.GET.get('disponible', '')
+    sucursal = request.GET.get('sucursal', '')
+
+    libros = Libro.objects.filter(activo=True)
+    if query:
+        libros = libros.filter(titulo__icontains=query)
+    if genero:
+        libros = libros.filter(genero__icontains=genero)
+    if autor:
+        libros = libros.filter(autor__icontains=autor)
+    if disponible and disponible.lower() == 'true':
+        libros = libros.filter(ejemplares__estado='disponible').distinct()
+    if sucursal:
+        try:
+            libros = libros.filter(ejemplares__sucursal__id=int(sucursal)).distinct()
+        except ValueError:
+            libros = libros.filter(ejemplares__sucursal__nombre__icontains=sucursal).distinct()
+
+    try:
+        resultados = [libro async for libro in libros.values(*columnas)]
+        return respuesta({
+            'total_resultados': len(resultados),
+            'filtros_aplicados': {
+                'busqueda_general': query,
+                'genero': genero,
+                'autor': autor,
+                'disponible': disponible,
+                'sucursal': sucursal
+            },
+            'libros': await _completar(resultados, campos, disponibles)
+        })
+    except:
+        return respuesta("ERROR en búsqueda", status=400)
+
+
+@api_async
+@lectura_replica
+async def disponibilidad_libro_async(request, libro_id):
+    """Ejemplares disponibles por sucursal, igual que GET /api/libros/<id>/disponibilidad/"""
+    libro = await Libro.objects.filter(id=libro_id, activo=True).values('id', 'titulo', 'autor').afirst()
+    if libro is None:
+        return respuesta("Libro no encontrado", status=404)
+
+    disponibilidad = [
+        {
+            'sucursal_id': item['sucursal__id'],
+            'sucursal_nombre': item['sucursal__nombre'],
+            'cantidad_disponible': item['cantidad_disponible']
+        }
+        async for item in Ejemplar.objects.filter(libro_id=libro_id, estado='disponible').values(
+            'sucursal__nombre', 'sucursal__id'
+        ).annotate(cantidad_disponible=Count('id'))
+    ]
+    return respuesta({
+        'libro': libro,
+        'disponibilidad_por_sucursal': disponibilidad,
+        'total_disponible': sum(item['cantidad_disponible'] for item in disponibilidad)
+    })
+
+
+@api_async
+async def cola_reservas_async(request, libro_id):
+    """Cola de reservas activas de un libro, igual que GET /api/reservas/cola/<id>/"""
+    libro = await Libro.objects.filter(id=libro_id).afirst()
+    if libro is None:
+        return respuesta("Libro no encontrado", status=404)
+
+    reservas = [reserva async for reserva in Reserva.objects.filter(libro_id=libro_id, estado='activa').order_by(
+        'posicion_cola'
+    ).values('id', 'usuario_id', 'fecha_reserva', 'fecha_expiracion', 'estado', 'posicion_cola', 'usuario__username')]
+    fechas = await sync_to_async(libro.estimar_disponibilidad)(len(reservas))
+
+    return respuesta({
+        'libro': libro.titulo,
+        'total_reservas': len(reservas),
+        'cola': [
+            { #mismos campos y orden que ReservaSerializer
+                'id': reserva['id'],
+                'usuario': reserva['usuario_id'],
+                'libro': libro.id,
+                'fecha_reserva': _fecha.to_representation(reserva['fecha_reserva']),
+                'fecha_expiracion': _fecha.to_representation(reserva['fecha_expiracion']),
+                'estado': reserva['estado'],
+                'posicion_cola': reserva['posicion_cola'],
+                'usuario_username': reserva['usuario__username'],
+                'libro_titulo': libro.titulo,
+                'libro_autor': libro.autor,
+                'fecha_estimada_disponibilidad': fecha,
+            }
+            for reserva, fecha in zip(reservas, fechas)
+        ]
+    })
+
+
+@api_async
+async def tablero_usuario_async(request):
+    """Tablero del usuario, igual que GET /api/usuarios/tablero/ (desde la caché por usuario)"""
+    try:
+        tablero = await sync_to_async(obtener_tablero_usuario)(request.user.id)
+    except Usuario.DoesNotExist:
+        return respuesta("Usuario no encontrado", status=404)
+    except:
+        return respuesta("ERROR al obtener tablero", status=400)
+    return respuesta(tablero)
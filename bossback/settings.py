@@ -1,6 +1,6 @@
 from pathlib import Path #esto es para que se pueda usar el path en el proyecto,ayuda en casos como el de la base de datos, que se usa para buscar el archivo .env
 from datetime import timedelta #esto es para que se pueda usar el tiempo en el proyecto
-from decouple import config #esto es para que se pueda usar el archivo .env en el proyecto
+from decouple import config, Csv #esto es para que se pueda usar el archivo .env en el proyecto
 import pymysql #esto es para que se pueda usar la base de datos en el proyecto
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,12 +39,17 @@ INSTALLED_APPS = [ #esto es para instalar las aplicaciones que se van a usar en
 
 MIDDLEWARE = [ #esto es para que se pueda usar la aplicación en el proyecto
     'django.middleware.security.SecurityMiddleware',
+    'biblioteca.compresion.CompresionMiddleware', #gzip de respuestas grandes; antes que el resto para comprimir la respuesta final
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'biblioteca.consultas_lentas.ConsultasLentasMiddleware', #vista de cada consulta para las estadísticas; vuelca fuera del estado de réplicas
+    'biblioteca.replicas.ReplicaMiddleware', #lecturas en réplicas y lectura de las propias escrituras
+    'biblioteca.instrumentacion.InstrumentacionMiddleware', #cabeceras X-Consultas, X-Tiempo-BD-ms... si INSTRUMENTACION_ACTIVA
+    'biblioteca.perfilado.PerfiladoMiddleware', #cProfile y tracemalloc por muestreo o con X-Perfilar firmada (solo WSGI)
 ]
 
 ROOT_URLCONF = 'bossback.urls'
@@ -73,7 +78,7 @@ WSGI_APPLICATION = 'bossback.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': config('DB_ENGINE', default='django.db.backends.mysql'),
+        'ENGINE': config('DB_ENGINE', default='django.db.backends.mysql'), #biblioteca.backends.mysql para usar el pool de conexiones
         'NAME': config('DB_NAME', default='bibliotek'),
         'USER': config('DB_USER', default='root'),
         'PASSWORD': config('DB_PASSWORD', default=''),
@@ -83,10 +88,28 @@ DATABASES = {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'", #esto es para que no se guarden datos en la base de datos si no se cumplen las reglas de la base de datos
             'charset': 'utf8mb4', #esto es para que se guarden los datos en la base de datos en utf8mb4, que es el formato de la base de datos
         },
+        # Pool de conexiones por proceso, solo con ENGINE biblioteca.backends.* (ver biblioteca/backends/pool.py)
+        'POOL': {
+            'CONEXIONES': config('DB_POOL_CONEXIONES', default=5, cast=int), #por worker de gunicorn
+            'DESBORDE': config('DB_POOL_DESBORDE', default=5, cast=int),
+            'VIDA_MAXIMA': config('DB_POOL_VIDA_MAXIMA', default=1800, cast=int), #menor que wait_timeout de MySQL
+            'VERIFICAR_INACTIVAS': config('DB_POOL_VERIFICAR_INACTIVAS', default=30, cast=int),
+            'ESPERA': config('DB_POOL_ESPERA', default=10, cast=int),
+        },
     }
 }
 
 
+# Réplicas de solo lectura (biblioteca/replicas.py): hosts separados por coma, mismo usuario, clave y base que default
+for numero, host in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{numero}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+REPLICAS_BD = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['biblioteca.replicas.ReplicaRouter']
+REPLICAS_LAG_MAXIMO = config('REPLICAS_LAG_MAXIMO', default=5, cast=int) #segundos de retraso tolerados
+REPLICAS_LECTURA_PROPIA = config('REPLICAS_LECTURA_PROPIA', default=10, cast=int) #segundos que un usuario lee del primario tras escribir
+REPLICAS_VERIFICAR_CADA = config('REPLICAS_VERIFICAR_CADA', default=5, cast=int) #segundos entre revisiones de cada réplica
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -131,15 +154,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework configuration
 REST_FRAMEWORK = { #esto es para que se pueda usar el framework en el proyecto
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'biblioteca.autenticacion.JWTAutenticacionCacheada', #JWTAuthentication sin consultar el usuario en cada petición
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    'DEFAULT_RENDERER_CLASSES': [
+        'biblioteca.renderers.JSONRapidoRenderer', #mismo JSON que el de DRF, codificado con orjson si está instalado
+    ],
 }
 
+# API navegable de DRF (HTML) solo en desarrollo: en producción solo JSON
+API_NAVEGABLE = config('API_NAVEGABLE', default=DEBUG, cast=bool)
+if API_NAVEGABLE:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
+
+# Respuestas comprimidas con gzip a partir de este tamaño en bytes (biblioteca/compresion.py)
+COMPRESION_MINIMO = config('COMPRESION_MINIMO', default=1024, cast=int)
+
 # JWT configuration
 SIMPLE_JWT = { #esto es para que se pueda usar el token en el proyecto
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),
@@ -147,7 +181,64 @@ SIMPLE_JWT = { #esto es para que se pueda usar el token en el proyecto
     'ROTATE_REFRESH_TOKENS': True,
 }
 
+# Usuarios autenticados guardados en memoria (biblioteca/autenticacion.py); su versión vive en CACHES
+AUTENTICACION_CACHE_TTL = config('AUTENTICACION_CACHE_TTL', default=60, cast=int) #segundos
+AUTENTICACION_CACHE_MAXIMO = config('AUTENTICACION_CACHE_MAXIMO', default=5000, cast=int) #usuarios por proceso
+
+# Caché de objetos por clave primaria (Libro, Sucursal): L1 en cada proceso y L2 en CACHES
+OBJETOS_CACHE_L1_MAXIMO = config('OBJETOS_CACHE_L1_MAXIMO', default=2000, cast=int) #objetos por proceso
+OBJETOS_CACHE_L1_TTL = config('OBJETOS_CACHE_L1_TTL', default=5, cast=int) #segundos sin revisar la versión en L2
+OBJETOS_CACHE_L2_TTL = config('OBJETOS_CACHE_L2_TTL', default=3600, cast=int)
+
+# Peticiones en lote (POST /api/batch/, biblioteca/lote.py)
+LOTE_MAXIMO = config('LOTE_MAXIMO', default=50, cast=int) #subpeticiones por lote
+LOTE_HILOS = config('LOTE_HILOS', default=4, cast=int) #GET ejecutados a la vez con "concurrente"; cada hilo usa una conexión
+
+# Feed de cambios para sincronizar clientes (GET /api/cambios/, biblioteca/cambios.py)
+CAMBIOS_LIMITE = config('CAMBIOS_LIMITE', default=500, cast=int) #entradas máximas por respuesta
+CAMBIOS_MARGEN = config('CAMBIOS_MARGEN', default=2, cast=int) #segundos antes de mostrar una entrada (commits fuera de orden)
+
+# Importación masiva de usuarios: procesos que encriptan contraseñas (0 = todas las CPU)
+IMPORTACION_PROCESOS = config('IMPORTACION_PROCESOS', default=0, cast=int)
+
 # Custom user model esto es para que se pueda usar el usuario en el proyecto
 AUTH_USER_MODEL = 'biblioteca.Usuario'
 
+# Caché compartida entre procesos (por defecto en memoria local; en producción usar Redis o Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='bibliotek'),
+    }
+}
 
+# Caché de reportes y estadísticas (biblioteca/cache.py)
+RESULTADOS_CACHE_TTL = config('RESULTADOS_CACHE_TTL', default=300, cast=int) #antigüedad máxima de un resultado en segundos
+RESULTADOS_CACHE_TTL_AGREGADOS = config('RESULTADOS_CACHE_TTL_AGREGADOS', default=60, cast=int) #rankings y totales: vencen por tiempo, no con cada préstamo
+RESULTADOS_CACHE_INVALIDAR = config('RESULTADOS_CACHE_INVALIDAR', default=True, cast=bool) #False = solo vence por tiempo, no al modificar datos
+RESULTADOS_CACHE_ESPERA = config('RESULTADOS_CACHE_ESPERA', default=30, cast=int) #segundos que se espera a que otro proceso termine el cálculo
+
+# Reportes en segundo plano (comando procesar_reportes)
+REPORTES_TTL = config('REPORTES_TTL', default=600, cast=int) #segundos que se conserva y reutiliza un resultado
+REPORTES_TIEMPO_MAXIMO = config('REPORTES_TIEMPO_MAXIMO', default=900, cast=int) #segundos tras los cuales un trabajo en proceso se considera abandonado
+
+# Analítica sobre snapshots NumPy del historial de préstamos (comando snapshot_prestamos)
+ANALITICA_DIR = config('ANALITICA_DIR', default=str(BASE_DIR / 'analitica'))
+ANALITICA_SEGMENTO_FILAS = config('ANALITICA_SEGMENTO_FILAS', default=1000000, cast=int) #préstamos por segmento; solo se reescriben los que tienen préstamos abiertos
+
+# Instrumentación por petición (biblioteca/instrumentacion.py): consultas, tiempo de BD y serialización en cabeceras
+INSTRUMENTACION_ACTIVA = config('INSTRUMENTACION_ACTIVA', default=DEBUG, cast=bool)
+
+# Perfilado de peticiones bajo demanda (biblioteca/perfilado.py), consulta en /api/reportes/perfiles/
+PERFILADO_MUESTREO = config('PERFILADO_MUESTREO', default=0.0, cast=float) #fracción de peticiones perfiladas (0 = solo con X-Perfilar)
+PERFILADO_DIR = config('PERFILADO_DIR', default=str(BASE_DIR / 'perfiles'))
+PERFILADO_MAXIMO = config('PERFILADO_MAXIMO', default=100, cast=int) #perfiles que se conservan, se borran los más antiguos
+PERFILADO_MEMORIA = config('PERFILADO_MEMORIA', default=True, cast=bool) #snapshot de tracemalloc además de cProfile
+PERFILADO_MARCOS = config('PERFILADO_MARCOS', default=10, cast=int) #marcos de pila guardados por reserva de memoria
+PERFILADO_FIRMA_VIGENCIA = config('PERFILADO_FIRMA_VIGENCIA', default=3600, cast=int) #segundos que vale una firma de X-Perfilar
+
+# Estadísticas de consultas SQL por huella y registro de consultas lentas (biblioteca/consultas_lentas.py), en /api/reportes/consultas/
+CONSULTAS_ESTADISTICAS = config('CONSULTAS_ESTADISTICAS', default=True, cast=bool)
+CONSULTAS_LENTAS_UMBRAL_MS = config('CONSULTAS_LENTAS_UMBRAL_MS', default=100, cast=float) #desde cuánto una consulta se registra como lenta
+CONSULTAS_VOLCAR_CADA = config('CONSULTAS_VOLCAR_CADA', default=60, cast=int) #segundos entre volcados a EstadisticaConsulta por proceso
+CONSULTAS_CONSERVAR_DIAS = config('CONSULTAS_CONSERVAR_DIAS', default=30, cast=int)
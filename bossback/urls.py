@@ -4,5 +4,6 @@ from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/async/', include('biblioteca.urls_async')),
     path('api/', include('biblioteca.urls')),
 ]